@@ -1,3 +1,12 @@
-from .imagetoasciiart import ImageToDetailedASCIIArtInvocation
-from .i2aa_anyfont import ImageToAAInvocation
-from .imagetounicodeart import ImageToUnicodeArtInvocation
\ No newline at end of file
+from importlib.util import find_spec
+
+# The nodes need InvokeAI; the conversion core (core.py) and the command line
+# (python -m <this folder>) work without it.
+if find_spec("invokeai") is not None:
+    from .imagetoasciiart import ImageToDetailedASCIIArtInvocation
+    from .i2aa_anyfont import (
+        ImageToAAInvocation,
+        ImageToAABatchInvocation,
+        ImageToAAAnimationInvocation,
+    )
+    from .imagetounicodeart import ImageToUnicodeArtInvocation
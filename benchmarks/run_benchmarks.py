@@ -0,0 +1,391 @@
+"""Standalone benchmarks for the ASCII, Unicode and AnyFont nodes.
+
+Runs every node through invoke() with an in-memory stand-in for the
+InvokeAI InvocationContext, so no InvokeAI install, network access or
+downloaded font is needed. If InvokeAI is not importable a minimal
+stand-in for invokeai.invocation_api is installed first.
+
+    python benchmarks/run_benchmarks.py --quick
+    python benchmarks/run_benchmarks.py --save benchmarks/baseline.json
+    python benchmarks/run_benchmarks.py --compare benchmarks/baseline.json
+
+Each case reports cells/sec, the peak traced allocation, the process peak
+RSS and the time spent loading the input, converting and saving the output,
+followed by the node's own instrumentation phases (glyph rasterizing and
+atlas building, sampling, matching, compositing, ...). The timed runs are
+untraced, the peak allocation comes from one more traced run.
+
+Timings only compare on the same machine, so no baseline is committed:
+save one from the commit before a change, then compare the change with it.
+"""
+
+import argparse
+import importlib.machinery
+import importlib.util
+import io
+import itertools
+import json
+import os
+import platform
+import resource
+import sys
+import tempfile
+import time
+import tracemalloc
+import types
+import uuid
+
+import numpy as np
+from PIL import Image, ImageFont
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PACKAGE_NAME = "imagetoasciiimage"
+
+
+def install_invokeai_stand_in():
+    """Register a minimal invokeai.invocation_api if InvokeAI is not installed."""
+    try:
+        import invokeai.invocation_api  # noqa: F401
+
+        return
+    except ImportError:
+        pass
+
+    class _Field:
+        def __init__(self, default=None, **kwargs):
+            self.default = default
+
+    class BaseInvocation:
+        def __init__(self, **kwargs):
+            for cls in reversed(type(self).__mro__):
+                for name, value in vars(cls).items():
+                    if isinstance(value, _Field):
+                        setattr(self, name, value.default)
+            for name, value in kwargs.items():
+                setattr(self, name, value)
+
+    class BaseInvocationOutput(BaseInvocation):
+        pass
+
+    class ImageField:
+        def __init__(self, image_name=None):
+            self.image_name = image_name
+
+    class ImageOutput(BaseInvocationOutput):
+        @classmethod
+        def build(cls, image_dto):
+            return cls(
+                image=ImageField(image_dto.image_name),
+                width=image_dto.width,
+                height=image_dto.height,
+            )
+
+    class ImageCollectionOutput(BaseInvocationOutput):
+        pass
+
+    class MetadataField(dict):
+        @classmethod
+        def model_validate(cls, value):
+            return cls(value)
+
+    api = types.ModuleType("invokeai.invocation_api")
+    api.BaseInvocation = BaseInvocation
+    api.BaseInvocationOutput = BaseInvocationOutput
+    api.ImageField = ImageField
+    api.ImageOutput = ImageOutput
+    api.ImageCollectionOutput = ImageCollectionOutput
+    api.MetadataField = MetadataField
+    api.InvocationContext = object
+    api.InputField = _Field
+    api.OutputField = _Field
+    api.invocation = lambda *args, **kwargs: (lambda cls: cls)
+    api.invocation_output = lambda *args, **kwargs: (lambda cls: cls)
+
+    package = types.ModuleType("invokeai")
+    package.__spec__ = importlib.machinery.ModuleSpec("invokeai", None)
+    package.invocation_api = api
+    sys.modules["invokeai"] = package
+    sys.modules["invokeai.invocation_api"] = api
+
+
+def import_nodes():
+    """Import the repo as a package, whatever its folder is called."""
+    spec = importlib.util.spec_from_file_location(
+        PACKAGE_NAME,
+        os.path.join(REPO_DIR, "__init__.py"),
+        submodule_search_locations=[REPO_DIR],
+    )
+    package = importlib.util.module_from_spec(spec)
+    sys.modules[PACKAGE_NAME] = package
+    spec.loader.exec_module(package)
+    return package
+
+
+class FakeImageDTO:
+    def __init__(self, image_name, image):
+        self.image_name = image_name
+        self.width, self.height = image.size
+
+
+class FakeImages:
+    """context.images backed by a dict; save() PNG encodes like the real one."""
+
+    def __init__(self):
+        self.store = {}
+        self.save_seconds = 0.0
+        self.saved_bytes = 0
+        self.metadata = None
+
+    def add(self, image):
+        name = f"{uuid.uuid4().hex}.png"
+        self.store[name] = image
+        return name
+
+    def get_pil(self, image_name, mode=None):
+        image = self.store[image_name]
+        return image.convert(mode) if mode else image.copy()
+
+    def save(self, image, metadata=None, **kwargs):
+        self.metadata = metadata
+        start = time.perf_counter()
+        buffer = io.BytesIO()
+        image.save(buffer, format="PNG")
+        self.save_seconds += time.perf_counter() - start
+        self.saved_bytes += buffer.tell()
+        return FakeImageDTO(self.add(image), image)
+
+
+class FakeContext:
+    def __init__(self):
+        self.images = FakeImages()
+
+
+def local_font_file(path=None):
+    """A TTF path that needs no download: the given one or PIL's built in font."""
+    if path:
+        return path
+    font_path = os.path.join(tempfile.gettempdir(), "i2aa_bench_font.ttf")
+    if not os.path.isfile(font_path):
+        data = ImageFont.load_default().path.getvalue()
+        with open(font_path, "wb") as f:
+            f.write(data)
+    return font_path
+
+
+def test_image(size):
+    """Smooth gradients with some edges and noise, like a generated image."""
+    width, height = size
+    y, x = np.mgrid[0:height, 0:width]
+    rng = np.random.default_rng(0)
+    r = 127 + 127 * np.sin(x / 37.0) * np.cos(y / 53.0)
+    g = 255 * x / max(1, width - 1)
+    b = np.where((x // 64 + y // 64) % 2, 200, 40)
+    pixels = np.stack([r, g, b], axis=-1) + rng.normal(0, 8, (height, width, 3))
+    return Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8), "RGB")
+
+
+def node_cases(nodes, font_path, quick):
+    """Yield (case name, node instance, cell size) for every swept setting.
+
+    The result cache is bypassed so repeats time the conversion itself.
+    """
+    font_sizes = [8] if quick else [6, 12]
+    colors = [False] if quick else [False, True]
+
+    ascii_sets = ["Medium Detail"] if quick else ["High Detail", "Medium Detail", "Binary"]
+    for spacing, ascii_set, color in itertools.product(font_sizes, ascii_sets, colors):
+        node = nodes.ImageToDetailedASCIIArtInvocation(
+            font_spacing=spacing, ascii_set=ascii_set, color_mode=color, bypass_cache=True
+        )
+        yield f"ascii/{ascii_set}/fs{spacing}/color={color}", node, spacing
+
+    unicode_sets = ["Shaded"] if quick else ["Shaded", "Extended Shading", "Stars"]
+    for size, unicode_set, color in itertools.product(font_sizes, unicode_sets, colors):
+        node = nodes.ImageToUnicodeArtInvocation(
+            local_font_path=font_path,
+            font_size=size,
+            unicode_set=unicode_set,
+            color_mode=color,
+            bypass_cache=True,
+        )
+        yield f"unicode/{unicode_set}/fs{size}/color={color}", node, size
+
+    sub_cell_modes = ["Quadrants"] if quick else ["Half Blocks", "Quadrants"]
+    for size, sub_cell_mode, color in itertools.product(font_sizes, sub_cell_modes, colors):
+        node = nodes.ImageToUnicodeArtInvocation(
+            local_font_path=font_path,
+            font_size=size,
+            sub_cell_mode=sub_cell_mode,
+            color_mode=color,
+            bypass_cache=True,
+        )
+        yield f"unicode/{sub_cell_mode}/fs{size}/color={color}", node, size
+
+    comparisons = ["NAL", "MSE"] if quick else ["SAD", "MSE", "SSIM", "NAL", "EDGE"]
+    ranges = ["AM"] if quick else ["Ascii", "AH", "AM"]
+    for size, char_range, comparison, color in itertools.product(
+        font_sizes, ranges, comparisons, colors
+    ):
+        node = nodes.ImageToAAInvocation(
+            local_font_path=font_path,
+            font_size=size,
+            character_range=char_range,
+            comparison_type=comparison,
+            color_mode=color,
+            bypass_cache=True,
+        )
+        yield f"anyfont/{comparison}/{char_range}/fs{size}/color={color}", node, size
+
+    adaptive_levels = [2] if quick else [1, 2, 3]
+    for size, levels, color in itertools.product(font_sizes, adaptive_levels, colors):
+        node = nodes.ImageToAAInvocation(
+            local_font_path=font_path,
+            font_size=size,
+            comparison_type="MSE",
+            color_mode=color,
+            adaptive_levels=levels,
+            bypass_cache=True,
+        )
+        yield f"anyfont/adaptive{levels}/MSE/fs{size}/color={color}", node, size
+
+    palettes = [("Off", False)] if quick else [("Off", False), ("Adaptive", True)]
+    for size, (palette, color) in itertools.product(font_sizes, palettes):
+        node = nodes.ImageToAAInvocation(
+            local_font_path=font_path,
+            font_size=size,
+            comparison_type="MSE",
+            color_mode=color,
+            palette=palette,
+            output_mode="Compact",
+            bypass_cache=True,
+        )
+        yield f"anyfont/compact/{palette}/fs{size}/color={color}", node, size
+
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and kilobytes elsewhere
+    return peak / (1 << 20) if sys.platform == "darwin" else peak / 1024
+
+
+def run_case(node, image, cell_size, repeat):
+    context = FakeContext()
+    node.input_image = sys.modules["invokeai.invocation_api"].ImageField(
+        context.images.add(image)
+    )
+    cells = (image.width // cell_size) * (image.height // cell_size)
+
+    timings = []
+    for _ in range(repeat):
+        context.images.save_seconds = 0.0
+        start = time.perf_counter()
+        context.images.get_pil(node.input_image.image_name)
+        loaded = time.perf_counter()
+        node.invoke(context)
+        total = time.perf_counter() - start
+        report = (context.images.metadata or {}).get("i2aa_instrumentation", {})
+        timings.append(
+            dict(
+                total_s=total,
+                load_s=loaded - start,
+                convert_s=total - (loaded - start) - context.images.save_seconds,
+                save_s=context.images.save_seconds,
+                phases=report.get("timings", {}),
+            )
+        )
+
+    # tracemalloc slows every allocation down, so the peak is measured in
+    # a run of its own rather than in the timed ones
+    tracemalloc.start()
+    node.invoke(context)
+    _, traced_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    best = min(timings, key=lambda t: t["total_s"])
+    best["traced_peak_mb"] = traced_peak / (1 << 20)
+    best["cells"] = cells
+    best["cells_per_s"] = cells / best["total_s"] if best["total_s"] else 0.0
+    best["peak_rss_mb"] = peak_rss_mb()
+    return best
+
+
+def compare(results, baseline_path, tolerance):
+    with open(baseline_path) as f:
+        baseline = json.load(f)["results"]
+    regressions = []
+    for key, result in results.items():
+        if key not in baseline:
+            continue
+        before, after = baseline[key]["cells_per_s"], result["cells_per_s"]
+        if before and after < before * (1 - tolerance):
+            regressions.append((key, before, after))
+    for key, before, after in regressions:
+        print(f"REGRESSION {key}: {before:,.0f} -> {after:,.0f} cells/s")
+    return not regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="512x512,1024x1024,2048x2048")
+    parser.add_argument("--quick", action="store_true", help="small sweep")
+    parser.add_argument("--repeat", type=int, default=2)
+    parser.add_argument("--font", help="TTF to use instead of PIL's built in font")
+    parser.add_argument("--filter", default="", help="only run cases containing this")
+    parser.add_argument("--save", help="write results as a JSON baseline")
+    parser.add_argument("--compare", help="fail if slower than this JSON baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    args = parser.parse_args(argv)
+
+    install_invokeai_stand_in()
+    nodes = import_nodes()
+    # the nodes then save their phase timings with the image metadata
+    instrumentation = sys.modules[f"{PACKAGE_NAME}.instrumentation"]
+    os.environ.setdefault(instrumentation.INSTRUMENT_ENV, "1")
+    # passed to every node, so nothing is downloaded
+    font_path = local_font_file(args.font)
+
+    sizes = ["256x256"] if args.quick else args.sizes.split(",")
+    results = {}
+    print(f"{'case':<52} {'size':>10} {'cells/s':>12} {'convert':>8} {'save':>7} {'peak MB':>8}")
+    for size in sizes:
+        image = test_image(tuple(int(v) for v in size.split("x")))
+        for name, node, cell_size in node_cases(nodes, font_path, args.quick):
+            if args.filter not in name:
+                continue
+            result = run_case(node, image, cell_size, args.repeat)
+            results[f"{name}/{size}"] = result
+            print(
+                f"{name:<52} {size:>10} {result['cells_per_s']:>12,.0f} "
+                f"{result['convert_s']:>7.3f}s {result['save_s']:>6.3f}s "
+                f"{result['traced_peak_mb']:>8.1f}"
+            )
+            phases = ", ".join(
+                f"{phase} {seconds * 1000:.1f}ms"
+                for phase, seconds in result["phases"].items()
+                if phase not in ("load", "save")
+            )
+            if phases:
+                print(f"  {phases}")
+    print(f"peak RSS {peak_rss_mb():.0f} MB")
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(
+                dict(
+                    python=platform.python_version(),
+                    numpy=np.__version__,
+                    machine=platform.machine(),
+                    cpu_count=os.cpu_count(),
+                    results=results,
+                ),
+                f,
+                indent=2,
+                sort_keys=True,
+            )
+    if args.compare and not compare(results, args.compare, args.tolerance):
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
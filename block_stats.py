@@ -0,0 +1,130 @@
+# repo - https://github.com/mickr777/imagetoasciiimage
+# Sums, means and variances of blocks of an image, from summed area tables.
+
+import numpy as np
+
+
+def cell_edges(size: int, cell: float) -> np.ndarray:
+    """Pixel offsets of the whole cells along a side of size pixels.
+
+    cell may be fractional, cell i then covers round(i * cell) up to
+    round((i + 1) * cell), so cells differ in size by at most one pixel.
+    """
+    if cell <= 0:
+        raise ValueError(f"Cell size must be positive, got {cell}")
+    count = int(size // cell)
+    return np.floor(np.arange(count + 1) * cell + 0.5).astype(np.intp)
+
+
+def padded_edges(size: int, cell: int) -> np.ndarray:
+    """Offsets of every cell along a side, the last partial one cut at size."""
+    return np.minimum(np.arange(-(-size // cell) + 1) * cell, size)
+
+
+def _sum_dtype(array: np.ndarray):
+    return np.float64 if array.dtype.kind == "f" else np.int64
+
+
+def summed_area_table(array: np.ndarray) -> np.ndarray:
+    """(H + 1, W + 1[, C]) table whose [y, x] entry is the sum of array[:y, :x]."""
+    dtype = _sum_dtype(array)
+    if array.dtype == np.uint8 and 255 * array.shape[0] * array.shape[1] < 1 << 32:
+        dtype = np.uint32  # no sum can overflow, and it builds faster
+    table = np.zeros((array.shape[0] + 1, array.shape[1] + 1) + array.shape[2:], dtype)
+    # summing along rows first reads the image in memory order
+    np.cumsum(array, axis=1, dtype=dtype, out=table[1:, 1:])
+    np.cumsum(table[1:, 1:], axis=0, out=table[1:, 1:])
+    return table
+
+
+class BlockStats:
+    """Block statistics of one (H, W[, C]) image, for color and grayscale alike.
+
+    The summed area tables of the image and of its square, one per channel,
+    are built the first time they are needed, after which the sum, mean
+    and variance of any rectangle take four lookups whatever its size. One
+    BlockStats per image serves every cell size, non-square cells and
+    fractional strides, and every stage sampling that image: the ASCII and
+    Unicode quantizers, the color stage, NAL and the adaptive quadtree.
+    Sums of integer images are exact.
+    """
+
+    def __init__(self, image_array: np.ndarray):
+        self.array = np.asarray(image_array)
+        self.channels = self.array.shape[2:]
+        self._tables = {}
+
+    def _values(self, power: int) -> np.ndarray:
+        if power == 1:
+            return self.array
+        return self.array.astype(_sum_dtype(self.array)) ** 2
+
+    def table(self, power: int = 1) -> np.ndarray:
+        """Summed area table of the image (power=1) or of its square (power=2)."""
+        if power not in self._tables:
+            self._tables[power] = summed_area_table(self._values(power))
+        return self._tables[power]
+
+    def rect_sums(self, top, left, bottom, right, power: int = 1) -> np.ndarray:
+        """Sums over [top, bottom) x [left, right), the bounds broadcast together."""
+        table = self.table(power)
+        # the first term sets a dtype the uint32 tables can't wrap around in
+        return (
+            table[bottom, right].astype(_sum_dtype(self.array))
+            - table[top, right]
+            - table[bottom, left]
+            + table[top, left]
+        )
+
+    def rect_areas(self, top, left, bottom, right) -> np.ndarray:
+        """Pixel count of every rectangle, shaped to divide rect_sums() by."""
+        areas = np.asarray((np.asarray(bottom) - top) * (np.asarray(right) - left))
+        return areas.reshape(areas.shape + (1,) * len(self.channels))
+
+    def rect_means(self, top, left, bottom, right) -> np.ndarray:
+        """float64 means over [top, bottom) x [left, right)."""
+        areas = self.rect_areas(top, left, bottom, right)
+        return self.rect_sums(top, left, bottom, right) / areas
+
+    def rect_stats(self, top, left, bottom, right):
+        """(means, variances) over [top, bottom) x [left, right)."""
+        areas = self.rect_areas(top, left, bottom, right)
+        means = self.rect_sums(top, left, bottom, right) / areas
+        squares = self.rect_sums(top, left, bottom, right, power=2) / areas
+        return means, np.maximum(squares - means**2, 0)
+
+    @staticmethod
+    def _grid_rects(y_edges, x_edges):
+        # (top, left, bottom, right) of the cells between consecutive edges
+        y_edges, x_edges = np.asarray(y_edges), np.asarray(x_edges)
+        return y_edges[:-1, None], x_edges[None, :-1], y_edges[1:, None], x_edges[None, 1:]
+
+    def grid_sums(self, y_edges, x_edges, power: int = 1) -> np.ndarray:
+        """(rows, cols[, C]) sums of the cells between consecutive edges."""
+        return self.rect_sums(*self._grid_rects(y_edges, x_edges), power=power)
+
+    def grid_means(self, y_edges, x_edges) -> np.ndarray:
+        """(rows, cols[, C]) float64 mean of the cells between consecutive edges."""
+        return self.rect_means(*self._grid_rects(y_edges, x_edges))
+
+    def grid_stats(self, y_edges, x_edges):
+        """(means, variances) of the cells between consecutive edges."""
+        return self.rect_stats(*self._grid_rects(y_edges, x_edges))
+
+    def whole_edges(self, cell_h: float, cell_w: float):
+        """(y_edges, x_edges) of the whole cells of a cell_h x cell_w grid."""
+        height, width = self.array.shape[:2]
+        return cell_edges(height, cell_h), cell_edges(width, cell_w)
+
+    def padded_edges(self, cell_h: int, cell_w: int):
+        """(y_edges, x_edges) of every cell, partial cells at the edges cut short."""
+        height, width = self.array.shape[:2]
+        return padded_edges(height, cell_h), padded_edges(width, cell_w)
+
+    def cell_means(self, cell_h: float, cell_w: float) -> np.ndarray:
+        """Mean of every whole cell of a cell_h x cell_w grid, sizes may be fractional."""
+        return self.grid_means(*self.whole_edges(cell_h, cell_w))
+
+    def cell_stats(self, cell_h: float, cell_w: float):
+        """(means, variances) of every whole cell of a cell_h x cell_w grid."""
+        return self.grid_stats(*self.whole_edges(cell_h, cell_w))
@@ -0,0 +1,166 @@
+# repo - https://github.com/mickr777/imagetoasciiimage
+# Cell color stage shared by the ASCII, Unicode and AnyFont nodes.
+
+from dataclasses import dataclass
+from typing import Literal, Optional
+
+import numpy as np
+from PIL import Image
+
+from .block_stats import BlockStats
+from .cell_grid import has_cells
+from .matching import image_to_tiles
+
+# Auto keeps the color each node always used: its luminance sample for
+# ASCII and Unicode, the mean of the (zero padded) cell for AnyFont
+CELL_COLOR_MODES = Literal["Auto", "Mean", "Median", "Dominant"]
+PALETTE_MODES = Literal["Off", "Uniform", "Adaptive"]
+
+# Dominant color bins keep this many bits of each channel
+DOMINANT_BITS = 4
+
+# Cells mapped to the nearest palette color per block
+PALETTE_CHUNK_CELLS = 4096
+
+
+def dominant_colors(tiles: np.ndarray) -> np.ndarray:
+    """Mean color of the most common color bin of every (rows, cols, pixels[, C]) tile.
+
+    Pixels are binned to DOMINANT_BITS per channel, so near identical
+    shades count as one color; ties go to the darkest bin.
+    """
+    shape = tiles.shape
+    if not has_cells(shape):
+        return np.zeros(shape[:2] + shape[3:])
+    pixels = tiles.reshape(shape[0] * shape[1], shape[2], -1)
+    n_cells, n_pixels, n_channels = pixels.shape
+
+    bins = pixels.astype(np.int64) >> (8 - DOMINANT_BITS)
+    keys = np.zeros((n_cells, n_pixels), dtype=np.int64)
+    for channel in range(n_channels):
+        keys = (keys << DOMINANT_BITS) | bins[:, :, channel]
+
+    # longest run of equal keys in each sorted row
+    ordered = np.sort(keys, axis=1)
+    starts = np.ones(ordered.shape, dtype=bool)
+    starts[:, 1:] = ordered[:, 1:] != ordered[:, :-1]
+    run_ids = np.cumsum(starts, axis=1) - 1
+    cells = np.arange(n_cells)[:, None]
+    run_lengths = np.bincount(
+        (cells * n_pixels + run_ids).ravel(), minlength=n_cells * n_pixels
+    ).reshape(n_cells, n_pixels)
+    longest = run_lengths.argmax(axis=1)
+    first = (run_ids == longest[:, None]).argmax(axis=1)
+    dominant = ordered[cells[:, 0], first]
+
+    in_bin = (keys == dominant[:, None])[:, :, None]
+    colors = (pixels * in_bin).sum(axis=1) / in_bin.sum(axis=1)
+    return colors.reshape(shape[:2] + shape[3:])
+
+
+def whole_cell_tiles(image_array: np.ndarray, cell_h: int, cell_w: int) -> np.ndarray:
+    """image_to_tiles() of the whole cells only, like sample_cells() drops the rest."""
+    rows = image_array.shape[0] // cell_h
+    cols = image_array.shape[1] // cell_w
+    return image_to_tiles(image_array[: rows * cell_h, : cols * cell_w], cell_h, cell_w)
+
+
+def adaptive_palette(colors: np.ndarray, n_colors: int) -> np.ndarray:
+    """(k, 3) median cut palette of at most n_colors for a grid of colors."""
+    grid = np.clip(np.rint(colors), 0, 255).astype(np.uint8)
+    if grid.ndim == 2:
+        grid = np.repeat(grid[:, :, None], 3, axis=2)
+    image = Image.fromarray(grid.reshape(-1, 1, 3), "RGB")
+    quantized = image.quantize(
+        colors=n_colors, method=Image.Quantize.MEDIANCUT, dither=Image.Dither.NONE
+    )
+    used = np.unique(np.asarray(quantized))
+    palette = np.array(quantized.getpalette()[: 3 * 256], dtype=np.float64)
+    return palette.reshape(-1, 3)[used]
+
+
+def nearest_palette_indices(flat: np.ndarray, palette: np.ndarray) -> np.ndarray:
+    """Index of the nearest palette color of every row of an (n, C) color array."""
+    palette = palette[:, : flat.shape[1]].astype(np.float64)
+    palette_norms = np.einsum("ij,ij->i", palette, palette)
+    out = np.empty(len(flat), dtype=np.intp)
+    for start in range(0, len(flat), PALETTE_CHUNK_CELLS):
+        block = flat[start : start + PALETTE_CHUNK_CELLS].astype(np.float64)
+        distances = palette_norms[None, :] - 2.0 * block @ palette.T
+        out[start : start + PALETTE_CHUNK_CELLS] = distances.argmin(axis=1)
+    return out
+
+
+def nearest_palette_colors(colors: np.ndarray, palette: np.ndarray) -> np.ndarray:
+    """Replace every color of the grid with its nearest palette color."""
+    gray = colors.ndim == 2
+    flat = colors.reshape(-1, 1) if gray else colors.reshape(-1, colors.shape[-1])
+    palette = palette[:, : flat.shape[1]].astype(np.float64)
+    return palette[nearest_palette_indices(flat, palette)].reshape(colors.shape)
+
+
+@dataclass
+class ColorStage:
+    """Per cell colors from whole grids of tiles, then an optional palette.
+
+    Uniform snaps every channel to palette_colors evenly spaced levels.
+    Adaptive picks palette_colors colors by median cut over the cell colors,
+    so compositing and PNG encoding see only a handful of distinct colors.
+    """
+
+    cell_color: str = "Auto"
+    palette: str = "Off"
+    palette_colors: int = 16
+
+    def reduce(self, tiles: np.ndarray) -> np.ndarray:
+        """(rows, cols[, C]) float colors of a (rows, cols, pixels[, C]) tile grid."""
+        if self.cell_color == "Median":
+            return np.median(tiles, axis=2)
+        if self.cell_color == "Dominant":
+            return dominant_colors(tiles)
+        return tiles.mean(axis=2)
+
+    def sample(self, stats: BlockStats, cell_h: int, cell_w: int) -> np.ndarray:
+        """Colors of the whole cells of the image of stats, for sample_image_cells()."""
+        if self.cell_color in ("Auto", "Mean"):
+            return stats.cell_means(cell_h, cell_w)
+        return self.reduce(whole_cell_tiles(stats.array, cell_h, cell_w))
+
+    def padded_sample(self, stats: BlockStats, cell_h: int, cell_w: int) -> np.ndarray:
+        """Colors of every cell, partial cells at the edges padded with black
+        the way image_to_tiles() pads them."""
+        if self.cell_color in ("Auto", "Mean"):
+            return stats.grid_sums(*stats.padded_edges(cell_h, cell_w)) / (cell_h * cell_w)
+        return self.reduce(image_to_tiles(stats.array, cell_h, cell_w))
+
+    def image_palette(self, image: Image.Image, cell_h: int, cell_w: int) -> Optional[np.ndarray]:
+        """Adaptive palette of a whole image, for nodes that color it a band at a time."""
+        if self.palette != "Adaptive":
+            return None
+        cols = max(1, -(-image.width // cell_w))
+        rows = max(1, -(-image.height // cell_h))
+        cells = image.convert("RGB").resize((cols, rows), Image.Resampling.BOX)
+        return adaptive_palette(np.asarray(cells), self.palette_colors)
+
+    def known_colors(self, palette: Optional[np.ndarray] = None) -> Optional[np.ndarray]:
+        """(k, 3) every color quantize() can give with this palette, or None
+        when that isn't known before the colors are, or is over 256 colors."""
+        if self.palette == "Uniform":
+            levels = np.unique(self.quantize(np.arange(256)))
+            if len(levels) ** 3 > 256:
+                return None
+            return np.stack(np.meshgrid(levels, levels, levels, indexing="ij"), -1).reshape(-1, 3)
+        if self.palette == "Adaptive":
+            return palette
+        return None
+
+    def quantize(self, colors: np.ndarray, palette: Optional[np.ndarray] = None) -> np.ndarray:
+        """colors snapped to the palette, built from colors themselves if not given."""
+        if self.palette == "Uniform":
+            step = 255 / max(1, self.palette_colors - 1)
+            return np.rint(np.rint(np.asarray(colors) / step) * step)
+        if self.palette == "Adaptive":
+            if palette is None:
+                palette = adaptive_palette(colors, self.palette_colors)
+            return nearest_palette_colors(np.asarray(colors), palette)
+        return colors
@@ -0,0 +1,130 @@
+# repo - https://github.com/mickr777/imagetoasciiimage
+# Per cell sampling of an image into a grid of values and colors.
+
+from typing import Literal
+
+import numpy as np
+
+from .block_stats import BlockStats
+
+SAMPLING_MODES = Literal["Point", "Block Mean", "Block Median"]
+
+
+def has_cells(shape) -> bool:
+    """False for a (rows, cols, ...) grid without a single whole cell, e.g.
+    of an image smaller than one, which callers return empty up front."""
+    return shape[0] * shape[1] > 0
+
+
+def sample_cells(
+    image_array: np.ndarray, cell_h: int, cell_w: int, mode: str = "Point", stats=None
+) -> np.ndarray:
+    """Reduce an (H, W[, C]) image to one sample per whole cell.
+
+    Point takes the top left pixel of each cell, Block Mean and Block Median
+    reduce every pixel of the cell. Block Mean reads the summed area table
+    of stats, the BlockStats of the image when the caller shares one.
+    Partial cells at the right and bottom edges are dropped. Returns
+    (rows, cols[, C]) as float64 for the block modes and the image dtype
+    for Point.
+    """
+    rows = image_array.shape[0] // cell_h
+    cols = image_array.shape[1] // cell_w
+    if mode == "Point":
+        return image_array[: rows * cell_h : cell_h, : cols * cell_w : cell_w]
+
+    if mode == "Block Mean":
+        stats = BlockStats(image_array) if stats is None else stats
+        return stats.cell_means(cell_h, cell_w)
+    channels = image_array.shape[2:]
+    if not has_cells((rows, cols)):
+        return np.zeros((rows, cols) + channels)
+    blocks = image_array[: rows * cell_h, : cols * cell_w].reshape(
+        rows, cell_h, cols, cell_w, *channels
+    )
+    if mode == "Block Median":
+        return np.median(blocks, axis=(1, 3))
+    raise ValueError(f"Unknown sampling mode: {mode}")
+
+
+def sub_cell_bounds(size: int, parts: int) -> np.ndarray:
+    """Pixel offsets splitting a cell side into parts, the last one is the size."""
+    return np.linspace(0, size, parts + 1).astype(np.intp)
+
+
+def sample_sub_cells(
+    image_array: np.ndarray, cell_h: int, cell_w: int, sub_rows: int, sub_cols: int, stats=None
+) -> np.ndarray:
+    """Mean of each of the sub_rows x sub_cols parts of every whole cell.
+
+    Returns (rows, cols, sub_rows, sub_cols[, C]) float64. Cells that don't
+    split evenly get parts that differ in size by one pixel.
+    """
+    rows = image_array.shape[0] // cell_h
+    cols = image_array.shape[1] // cell_w
+    channels = image_array.shape[2:]
+
+    def edges(count, size, parts):
+        # the sub cell bounds of every cell, then the end of the last one
+        starts = np.arange(count)[:, None] * size + sub_cell_bounds(size, parts)[None, :-1]
+        return np.append(starts.ravel(), count * size)
+
+    stats = BlockStats(image_array) if stats is None else stats
+    means = stats.grid_means(
+        edges(rows, cell_h, sub_rows), edges(cols, cell_w, sub_cols)
+    )
+    return means.reshape(rows, sub_rows, cols, sub_cols, *channels).swapaxes(1, 2)
+
+
+def quantize_levels(values: np.ndarray, n_levels: int) -> np.ndarray:
+    """Map 0-255 values onto n_levels indices, int(value * (n - 1) / 255)."""
+    values = np.clip(np.asarray(values, dtype=np.float64), 0, 255)
+    return (values * (n_levels - 1) / 255).astype(np.intp)
+
+
+def threshold_levels(values: np.ndarray, threshold: float = 127.5) -> np.ndarray:
+    """Two level quantization, 0 below the threshold and 1 at or above it."""
+    return (np.asarray(values, dtype=np.float64) >= threshold).astype(np.intp)
+
+
+def sample_image_cells(
+    image,
+    cell_h: int,
+    cell_w: int,
+    mode: str = "Point",
+    band_rows: int = 0,
+    prepare=None,
+    sampler=None,
+) -> np.ndarray:
+    """sample_cells() over a PIL image, band_rows rows of cells at a time.
+
+    prepare is applied to each band before sampling (gamma, mode conversion,
+    ...) so at most one band of the prepared image is held in memory.
+    sampler(stats) replaces sample_cells() for other per cell reductions
+    (sub cells, colors, ...), mode is ignored then. It gets the BlockStats
+    of the prepared band, so every statistic it takes shares one summed
+    area table, and may return a tuple of grids, each stitched separately.
+    """
+    rows = image.height // cell_h
+    step = band_rows if band_rows > 0 else max(rows, 1)
+    bands = []
+    for start in range(0, max(rows, 1), step):
+        if step >= rows:
+            band = image
+        else:
+            end = min(rows, start + step)
+            band = image.crop((0, start * cell_h, image.width, end * cell_h))
+        if prepare is not None:
+            band = prepare(band)
+        stats = BlockStats(np.asarray(band))
+        if sampler is None:
+            bands.append(sample_cells(stats.array, cell_h, cell_w, mode, stats))
+        else:
+            bands.append(sampler(stats))
+    if isinstance(bands[0], tuple):
+        return tuple(_stitch(list(parts)) for parts in zip(*bands))
+    return _stitch(bands)
+
+
+def _stitch(bands: list) -> np.ndarray:
+    return np.concatenate(bands) if len(bands) > 1 else bands[0]
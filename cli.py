@@ -0,0 +1,223 @@
+# repo - https://github.com/mickr777/imagetoasciiimage
+# Command line conversion of image files and folders, without InvokeAI.
+#
+#   python -m imagetoasciiimage anyfont photos/ -o out/ --font-size 8 --color-mode
+#   python -m imagetoasciiimage ascii a.png b.png -o out/ --output-to-file
+#
+# Every option of the ASCII, Unicode and AnyFont nodes is available as a
+# --dashed-name flag built from the fields of the matching core converter.
+
+import argparse
+import os
+import sys
+from dataclasses import MISSING, fields
+from typing import get_args
+
+from PIL import Image
+
+from . import instrumentation
+from .cell_colors import CELL_COLOR_MODES, PALETTE_MODES
+from .cell_grid import SAMPLING_MODES
+from .core import (
+    ASCII_SETS,
+    CHAR_SETS,
+    UNICODE_SETS,
+    AnyFontConverter,
+    AsciiArtConverter,
+    UnicodeArtConverter,
+    from_options,
+    list_local_fonts,
+)
+from .glyph_index import GLYPH_SEARCH_MODES
+from .matching import MATCHERS
+from .output_modes import OUTPUT_MODES
+from .parallel import PARALLEL_MODES
+from .temporal import load_frames, save_animation
+from .sub_cells import SUB_CELL_MODES
+from .text_export import TEXT_FORMATS
+from .tile_memo import MEMO_MODES
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".webp", ".bmp", ".gif", ".tif", ".tiff")
+
+CONVERTERS = {
+    "ascii": AsciiArtConverter,
+    "unicode": UnicodeArtConverter,
+    "anyfont": AnyFontConverter,
+}
+
+CHOICES = {
+    "ascii_set": list(ASCII_SETS),
+    "unicode_set": list(UNICODE_SETS),
+    "character_range": list(CHAR_SETS) + ["Custom"],
+    "comparison_type": list(MATCHERS),
+    "local_font": ["None"] + list_local_fonts(),
+    "sampling_mode": list(get_args(SAMPLING_MODES)),
+    "text_format": list(get_args(TEXT_FORMATS)),
+    "parallel_mode": list(get_args(PARALLEL_MODES)),
+    "glyph_search": list(get_args(GLYPH_SEARCH_MODES)),
+    "tile_memo": list(get_args(MEMO_MODES)),
+    "sub_cell_mode": list(get_args(SUB_CELL_MODES)),
+    "cell_color": list(get_args(CELL_COLOR_MODES)),
+    "palette": list(get_args(PALETTE_MODES)),
+    "output_mode": list(get_args(OUTPUT_MODES)),
+}
+
+
+def add_converter_options(parser: argparse.ArgumentParser, cls):
+    for field in fields(cls):
+        default = None if field.default is MISSING else field.default
+        flag = "--" + field.name.replace("_", "-")
+        if isinstance(default, bool):
+            parser.add_argument(
+                flag, default=default, action=argparse.BooleanOptionalAction
+            )
+        else:
+            parser.add_argument(
+                flag,
+                default=default,
+                type=str if default is None else type(default),
+                choices=CHOICES.get(field.name),
+                help=f"(default: {default})",
+            )
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog=f"python -m {__package__}",
+        description="Convert images to ASCII or Unicode art without InvokeAI",
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+    for name, cls in CONVERTERS.items():
+        command = commands.add_parser(name, help=cls.__doc__)
+        command.add_argument("inputs", nargs="+", help="image files or folders")
+        command.add_argument(
+            "-o", "--output", default="asciiart_output", help="output folder"
+        )
+        command.add_argument(
+            "-r", "--recursive", action="store_true", help="also convert sub folders"
+        )
+        add_converter_options(command, cls)
+        if name == "ascii":
+            command.add_argument(
+                "--output-to-file",
+                action="store_true",
+                help="also write the ASCII art as text next to each image",
+            )
+        if name == "anyfont":
+            command.add_argument(
+                "--batch-size",
+                type=int,
+                default=16,
+                help="still images matched together in one call",
+            )
+    return parser
+
+
+def find_images(inputs, recursive: bool = False):
+    """The image files given directly or found in the given folders, in order."""
+    for path in inputs:
+        if not os.path.isdir(path):
+            yield path
+            continue
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            for name in sorted(files):
+                if name.lower().endswith(IMAGE_EXTENSIONS):
+                    yield os.path.join(root, name)
+            if not recursive:
+                break
+
+
+def output_path(output_dir: str, path: str, extension: str = ".png") -> str:
+    stem = os.path.splitext(os.path.basename(path))[0]
+    return os.path.join(output_dir, stem + extension)
+
+
+def is_animated(path: str) -> bool:
+    with Image.open(path) as image:
+        return getattr(image, "is_animated", False)
+
+
+def open_image(path: str) -> Image.Image:
+    # the ASCII and Unicode samplers take L or RGB images
+    image = Image.open(path)
+    return image if image.mode in ("L", "RGB") else image.convert("RGB")
+
+
+def convert_ascii(args, paths):
+    converter = from_options(AsciiArtConverter, args)
+    for path in paths:
+        with instrumentation.run("cli ascii"):
+            image = open_image(path)
+            char_grid = converter.get_char_grid(image)
+            if args.output_to_file:
+                stem = os.path.splitext(os.path.basename(path))[0]
+                converter.write_ascii_file(image, args.output, stem, char_grid)
+            output = converter.convert_image(image, char_grid)
+            output.save(output_path(args.output, path))
+        yield path
+
+
+def convert_unicode(args, paths):
+    converter = from_options(UnicodeArtConverter, args)
+    for path in paths:
+        with instrumentation.run("cli unicode"):
+            image = open_image(path)
+            converter.convert_image(image).save(output_path(args.output, path))
+        yield path
+
+
+def convert_anyfont(args, paths):
+    converter = from_options(AnyFontConverter, args)
+    font_path = converter.get_font_path()
+    if font_path is None:
+        raise SystemExit(1)
+
+    stills = []
+    for path in paths + [None]:
+        if path is not None and is_animated(path):
+            with instrumentation.run("cli anyfont animation"):
+                frames, durations = [], []
+                for frame, duration in converter.convert_animation(
+                    load_frames(path), font_path
+                ):
+                    frames.append(frame)
+                    durations.append(duration)
+                extension = os.path.splitext(path)[1].lower()
+                save_animation(
+                    frames, durations, output_path(args.output, path, extension)
+                )
+            yield path
+            continue
+
+        if path is not None:
+            stills.append(path)
+        if stills and (path is None or len(stills) >= args.batch_size):
+            with instrumentation.run("cli anyfont"):
+                images = [Image.open(p) for p in stills]
+                for p, image in zip(
+                    stills, converter.convert_images_batched(images, font_path)
+                ):
+                    image.save(output_path(args.output, p))
+            yield from stills
+            stills = []
+
+
+COMMANDS = {
+    "ascii": convert_ascii,
+    "unicode": convert_unicode,
+    "anyfont": convert_anyfont,
+}
+
+
+def main(argv=None) -> int:
+    args = build_parser().parse_args(argv)
+    paths = list(find_images(args.inputs, args.recursive))
+    if not paths:
+        print("No images found", file=sys.stderr)
+        return 1
+
+    os.makedirs(args.output, exist_ok=True)
+    for index, path in enumerate(COMMANDS[args.command](args, paths), 1):
+        print(f"[{index}/{len(paths)}] {path}")
+    return 0
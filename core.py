@@ -0,0 +1,898 @@
+# repo - https://github.com/mickr777/imagetoasciiimage
+# Conversion core of the ASCII, Unicode and AnyFont nodes, needing only NumPy and PIL.
+#
+# Each converter is a dataclass whose fields are named like the inputs of
+# its node, so a node (or an argparse namespace) builds one with
+# from_options(self). Nothing here imports InvokeAI, and requests is only
+# imported when a font actually has to be downloaded (see font_fetch).
+
+import os
+import string
+from dataclasses import dataclass, fields
+from typing import Optional
+
+import numpy as np
+from PIL import Image
+
+from . import instrumentation
+from .block_stats import BlockStats, cell_edges
+from .cell_colors import ColorStage
+from .cell_grid import (
+    quantize_levels,
+    sample_cells,
+    sample_image_cells,
+    sample_sub_cells,
+    threshold_levels,
+)
+from .font_cache import GLYPH_CACHE, font_cache_dir
+from .font_fetch import fetch_font
+from .glyph_index import INDEX_METRICS, GlyphIndex, SadBoundIndex
+from .matching import GLYPH_STATS, image_to_tiles, match_nal_sums
+from .output_modes import compact_mode, image_palette, ink_colors, palette_indices
+from .parallel import map_row_bands, match_parallel
+from .quadtree import cell_pyramid, level_variances, quadtree_leaves, sum_pyramid
+from .result_cache import RESULT_CACHE, cached_result, compact_grid
+from .temporal import DirtyTileTracker, row_ranges
+from .sub_cells import SUB_CELL_LAYOUTS, fit_sub_cells, render_sub_cells
+from .tile_memo import TileMemo
+from .text_export import (
+    FORMAT_EXTENSIONS,
+    FORMAT_WRITERS,
+    claim_output_file,
+    plain_rows,
+    write_text,
+)
+
+output_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "asciiart_output")
+
+
+def from_options(cls, options):
+    """Build converter cls from any object with attributes named like its fields."""
+    return cls(
+        **{f.name: getattr(options, f.name) for f in fields(cls) if hasattr(options, f.name)}
+    )
+
+
+def adjust_gamma(image, gamma=1.0):
+    invGamma = 1.0 / gamma
+    table = [((i / 255.0) ** invGamma) * 255 for i in range(256)]
+    if image.mode == "L":
+        return image.point(table)
+    elif image.mode == "RGB":
+        return image.point(table * 3)
+
+
+def cell_height(cell_w: int, cell_aspect: float) -> int:
+    """Whole pixel height of a cell cell_aspect times as tall as it is wide."""
+    return max(1, int(round(cell_w * cell_aspect)))
+
+
+def sample_cells_and_colors(options, image, cell_h: int, cell_w: int, prepare=None):
+    """Per cell samples and color mode cell colors of the ASCII and Unicode nodes.
+
+    Both come from one pass over the prepared image, through one BlockStats
+    per band. Auto keeps the samples as colors, the other cell_color modes
+    reduce every pixel of each whole cell. Both then go through the palette.
+    Returns (samples, colors), colors is None outside color mode.
+    """
+    stage = from_options(ColorStage, options)
+    own_colors = options.color_mode and stage.cell_color != "Auto"
+
+    def sampler(stats):
+        samples = sample_cells(stats.array, cell_h, cell_w, options.sampling_mode, stats)
+        if not own_colors:
+            return (samples,)
+        return samples, stage.sample(stats, cell_h, cell_w)
+
+    grids = sample_image_cells(
+        image, cell_h, cell_w, band_rows=options.band_rows, prepare=prepare, sampler=sampler
+    )
+    if not options.color_mode:
+        return grids[0], None
+    return grids[0], stage.quantize(grids[-1])
+
+
+def render_cells(options, atlas, index_grid, size: tuple, mode: str, background, ink):
+    """atlas.render() of a whole grid, as a compact image when
+    options.output_mode is Compact and one fits."""
+    palette = None
+    if options.output_mode == "Compact":
+        mode, palette = compact_mode(mode, background, ink)
+    return atlas.render(index_grid, size, mode, background, ink, palette=palette)
+
+
+ASCII_SETS = {
+    "High Detail": r"@$B%8WM#&*oahkbdpqwmZO0QLCJYXzcvunxrjft/\|()1{}[]?-+~<>i!lI;:,^'. ",
+    "Medium Detail": "@%#*+=-:. ",
+    "Low Detail": "@#=-. ",
+    "Numbers": "9876543210",
+    "Blocks": "[]|-",
+    "Binary": "01",
+}
+
+
+@dataclass
+class AsciiArtConverter:
+    """ASCII art drawn with PIL's default font, one char per font_spacing wide cell"""
+
+    font_spacing: int = 6
+    ascii_set: str = "Medium Detail"
+    color_mode: bool = False
+    invert_colors: bool = True
+    gamma: float = 1.0
+    text_format: str = "Plain"
+    sampling_mode: str = "Point"
+    band_rows: int = 0
+    cell_color: str = "Auto"
+    palette: str = "Off"
+    palette_colors: int = 16
+    bypass_cache: bool = False
+    cell_aspect: float = 1.0
+    output_mode: str = "Full"
+
+    def cell_height(self) -> int:
+        return cell_height(self.font_spacing, self.cell_aspect)
+
+    def get_ascii_chars(self):
+        char_set = ASCII_SETS[self.ascii_set]
+        return char_set[::-1] if self.invert_colors else char_set
+
+    def get_char_grid(self, input_image: Image.Image):
+        """Sample the gamma adjusted image once per cell.
+
+        Returns the (rows, cols) char index grid and the per cell samples,
+        replaced by the cell colors in color mode. Results are kept in the
+        result cache unless bypass_cache is set.
+        """
+        grid = cached_result(
+            "ascii", input_image, self, lambda: self.sample_char_grid(input_image)
+        )
+        return grid["chars"], grid["colors"]
+
+    def sample_char_grid(self, input_image: Image.Image) -> dict:
+        ascii_chars = self.get_ascii_chars()
+        prepare = lambda band: adjust_gamma(band, gamma=self.gamma)
+        samples, colors = sample_cells_and_colors(
+            self, input_image, self.cell_height(), self.font_spacing, prepare
+        )
+        values = samples[:, :, 0] if samples.ndim == 3 else samples
+
+        if self.ascii_set == "Binary":
+            char_indices = threshold_levels(values)
+        else:
+            char_indices = quantize_levels(values, len(ascii_chars))
+
+        if self.color_mode:
+            samples = colors
+        # every use of the samples rounds them, so the cache can keep uint8
+        return dict(chars=char_indices, colors=np.rint(samples))
+
+    def convert_image(self, input_image: Image.Image, char_grid=None) -> Image.Image:
+        ascii_chars = self.get_ascii_chars()
+        if char_grid is None:
+            char_grid = self.get_char_grid(input_image)
+        char_indices, samples = char_grid
+
+        atlas = GLYPH_CACHE.atlas(
+            None, None, ascii_chars, self.font_spacing, self.cell_height()
+        )
+        if self.color_mode:
+            return render_cells(
+                self,
+                atlas,
+                char_indices,
+                input_image.size,
+                "RGB",
+                background=(0, 0, 0) if self.invert_colors else (255, 255, 255),
+                ink=np.rint(samples).astype(np.int32),
+            )
+        return render_cells(
+            self,
+            atlas,
+            char_indices,
+            input_image.size,
+            "L",
+            background=0 if self.invert_colors else 255,
+            ink=255 if self.invert_colors else 0,
+        )
+
+    def get_text_grid(self, char_grid, height: int):
+        # Text rows are about twice as tall as they are wide, so the cell
+        # rows written out are font_aspect_ratio / cell_aspect rows apart,
+        # a fractional stride for cells that aren't square or 2:1
+        char_indices, samples = char_grid
+        font_aspect_ratio = 2
+        row_step = font_aspect_ratio * self.font_spacing / self.cell_height()
+        rows = cell_edges(height // self.cell_height(), row_step)[:-1]
+        return char_indices[rows], samples[rows]
+
+    def image_to_ascii_string(self, input_image: Image.Image, char_grid=None) -> str:
+        if char_grid is None:
+            char_grid = self.get_char_grid(input_image)
+        text_indices, _ = self.get_text_grid(char_grid, input_image.height)
+        return "".join(plain_rows(text_indices, self.get_ascii_chars()))
+
+    def write_ascii_file(
+        self,
+        input_image: Image.Image,
+        directory: str = output_dir,
+        base_name: str = "output",
+        char_grid=None,
+    ) -> str:
+        if char_grid is None:
+            char_grid = self.get_char_grid(input_image)
+        text_indices, text_colors = self.get_text_grid(char_grid, input_image.height)
+
+        filename, f = claim_output_file(
+            directory, base_name, FORMAT_EXTENSIONS[self.text_format]
+        )
+        with f:
+            write_text(
+                f,
+                FORMAT_WRITERS[self.text_format](
+                    text_indices,
+                    self.get_ascii_chars(),
+                    text_colors if self.color_mode else None,
+                    background=(0, 0, 0) if self.invert_colors else (255, 255, 255),
+                ),
+            )
+        return filename
+
+
+UNICODE_SETS = {
+    "Shaded": "█▓▒░ ",
+    "Extended Shading": "█▇▆▅▄▃▂▁▀",
+    "Intermediate Detail": "◼◐○□ ",
+    "Checkerboard Patterns": "▝▜▛▚▙▘▗▖ ",
+    "Vertical Lines": "┋┊┇┆┃│ ",
+    "Horizontal Lines": "┉┈┅┄━─ ",
+    "Diagonal Lines": "╱╳╲ ",
+    "Arrows": "↙↘↗↖↕↔↓→↑← ",
+    "Circles": "◑◐◕◔○● ",
+    "Blocks": "▁▂▃▄▅▆▇█ ",
+    "Triangles": "▷◁◶▷▽▼△▲ ",
+    "Math Symbols": "∓±÷×−+ ",
+    "Stars": "✬✫✪✩✧✦☆★ ",
+}
+
+FONT_PATH = os.path.join(font_cache_dir, "DejaVuSansMono.ttf")
+UNICODE_FONT_URL = "https://candyfonts.com/wp-data/2021/05/09/122551/DejaVuSansMono.ttf"
+
+
+@dataclass
+class UnicodeArtConverter:
+    """Unicode shading art drawn with DejaVu Sans Mono, downloaded on first use,
+    or with the font at local_font_path"""
+
+    font_size: int = 8
+    gamma: float = 1.0
+    unicode_set: str = "Shaded"
+    color_mode: bool = True
+    invert_colors: bool = True
+    sampling_mode: str = "Point"
+    band_rows: int = 0
+    sub_cell_mode: str = "Off"
+    cell_color: str = "Auto"
+    palette: str = "Off"
+    palette_colors: int = 16
+    bypass_cache: bool = False
+    cell_aspect: float = 1.0
+    output_mode: str = "Full"
+    local_font_path: Optional[str] = None
+
+    def cell_height(self) -> int:
+        return cell_height(self.font_size, self.cell_aspect)
+
+    def get_font_path(self) -> str:
+        if self.local_font_path:
+            return self.local_font_path
+        return fetch_font(
+            UNICODE_FONT_URL, os.path.dirname(FONT_PATH), os.path.basename(FONT_PATH)
+        )
+
+    def get_unicode_chars(self):
+        char_set = UNICODE_SETS[self.unicode_set]
+        return char_set[::-1] if self.invert_colors else char_set
+
+    def get_sub_cell_grid(self, input_image: Image.Image):
+        """(rows, cols) char grid of SUB_CELL_CHARS[sub_cell_mode] and the
+        foreground and background color of every cell"""
+        grid = cached_result(
+            "unicode sub cells",
+            input_image,
+            self,
+            lambda: self.fit_sub_cell_grid(input_image),
+        )
+        return grid["chars"], grid["fg"], grid["bg"]
+
+    def fit_sub_cell_grid(self, input_image: Image.Image) -> dict:
+        image_mode = "RGB" if self.color_mode else "L"
+        with instrumentation.phase("sample"):
+            samples = sample_image_cells(
+                input_image,
+                self.cell_height(),
+                self.font_size,
+                band_rows=self.band_rows,
+                prepare=lambda band: adjust_gamma(band.convert(image_mode), gamma=self.gamma),
+                sampler=lambda stats: sample_sub_cells(
+                    stats.array,
+                    self.cell_height(),
+                    self.font_size,
+                    *SUB_CELL_LAYOUTS[self.sub_cell_mode],
+                    stats=stats,
+                ),
+            )
+        with instrumentation.phase("fit"):
+            char_indices, fg, bg = fit_sub_cells(samples, self.sub_cell_mode)
+
+        # one palette for both colors of the cells
+        stage = from_options(ColorStage, self)
+        if stage.palette != "Off":
+            colors = stage.quantize(np.concatenate([fg, bg]))
+            fg, bg = np.split(np.rint(colors).astype(np.uint8), 2)
+        return dict(chars=char_indices, fg=fg, bg=bg)
+
+    def convert_sub_cells(self, input_image: Image.Image) -> Image.Image:
+        # Colors come from the image, so invert_colors only picks the color
+        # of the partial cells left at the right and bottom edges
+        char_indices, fg, bg = self.get_sub_cell_grid(input_image)
+        instrumentation.count("cells", char_indices.size)
+        background = 0 if self.invert_colors else 255
+        mode = "RGB" if self.color_mode else "L"
+        palette = None
+        if self.output_mode == "Compact":
+            mode, palette = compact_mode(mode, background, np.concatenate([fg, bg]))
+        with instrumentation.phase("composite"):
+            return render_sub_cells(
+                char_indices,
+                fg,
+                bg,
+                self.sub_cell_mode,
+                self.cell_height(),
+                self.font_size,
+                input_image.size,
+                mode,
+                (background,) * 3 if self.color_mode else background,
+                palette,
+            )
+
+    def sample_char_grid(self, input_image: Image.Image) -> dict:
+        """Char index grid and, in color mode, cell colors of the gamma adjusted image"""
+        prepare = lambda band: adjust_gamma(band, gamma=self.gamma)
+        with instrumentation.phase("sample"):
+            samples, colors = sample_cells_and_colors(
+                self, input_image, self.cell_height(), self.font_size, prepare
+            )
+            values = samples[:, :, 0] if samples.ndim == 3 else samples
+            char_indices = quantize_levels(values, len(self.get_unicode_chars()))
+        instrumentation.count("cells", char_indices.size)
+        if not self.color_mode:
+            return dict(chars=char_indices)
+        return dict(chars=char_indices, colors=colors)
+
+    def convert_image(self, input_image: Image.Image) -> Image.Image:
+        if self.sub_cell_mode != "Off":
+            return self.convert_sub_cells(input_image)
+
+        font_path = self.get_font_path()
+
+        try:
+            atlas = GLYPH_CACHE.atlas(
+                font_path,
+                self.font_size,
+                self.get_unicode_chars(),
+                self.font_size,
+                self.cell_height(),
+            )
+        except Exception as e:
+            print("Error loading font:", e)
+            raise e
+
+        grid = cached_result(
+            "unicode", input_image, self, lambda: self.sample_char_grid(input_image)
+        )
+        char_indices = grid["chars"]
+
+        with instrumentation.phase("composite"):
+            if self.color_mode:
+                return render_cells(
+                    self,
+                    atlas,
+                    char_indices,
+                    input_image.size,
+                    "RGB",
+                    background=(0, 0, 0) if self.invert_colors else (255, 255, 255),
+                    ink=grid["colors"],
+                )
+            return render_cells(
+                self,
+                atlas,
+                char_indices,
+                input_image.size,
+                "L",
+                background=0 if self.invert_colors else 255,
+                ink=255 if self.invert_colors else 0,
+            )
+
+
+CHAR_SETS = {
+    "All": [chr(i) for i in range(0, 255)],
+    "Low": [chr(i) for i in range(32, 127)],
+    "High": [chr(i) for i in range(128, 255)],
+    "Ascii": [chr(i) for i in range(32, 255)],
+    "Numbers": string.digits + ".",
+    "Letters": string.ascii_letters + " ",
+    "Lowercase": string.ascii_lowercase + " ",
+    "Uppercase": string.ascii_uppercase + " ",
+    "Hex": string.hexdigits,
+    "Punctuation": string.punctuation,
+    "Printable": string.digits + string.ascii_letters + string.punctuation + " ",
+    "AH": "@$B%8WM#&*oahkbdpqwmZO0QLCJYXzcvunxrjft/\\|()1{}[]?-+~<>i!lI;:,^'. ",
+    "AM": "@%#*+=-:. ",
+    "AL": "@#=-. ",
+    "Blocks": "[]|-",
+    "Binary": "01",
+}
+
+DEFAULT_FONT_URL = "https://github.com/dernyn/256/raw/master/Dernyn's-256(baseline).ttf"
+
+
+def list_local_fonts() -> list:
+    if not os.path.exists(font_cache_dir):
+        return []
+    fonts = [
+        f for f in os.listdir(font_cache_dir) if f.lower().endswith((".ttf", ".otf"))
+    ]
+    return sorted(fonts, key=lambda x: x.lower())
+
+
+@dataclass
+class AnyFontConverter:
+    """Ascii art matched tile by tile against the glyphs of any font"""
+
+    font_url: Optional[str] = DEFAULT_FONT_URL
+    local_font_path: Optional[str] = None
+    local_font: str = "None"
+    font_size: int = 6
+    character_range: str = "Ascii"
+    custom_characters: str = "▁▂▃▄▅▆▇█ "
+    drop_missing: bool = False
+    comparison_type: str = "NAL"
+    mono_comparison: bool = False
+    color_mode: bool = False
+    band_rows: int = 0
+    parallel_mode: str = "Off"
+    workers: int = 0
+    tolerance: int = 0
+    glyph_search: str = "Brute Force"
+    index_probes: int = 2
+    tile_memo: str = "Off"
+    memo_bits: int = 4
+    cell_color: str = "Auto"
+    palette: str = "Off"
+    palette_colors: int = 16
+    bypass_cache: bool = False
+    adaptive_levels: int = 0
+    split_variance: float = 100.0
+    output_mode: str = "Full"
+
+    def download_font(self, font_url: str) -> str:
+        return fetch_font(font_url)
+
+    def get_font_path(self) -> Optional[str]:
+        if self.local_font and self.local_font != "None":
+            font_path = os.path.join(font_cache_dir, self.local_font)
+        elif self.local_font_path:
+            font_path = self.local_font_path
+        else:
+            font_path = self.download_font(self.font_url)
+
+        if not os.path.isfile(font_path):
+            print(
+                "\033[1;31mFont file not found. Please check the font file path.\033[0m"
+            )
+            return None
+        return font_path
+
+    def get_chars(self):
+        # Check for custom char range selected
+        if self.character_range == "Custom":
+            return self.custom_characters
+        return CHAR_SETS.get(self.character_range, [])
+
+    def prepare(self, font_path: str):
+        """The glyph set, matcher glyph stats and atlas for the font and charset.
+
+        Chars that render the same as an earlier one are left out of the
+        glyph set, they could never be picked. With drop_missing, so are
+        the chars the font lacks, which does change the result."""
+        glyphs = GLYPH_CACHE.matching_set(
+            font_path, self.font_size, self.get_chars(), self.drop_missing
+        )
+        glyph_stats = glyphs.derived(
+            self.comparison_type, GLYPH_STATS[self.comparison_type]
+        )
+        atlas = GLYPH_CACHE.atlas(
+            font_path, self.font_size, glyphs.chars, self.font_size, self.font_size
+        )
+        return glyphs, glyph_stats, atlas
+
+    def match(self, tiles: np.ndarray, glyphs, glyph_stats) -> np.ndarray:
+        instrumentation.count("cells", tiles.shape[0] * tiles.shape[1])
+        if self.tile_memo == "Off":
+            return self.match_tiles(tiles, glyphs, glyph_stats)
+
+        # Tiles already seen with this glyph set reuse their glyph, the memo
+        # lives as long as the glyph set stays in GLYPH_CACHE
+        bits = 8 if self.tile_memo == "Exact" else self.memo_bits
+        approximate = self.glyph_search == "Approximate Index"
+        key = ("memo", self.comparison_type, bits, approximate and self.index_probes)
+        memo = glyphs.derived(key, lambda m: TileMemo(glyphs.bitmaps.shape[1:], bits))
+        with instrumentation.phase("memo"):
+            return memo.match(
+                tiles, lambda t: self.match_tiles(t, glyphs, glyph_stats)
+            )
+
+    def match_tiles(self, tiles: np.ndarray, glyphs, glyph_stats) -> np.ndarray:
+        # Calculate which char is the closest matching using selected method
+        method = self.comparison_type
+        if self.glyph_search == "Exact Index" and method == "SAD":
+            # MSE scores every glyph with one matrix product already, so
+            # its exact search is the plain matcher
+            index = glyphs.derived(("exact index", method), SadBoundIndex)
+            with instrumentation.phase("match"):
+                return map_row_bands(
+                    index.search, tiles, self.parallel_mode, self.workers
+                )
+        if self.glyph_search == "Approximate Index" and method in INDEX_METRICS:
+            index = glyphs.derived(("index", method), lambda m: GlyphIndex(m, method))
+        else:
+            index = None
+        if index is not None and index.prunes(self.index_probes):
+            # glyph_comparisons are counted by the index, it skips most glyphs
+            with instrumentation.phase("match"):
+                return map_row_bands(
+                    lambda band: index.search(band, self.index_probes),
+                    tiles,
+                    self.parallel_mode,
+                    self.workers,
+                )
+
+        with instrumentation.phase("match"):
+            best_index = match_parallel(
+                method,
+                tiles,
+                glyphs.matrix,
+                glyph_stats,
+                self.parallel_mode,
+                self.workers,
+            )
+        instrumentation.count("glyph_comparisons", best_index.size * len(glyphs.chars))
+        return best_index
+
+    def comparison_array(self, image: Image.Image) -> np.ndarray:
+        if self.mono_comparison:
+            l_image = image.convert("1").convert("L")  # grayscale for comparison
+        else:
+            l_image = image.convert("L")  # grayscale for comparison
+        return np.array(l_image)
+
+    def matches_sums(self) -> bool:
+        # NAL only needs the pixel sum of every block, unless the tile memo
+        # needs the tiles themselves
+        return self.comparison_type == "NAL" and self.tile_memo == "Off"
+
+    def match_image(self, image: Image.Image, glyphs, glyph_stats) -> np.ndarray:
+        """Glyph index of every char sized block of an image.
+
+        When matches_sums(), the block sums are read from the image's summed
+        area table instead of cutting it into tiles.
+        """
+        if not self.matches_sums():
+            return self.match(self.image_to_char_tiles(image), glyphs, glyph_stats)
+        with instrumentation.phase("tiles"):
+            stats = BlockStats(self.comparison_array(image))
+            sums = stats.grid_sums(*stats.padded_edges(self.font_size, self.font_size))
+        instrumentation.count("cells", sums.size)
+        with instrumentation.phase("match"):
+            best_index = match_nal_sums(sums, glyph_stats)
+        instrumentation.count("glyph_comparisons", best_index.size * len(glyphs.chars))
+        return best_index
+
+    def image_to_char_tiles(self, image: Image.Image) -> np.ndarray:
+        with instrumentation.phase("tiles"):
+            # Split the image into a (rows, cols, pixels) grid of char sized tiles
+            return image_to_tiles(self.comparison_array(image), self.font_size, self.font_size)
+
+    def cell_colors(self, image: Image.Image, palette=None):
+        """Color of each char sized block, or 255 ink when not in color mode.
+
+        palette is a ColorStage.image_palette() shared by every band of an
+        image, without one an Adaptive palette is fitted to this image."""
+        if not self.color_mode:
+            return 255
+        with instrumentation.phase("colors"):
+            stage = from_options(ColorStage, self)
+            stats = BlockStats(np.array(image.convert("RGB")))
+            colors = stage.padded_sample(stats, self.font_size, self.font_size)
+            return stage.quantize(colors, palette).astype(int)
+
+    def grid(self, best_index: np.ndarray, colors) -> dict:
+        """The compact char and color grids kept in the result cache"""
+        if not self.color_mode:
+            return compact_grid(dict(chars=best_index))
+        return compact_grid(dict(chars=best_index, colors=colors))
+
+    def cache_key(self, image: Image.Image, font_path: str) -> Optional[str]:
+        # adaptive cells don't form one grid, they are always converted
+        if self.bypass_cache or self.adaptive_levels > 0:
+            return None
+        return RESULT_CACHE.key("anyfont", image, self, font_path)
+
+    def render_grid(self, grid: dict, size: tuple, atlas) -> Image.Image:
+        with instrumentation.phase("composite"):
+            return render_cells(
+                self,
+                atlas,
+                grid["chars"],
+                size,
+                "RGB" if self.color_mode else "L",
+                0,
+                grid.get("colors", 255),
+            )
+
+    def output_format(self, palette=None):
+        """(mode, palette) of images drawn before all their colors are known,
+        a band or frame at a time. Compact color images need a Uniform or
+        Adaptive palette (the ColorStage.image_palette()) to be indexed."""
+        mode = "RGB" if self.color_mode else "L"
+        if self.output_mode != "Compact":
+            return mode, None
+        if not self.color_mode:
+            return compact_mode(mode)
+        colors = from_options(ColorStage, self).known_colors(palette)
+        if colors is None:
+            return mode, None
+        return compact_mode(mode, 0, colors=colors)
+
+    def convert_image(self, input_image: Image.Image, font_path: str) -> Image.Image:
+        if self.adaptive_levels > 0:
+            return self.convert_adaptive(input_image, font_path)
+        glyphs, glyph_stats, atlas = self.prepare(font_path)
+        key = self.cache_key(input_image, font_path)
+        grid = RESULT_CACHE.get(key) if key else None
+        if grid is not None:
+            return self.render_grid(grid, input_image.size, atlas)
+
+        palette = from_options(ColorStage, self).image_palette(
+            input_image, self.font_size, self.font_size
+        )
+        mode, output_palette = self.output_format(palette)
+        mosaic = atlas.stream(input_image.size, mode, palette=output_palette)
+
+        # Convert, match and draw band_rows rows of chars at a time, so only
+        # one band of the converted and intermediate images is ever in memory
+        font_size = self.font_size
+        rows = -(-input_image.height // font_size)
+        step = self.band_rows if self.band_rows > 0 else rows
+        bands = []
+        for start in range(0, rows, step):
+            if step >= rows:
+                band_image = input_image
+            else:
+                band_image = input_image.crop(
+                    (
+                        0,
+                        start * font_size,
+                        input_image.width,
+                        min(rows, start + step) * font_size,
+                    )
+                )
+            best_index = self.match_image(band_image, glyphs, glyph_stats)
+            avg_color = self.cell_colors(band_image, palette)
+            with instrumentation.phase("composite"):
+                mosaic.add_rows(best_index, avg_color)
+            if key:
+                bands.append(self.grid(best_index, avg_color))
+
+        if key:
+            RESULT_CACHE.put(
+                key, {name: np.concatenate([b[name] for b in bands]) for name in bands[0]}
+            )
+        # Save the mosaic image.
+        return mosaic.finish()
+
+    def prepare_levels(self, font_path: str) -> list:
+        """prepare() for every cell size of the adaptive mode, smallest first.
+
+        Level k glyphs are drawn at font_size * 2^k but matched as reduced
+        down to font_size, against tiles reduced the same way."""
+        levels = [self.prepare(font_path)]
+        for level in range(1, self.adaptive_levels + 1):
+            size = self.font_size << level
+            glyphs = GLYPH_CACHE.reduced_set(
+                font_path, self.font_size, self.get_chars(), 1 << level, self.drop_missing
+            )
+            glyph_stats = glyphs.derived(
+                self.comparison_type, GLYPH_STATS[self.comparison_type]
+            )
+            atlas = GLYPH_CACHE.atlas(font_path, size, glyphs.chars, size, size)
+            levels.append((glyphs, glyph_stats, atlas))
+        return levels
+
+    def convert_adaptive(self, input_image: Image.Image, font_path: str) -> Image.Image:
+        """convert_image() with cells from font_size up to font_size * 2^adaptive_levels.
+
+        Cells of the largest size are split into four while their pixel
+        variance is above split_variance, so smooth areas get a few large
+        chars and detailed ones keep font_size chars. Every cell is matched
+        at the cost of a font_size cell, and glyphs are clipped to their
+        cells. band_rows counts rows of font_size cells as usual.
+        """
+        levels = self.prepare_levels(font_path)
+        top = self.font_size << self.adaptive_levels
+        stage = from_options(ColorStage, self)
+        palette = stage.image_palette(input_image, self.font_size, self.font_size)
+        mode, output_palette = self.output_format(palette)
+        # P images are drawn as palette indices
+        output = Image.new("L" if mode == "P" else mode, input_image.size)
+
+        rows = -(-input_image.height // top)
+        step = max(1, self.band_rows >> self.adaptive_levels) if self.band_rows > 0 else rows
+        for start in range(0, rows, step):
+            if step >= rows:
+                band_image = input_image
+            else:
+                band_image = input_image.crop(
+                    (0, start * top, input_image.width, min(rows, start + step) * top)
+                )
+            band = self.adaptive_band(band_image, levels, palette, mode, output_palette)
+            output.paste(band, (0, start * top))
+        if mode == "P":
+            output.putpalette(image_palette(output_palette))
+        return output
+
+    def adaptive_band(
+        self, image: Image.Image, levels: list, palette=None, mode="L", output_palette=None
+    ) -> Image.Image:
+        font_size = self.font_size
+        gray = self.comparison_array(image)
+        height, width = gray.shape
+        with instrumentation.phase("quadtree"):
+            pyramid = cell_pyramid(BlockStats(gray), font_size, len(levels) - 1)
+            variances = level_variances(pyramid, font_size, height, width)
+            leaves = quadtree_leaves(variances, self.split_variance)
+
+        # Work on a canvas of whole top level cells, so the cells of every
+        # level are plain reshapes of it and of its 2x2 sum pyramid
+        top = font_size << (len(levels) - 1)
+        canvas_h, canvas_w = -(-height // top) * top, -(-width // top) * top
+        padded = np.zeros((canvas_h, canvas_w), dtype=np.uint8)
+        padded[:height, :width] = gray
+        pixel_sums = sum_pyramid(padded, len(levels) - 1)
+
+        stage = from_options(ColorStage, self)
+        channels = 3 if mode == "RGB" else 1
+        background = 0
+        if mode == "P":
+            background = palette_indices(ink_colors(0, 3), output_palette)[0]
+        canvas = np.full((canvas_h, canvas_w, channels), background, dtype=np.uint8)
+        if self.color_mode:
+            # every level's cell colors come from the same summed area table
+            color_stats = BlockStats(np.array(image.convert("RGB")))
+
+        for level, (glyphs, glyph_stats, atlas) in enumerate(levels):
+            rows, cols = np.nonzero(leaves[level])
+            if len(rows) == 0:
+                continue
+            factor = 1 << level
+            size = font_size * factor
+            with instrumentation.phase("tiles"):
+                reduced = pixel_sums[level]
+                if factor > 1:
+                    reduced = np.rint(reduced / (factor * factor)).astype(np.uint8)
+                blocks = reduced.reshape(
+                    reduced.shape[0] // font_size, font_size, -1, font_size
+                )
+                tiles = blocks[rows, :, cols, :].reshape(len(rows), -1)
+            best_index = self.match(tiles[None], glyphs, glyph_stats)[0]
+
+            ink = 255
+            if self.color_mode:
+                with instrumentation.phase("colors"):
+                    colors = stage.padded_sample(color_stats, size, size)[rows, cols]
+                    ink = stage.quantize(colors, palette).astype(int)
+                    if mode == "P":
+                        ink = palette_indices(ink[None], output_palette)[0]
+            if mode in ("1", "P"):
+                atlas = atlas.binary()
+            with instrumentation.phase("composite"):
+                atlas.paint_cells(canvas, rows, cols, best_index, background, ink)
+
+        canvas = canvas[:height, :width]
+        if mode == "RGB":
+            return Image.fromarray(canvas)
+        if mode == "1":
+            return Image.fromarray(canvas[:, :, 0] >= 128)
+        return Image.fromarray(canvas[:, :, 0])
+
+    def convert_images_batched(self, images: list, font_path: str) -> list:
+        """Convert every image with one prepared glyph set.
+
+        Images of the same size have their tiles stacked into a single
+        tensor and are matched in one call.
+        """
+        if self.adaptive_levels > 0:
+            return [self.convert_adaptive(image, font_path) for image in images]
+        glyphs, glyph_stats, atlas = self.prepare(font_path)
+
+        # images already in the result cache are only composited
+        keys = [self.cache_key(image, font_path) for image in images]
+        grids = [RESULT_CACHE.get(key) if key else None for key in keys]
+
+        by_size = {}
+        for index, image in enumerate(images):
+            if grids[index] is None:
+                by_size.setdefault(image.size, []).append(index)
+
+        for size, indices in by_size.items():
+            if self.matches_sums():
+                best_index = np.concatenate(
+                    [self.match_image(images[i], glyphs, glyph_stats) for i in indices]
+                )
+            else:
+                tiles = np.concatenate([self.image_to_char_tiles(images[i]) for i in indices])
+                best_index = self.match(tiles, glyphs, glyph_stats)
+            for i, frame_index in zip(indices, np.split(best_index, len(indices))):
+                grids[i] = self.grid(frame_index, self.cell_colors(images[i]))
+                if keys[i]:
+                    RESULT_CACHE.put(keys[i], grids[i])
+
+        return [
+            self.render_grid(grid, image.size, atlas) for grid, image in zip(grids, images)
+        ]
+
+    def convert_animation(self, frames, font_path: str):
+        """Yield (frame, duration) for every converted frame, only re-matching
+        the tiles that changed by more than tolerance since the previous frame"""
+        if self.adaptive_levels > 0:
+            # the cells move with the content, so every frame is converted
+            for frame, duration in frames:
+                instrumentation.count("frames")
+                yield self.convert_adaptive(frame, font_path), duration
+            return
+        glyphs, glyph_stats, atlas = self.prepare(font_path)
+
+        tracker = DirtyTileTracker(self.tolerance)
+        stage = from_options(ColorStage, self)
+        previous = palette = mode = None
+        for frame, duration in frames:
+            # an Adaptive palette is fitted to the first frame only, so
+            # unchanged tiles keep their color from frame to frame
+            if palette is None:
+                palette = stage.image_palette(frame, self.font_size, self.font_size)
+            if mode is None:
+                mode, output_palette = self.output_format(palette)
+            tiles = self.image_to_char_tiles(frame)
+            colors = self.cell_colors(frame, palette) if self.color_mode else None
+            best_index, dirty = tracker.update(
+                tiles, lambda t: self.match(t, glyphs, glyph_stats), colors
+            )
+            ink = colors if self.color_mode else 255
+
+            with instrumentation.phase("composite"):
+                if previous is None or previous.size != frame.size:
+                    output = atlas.render(
+                        best_index, frame.size, mode, ink=ink, palette=output_palette
+                    )
+                else:
+                    # redraw only the rows of chars that contain changed tiles
+                    output = previous.copy()
+                    for start, end in row_ranges(dirty.any(axis=1)):
+                        atlas.redraw_rows(output, best_index, start, end, ink=ink)
+            previous = output
+            instrumentation.count("frames")
+            yield output, duration
+
+        instrumentation.count("tiles_matched", tracker.matched)
+        instrumentation.count("tiles_reused", tracker.total - tracker.matched)
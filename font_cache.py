@@ -0,0 +1,266 @@
+# repo - https://github.com/mickr777/imagetoasciiimage
+# Process wide cache of fonts, rasterized glyphs and their derived statistics.
+
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+
+from . import instrumentation
+from .glyph_atlas import GlyphAtlas
+
+font_cache_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "font_cache")
+glyph_cache_dir = os.path.join(font_cache_dir, "glyph_cache")
+
+# A noncharacter no font maps, so it always renders as the font's .notdef
+# glyph (usually a box), the same as every code point the font lacks
+MISSING_CHAR = chr(0x10FFFF)
+
+# Bump when a change to rasterize_glyphs() changes the bitmaps, so stale
+# glyph files on disk are not read back
+RASTER_VERSION = 2
+
+
+_font_hashes = {}
+
+
+def font_file_hash(font_path: str) -> str:
+    """SHA-1 of the font file contents, remembered per path, size and mtime."""
+    stat = os.stat(font_path)
+    key = (os.path.abspath(font_path), stat.st_size, stat.st_mtime_ns)
+    if key not in _font_hashes:
+        digest = hashlib.sha1()
+        with open(font_path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 16), b""):
+                digest.update(chunk)
+        _font_hashes[key] = digest.hexdigest()
+    return _font_hashes[key]
+
+
+def rasterize_glyphs(font, font_size: int, chars) -> np.ndarray:
+    """Render each char in a font_size square, as (n, size, size) uint8.
+
+    Chars are drawn at the top left corner of the square, the same place
+    GlyphAtlas draws them in their cell, so every cell is matched against
+    the glyph it will show.
+    """
+    bitmaps = np.zeros((len(chars), font_size, font_size), dtype=np.uint8)
+    for index, c in enumerate(chars):
+        img = Image.new("L", (font_size, font_size))
+        ImageDraw.Draw(img).text((0, 0), c, font=font, fill=255)
+        bitmaps[index] = np.array(img)
+    return bitmaps
+
+
+def prune_glyphs(chars, bitmaps: np.ndarray, missing: Optional[np.ndarray] = None):
+    """Indices of the glyphs worth matching against, in charset order.
+
+    Glyphs with the same bitmap as an earlier one are dropped: matchers
+    pick the first of equal scores, so the later copies could never be
+    chosen and the result doesn't change. When the .notdef bitmap
+    `missing` is given, glyphs identical to it are chars the font lacks
+    and are dropped as well. That does change the cells whose closest
+    glyph was the .notdef box.
+    """
+    matrix = bitmaps.reshape(len(chars), -1)
+    _, first = np.unique(matrix, axis=0, return_index=True)
+    keep = np.sort(first)
+    # a blank .notdef can't be told apart from a space, keep it then
+    if missing is not None and missing.any():
+        covered = keep[(matrix[keep] != missing.reshape(-1)).any(axis=1)]
+        if len(covered):
+            keep = covered
+    return keep
+
+
+def reduce_bitmaps(bitmaps: np.ndarray, factor: int) -> np.ndarray:
+    """(n, h, w) uint8 bitmaps box averaged down by factor on each side."""
+    n, height, width = bitmaps.shape
+    blocks = bitmaps.reshape(n, height // factor, factor, width // factor, factor)
+    return np.rint(blocks.mean(axis=(2, 4))).astype(np.uint8)
+
+
+class GlyphSet:
+    """The glyph bitmaps of one font, size and charset.
+
+    Statistics derived from the bitmaps (matcher glyph stats, lookup tables,
+    ...) are built on first use and kept with the set, so they live exactly
+    as long as the cached bitmaps do.
+    """
+
+    def __init__(self, chars, bitmaps: np.ndarray):
+        self.chars = list(chars)
+        self.bitmaps = bitmaps
+        self.matrix = bitmaps.reshape(len(self.chars), -1)
+        self._derived = {}
+        self._lock = threading.Lock()
+
+    def char_images(self) -> dict:
+        return dict(zip(self.chars, self.bitmaps))
+
+    def derived(self, name, build):
+        with self._lock:
+            if name not in self._derived:
+                self._derived[name] = build(self.matrix)
+            return self._derived[name]
+
+
+class FontCache:
+    """Bounded LRU of font objects, glyph sets and glyph atlases.
+
+    Entries are keyed by the font file content hash rather than its path, so
+    the same font downloaded or copied to a different place is shared.
+    Glyph bitmaps are also written to compact .npz files in cache_dir so a
+    restarted process can skip rasterization entirely.
+    """
+
+    def __init__(self, max_entries: int = 64, cache_dir: str = glyph_cache_dir):
+        self.max_entries = max_entries
+        self.cache_dir = cache_dir
+        self.hits = 0
+        self.misses = 0
+        self.disk_hits = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _font_key(self, font_path):
+        return "default" if font_path is None else font_file_hash(font_path)
+
+    def _get(self, key, build):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                instrumentation.count("font_cache_hits")
+                return self._entries[key]
+            self.misses += 1
+        instrumentation.count("font_cache_misses")
+
+        value = build()
+
+        with self._lock:
+            value = self._entries.setdefault(key, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return value
+
+    def font(self, font_path, font_size: int):
+        """FreeType font for a file, or PIL's default font when font_path is None."""
+        key = ("font", self._font_key(font_path), font_size)
+        if font_path is None:
+            return self._get(key, ImageFont.load_default)
+        return self._get(key, lambda: ImageFont.truetype(font_path, font_size))
+
+    def glyph_set(self, font_path: str, font_size: int, chars) -> GlyphSet:
+        """Glyph bitmaps for the charset, duplicates keep their first place."""
+        chars = "".join(dict.fromkeys(chars))
+        key = ("glyphs", self._font_key(font_path), font_size, chars)
+        return self._get(key, lambda: self._load_glyph_set(key, font_path, font_size, chars))
+
+    def matching_set(
+        self, font_path: str, font_size: int, chars, drop_missing: bool = False
+    ) -> GlyphSet:
+        """glyph_set() without duplicate bitmaps, and without the chars the
+        font lacks when drop_missing is set."""
+        chars = "".join(dict.fromkeys(chars))
+        key = ("matching", self._font_key(font_path), font_size, chars, drop_missing)
+
+        def build():
+            glyphs = self.glyph_set(font_path, font_size, chars)
+            missing = None
+            if drop_missing:
+                font = self.font(font_path, font_size)
+                missing = rasterize_glyphs(font, font_size, MISSING_CHAR)
+            keep = prune_glyphs(glyphs.chars, glyphs.bitmaps, missing)
+            instrumentation.count("glyphs_pruned", len(glyphs.chars) - len(keep))
+            if len(keep) == len(glyphs.chars):
+                return glyphs
+            return GlyphSet([glyphs.chars[i] for i in keep], glyphs.bitmaps[keep])
+
+        return self._get(key, build)
+
+    def reduced_set(
+        self, font_path: str, font_size: int, chars, factor: int, drop_missing: bool = False
+    ) -> GlyphSet:
+        """matching_set() at font_size * factor, box averaged back down to font_size.
+
+        Cells factor times the size can then be matched on tiles reduced the
+        same way, at the cost of one font_size cell. Glyphs that reduce to
+        the same bitmap as an earlier one are dropped, the chars are the
+        ones to draw at the large size.
+        """
+        chars = "".join(dict.fromkeys(chars))
+        key = ("reduced", self._font_key(font_path), font_size, chars, factor, drop_missing)
+
+        def build():
+            glyphs = self.matching_set(font_path, font_size * factor, chars, drop_missing)
+            bitmaps = reduce_bitmaps(glyphs.bitmaps, factor)
+            keep = prune_glyphs(glyphs.chars, bitmaps)
+            return GlyphSet([glyphs.chars[i] for i in keep], bitmaps[keep])
+
+        return self._get(key, build)
+
+    def atlas(self, font_path, font_size: int, chars, cell_w: int, cell_h: int) -> GlyphAtlas:
+        """Glyph atlas for drawing chars at the top left of each cell."""
+        chars = "".join(chars)
+        key = ("atlas", self._font_key(font_path), font_size, chars, cell_w, cell_h)
+
+        def build():
+            font = self.font(font_path, font_size)
+            with instrumentation.phase("atlas"):
+                return GlyphAtlas(font, chars, cell_w, cell_h)
+
+        return self._get(key, build)
+
+    def _disk_path(self, key) -> str:
+        name = hashlib.sha1(repr((RASTER_VERSION, key)).encode("utf-8")).hexdigest()
+        return os.path.join(self.cache_dir, f"{name}.npz")
+
+    def _load_glyph_set(self, key, font_path, font_size, chars) -> GlyphSet:
+        codepoints = np.array([ord(c) for c in chars], dtype=np.uint32)
+        path = self._disk_path(key)
+        if self.cache_dir and os.path.isfile(path):
+            try:
+                with np.load(path) as data:
+                    if np.array_equal(data["codepoints"], codepoints):
+                        self.disk_hits += 1
+                        instrumentation.count("glyph_disk_hits")
+                        return GlyphSet(chars, data["bitmaps"])
+            except (OSError, ValueError, KeyError):
+                pass  # unreadable or stale file, rebuild it below
+
+        font = self.font(font_path, font_size)
+        with instrumentation.phase("rasterize"):
+            bitmaps = rasterize_glyphs(font, font_size, chars)
+        if self.cache_dir:
+            try:
+                os.makedirs(self.cache_dir, exist_ok=True)
+                tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+                with open(tmp_path, "wb") as f:
+                    np.savez_compressed(f, codepoints=codepoints, bitmaps=bitmaps)
+                os.replace(tmp_path, path)
+            except OSError as e:
+                print(f"Unable to write glyph cache {path}: {e}")
+        return GlyphSet(chars, bitmaps)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(
+                entries=len(self._entries),
+                max_entries=self.max_entries,
+                hits=self.hits,
+                misses=self.misses,
+                disk_hits=self.disk_hits,
+            )
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+GLYPH_CACHE = FontCache()
@@ -0,0 +1,219 @@
+# repo - https://github.com/mickr777/imagetoasciiimage
+# Downloading fonts into font_cache safely when several processes want the same font.
+
+import hashlib
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from urllib.parse import unquote, urlparse
+
+from PIL import ImageFont
+
+from . import instrumentation
+from .font_cache import font_cache_dir, font_file_hash
+
+INDEX_NAME = "font_index.json"
+
+# (connect, read) seconds for each request
+TIMEOUT = (10, 60)
+RETRIES = 3
+BACKOFF = 0.5
+MAX_FONT_BYTES = 64 << 20
+
+
+class FontFetchError(RuntimeError):
+    """A font could not be downloaded, or what was downloaded is not a font."""
+
+
+@contextmanager
+def file_lock(path: str, timeout: float = 300.0, poll: float = 0.1):
+    """Exclusive lock on path shared by every thread and process using it."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "a+b") as f:
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                _try_lock(f)
+                break
+            except OSError:
+                if time.monotonic() > deadline:
+                    raise TimeoutError(f"Timed out waiting for lock {path}")
+                time.sleep(poll)
+        try:
+            yield
+        finally:
+            _unlock(f)
+
+
+if os.name == "nt":
+    import msvcrt
+
+    def _try_lock(f):
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+
+    def _unlock(f):
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+else:
+    import fcntl
+
+    def _try_lock(f):
+        fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+
+    def _unlock(f):
+        fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def is_valid_font(path: str) -> bool:
+    """True if FreeType can load path as a font."""
+    try:
+        ImageFont.truetype(path, 12)
+        return True
+    except (OSError, ValueError):
+        return False
+
+
+def url_filename(url: str) -> str:
+    return os.path.basename(unquote(urlparse(url).path)) or "font.ttf"
+
+
+def _read_index(cache_dir: str) -> dict:
+    try:
+        with open(os.path.join(cache_dir, INDEX_NAME), encoding="utf-8") as f:
+            index = json.load(f)
+    except (OSError, ValueError):
+        index = {}
+    index.setdefault("urls", {})
+    index.setdefault("hashes", {})
+    return index
+
+
+def _update_index(cache_dir: str, url: str, font_path: str, digest: str):
+    """Record url -> file and content hash -> file, written atomically."""
+    with file_lock(os.path.join(cache_dir, ".font_index.lock")):
+        index = _read_index(cache_dir)
+        name = os.path.basename(font_path)
+        index["urls"][url] = dict(file=name, sha1=digest)
+        index["hashes"][digest] = name
+        path = os.path.join(cache_dir, INDEX_NAME)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(index, f, indent=1, sort_keys=True)
+        os.replace(tmp_path, path)
+
+
+def cached_font(url: str, cache_dir: str = font_cache_dir):
+    """Path of the indexed font for url if it is still there and unchanged, else None."""
+    entry = _read_index(cache_dir)["urls"].get(url)
+    if entry is None:
+        return None
+    font_path = os.path.join(cache_dir, entry["file"])
+    if os.path.isfile(font_path) and font_file_hash(font_path) == entry["sha1"]:
+        return font_path
+    return None
+
+
+def _download(url: str, tmp_path: str, timeout, retries: int, backoff: float) -> int:
+    """Stream url to tmp_path, retrying connection errors, timeouts and 5xx/429."""
+    import requests
+
+    for attempt in range(retries + 1):
+        try:
+            with requests.get(url, stream=True, timeout=timeout) as response:
+                if response.status_code == 429 or response.status_code >= 500:
+                    raise requests.HTTPError(
+                        f"{response.status_code} from {url}", response=response
+                    )
+                response.raise_for_status()
+                # Content-Length counts the encoded bytes when the body is compressed
+                expected = 0
+                if not response.headers.get("Content-Encoding"):
+                    expected = int(response.headers.get("Content-Length") or 0)
+                size = 0
+                with open(tmp_path, "wb") as f:
+                    for chunk in response.iter_content(chunk_size=1 << 16):
+                        size += len(chunk)
+                        if size > MAX_FONT_BYTES:
+                            raise FontFetchError(f"{url} is too large for a font")
+                        f.write(chunk)
+                if expected and size != expected:
+                    raise requests.ConnectionError(
+                        f"{url} ended after {size} of {expected} bytes"
+                    )
+                return size
+        except requests.HTTPError as e:
+            status = e.response.status_code if e.response is not None else 0
+            if (status != 429 and status < 500) or attempt == retries:
+                raise FontFetchError(f"Error downloading font from {url}: {e}") from e
+        except (
+            requests.ConnectionError,
+            requests.Timeout,
+            requests.exceptions.ChunkedEncodingError,
+        ) as e:
+            if attempt == retries:
+                raise FontFetchError(f"Error downloading font from {url}: {e}") from e
+        time.sleep(backoff * 2**attempt)
+
+
+def fetch_font(
+    url: str,
+    cache_dir: str = font_cache_dir,
+    filename: str = None,
+    timeout=TIMEOUT,
+    retries: int = RETRIES,
+    backoff: float = BACKOFF,
+) -> str:
+    """Path of the font at url in cache_dir, downloading it only if needed.
+
+    Fonts are indexed by URL and by content hash. The download is streamed
+    to a temporary file, checked to be a loadable font and then renamed
+    into place, so a crash never leaves a truncated font behind. A lock
+    file per URL makes concurrent callers, in this or other processes,
+    wait for one download instead of each fetching the font.
+    """
+    font_path = cached_font(url, cache_dir)
+    if font_path is not None:
+        return font_path
+
+    font_path = os.path.join(cache_dir, filename or url_filename(url))
+    lock_name = hashlib.sha1(url.encode("utf-8")).hexdigest()[:16]
+    with file_lock(os.path.join(cache_dir, f".{lock_name}.lock")):
+        cached = cached_font(url, cache_dir)
+        if cached is not None:
+            return cached  # downloaded by whoever held the lock before us
+
+        # a font put in place before there was an index, or copied in by hand
+        if os.path.isfile(font_path) and is_valid_font(font_path):
+            _update_index(cache_dir, url, font_path, font_file_hash(font_path))
+            return font_path
+
+        print("Font not found in cache, downloading...")
+        tmp_path = f"{font_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with instrumentation.phase("font_download"):
+                size = _download(url, tmp_path, timeout, retries, backoff)
+            instrumentation.count("bytes_downloaded", size)
+            if not is_valid_font(tmp_path):
+                raise FontFetchError(f"{url} did not return a font file")
+
+            digest = hashlib.sha1()
+            with open(tmp_path, "rb") as f:
+                for chunk in iter(lambda: f.read(1 << 16), b""):
+                    digest.update(chunk)
+            digest = digest.hexdigest()
+
+            # the same font under another URL is already cached
+            existing = _read_index(cache_dir)["hashes"].get(digest)
+            if existing and os.path.isfile(os.path.join(cache_dir, existing)):
+                font_path = os.path.join(cache_dir, existing)
+            else:
+                os.replace(tmp_path, font_path)
+            _update_index(cache_dir, url, font_path, digest)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+    return font_path
@@ -0,0 +1,291 @@
+# repo - https://github.com/mickr777/imagetoasciiimage
+# Glyph atlas compositor shared by the ASCII, Unicode and AnyFont nodes.
+
+import copy
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+from .output_modes import image_palette, ink_colors, palette_indices
+
+
+# Cell rows composited per band when rendering a whole grid at once
+RENDER_BAND_ROWS = 32
+
+
+def _div255(values: np.ndarray) -> np.ndarray:
+    # Same rounding PIL uses when it blends a text mask into an image
+    values = values + 128
+    return (values + (values >> 8)) >> 8
+
+
+class GlyphAtlas:
+    """Alpha masks for a charset, rasterized once and composited by index.
+
+    Every glyph is drawn at the origin of its own tile exactly as
+    ImageDraw.text() would draw it at the top left corner of a cell. Tiles
+    are at least one cell in size but grow to fit glyphs that overhang the
+    cell, so fonts larger than the cell spacing still render in full.
+
+    Besides "L" and "RGB", images can be drawn as "1" or "P" images. Those
+    use the binary() masks, so every pixel is either ink or background.
+    """
+
+    def __init__(self, font, chars, cell_w: int, cell_h: int):
+        self.chars = list(chars)
+        self.cell_w = cell_w
+        self.cell_h = cell_h
+
+        draw = ImageDraw.Draw(Image.new("L", (1, 1)))
+        left = top = 0
+        right, bottom = cell_w, cell_h
+        for c in self.chars:
+            bbox = draw.textbbox((0, 0), c, font=font)
+            left, top = min(left, bbox[0]), min(top, bbox[1])
+            right, bottom = max(right, bbox[2]), max(bottom, bbox[3])
+        # offset of the cell origin inside the tile, for glyphs that reach
+        # left of or above their cell
+        self.origin_x, self.origin_y = -left, -top
+        self.tile_w = right - left
+        self.tile_h = bottom - top
+
+        self.masks = np.zeros((len(self.chars), self.tile_h, self.tile_w), dtype=np.uint8)
+        for index, c in enumerate(self.chars):
+            img = Image.new("L", (self.tile_w, self.tile_h))
+            ImageDraw.Draw(img).text(
+                (self.origin_x, self.origin_y), c, font=font, fill=255
+            )
+            self.masks[index] = np.array(img)
+        self._binary = None
+
+    def binary(self) -> "GlyphAtlas":
+        """This atlas with every mask pixel fully on or off.
+
+        Each mask is error diffused rather than thresholded, so shading
+        glyphs like ░▒▓ and the edges of small glyphs keep their coverage.
+        """
+        if self._binary is None:
+            binary = copy.copy(self)
+            binary.masks = np.zeros_like(self.masks)
+            for index, mask in enumerate(self.masks):
+                binary.masks[index] = np.array(Image.fromarray(mask).convert("1")) * 255
+            binary._binary = binary
+            self._binary = binary
+        return self._binary
+
+    def stream(
+        self, size: tuple, mode: str = "L", background=0, palette=None
+    ) -> "AtlasStream":
+        """Start an output image that is composited a band of cell rows at a time."""
+        return AtlasStream(self, size, mode, background, palette)
+
+    def render(
+        self,
+        index_grid: np.ndarray,
+        size: tuple,
+        mode: str = "L",
+        background=0,
+        ink=255,
+        band_rows: int = RENDER_BAND_ROWS,
+        palette=None,
+    ) -> Image.Image:
+        """Composite the glyphs of a (rows, cols) index grid into a new image.
+
+        ink is either one fill value for every cell or a (rows, cols) /
+        (rows, cols, channels) grid of per cell colors. "P" images take the
+        (k, C) palette the background and ink colors are drawn from.
+        """
+        stream = self.stream(size, mode, background, palette)
+        ink = np.asarray(ink)
+        for start in range(0, index_grid.shape[0], max(1, band_rows)):
+            rows = slice(start, start + max(1, band_rows))
+            stream.add_rows(index_grid[rows], ink[rows] if ink.ndim >= 2 else ink)
+        return stream.finish()
+
+    def cell_masks(self) -> np.ndarray:
+        """(n, cell_h, cell_w) part of every glyph mask inside its own cell."""
+        return self.masks[
+            :,
+            self.origin_y : self.origin_y + self.cell_h,
+            self.origin_x : self.origin_x + self.cell_w,
+        ]
+
+    def paint_cells(self, canvas: np.ndarray, rows, cols, index, background=0, ink=255):
+        """Blend the glyphs of cells (rows[i], cols[i]) into a canvas of background.
+
+        canvas is an (H, W, channels) uint8 array whose sides are whole
+        numbers of cells. Each glyph is clipped to its cell, so cells of
+        several atlases can share a canvas without overlapping. ink is one
+        fill value or an (n[, channels]) color per cell.
+        """
+        height, width, channels = canvas.shape
+        cells = canvas.reshape(
+            height // self.cell_h, self.cell_h, width // self.cell_w, self.cell_w, channels
+        )
+        # 255 * 255 + 255 still fits, so the blend runs in 16 bits
+        alpha = self.cell_masks()[index][..., None].astype(np.uint16)
+        ink = np.asarray(ink).astype(np.uint16)
+        if ink.ndim == 0:
+            ink = np.broadcast_to(ink, (1, channels))
+        ink = ink.reshape(-1, 1, 1, ink.shape[-1] if ink.ndim == 2 else 1)
+        background = np.reshape(background, -1)[:channels].astype(np.uint16)
+        cells[rows, :, cols, :] = _div255(background * (255 - alpha) + ink * alpha)
+
+    def redraw_rows(
+        self,
+        image: Image.Image,
+        index_grid: np.ndarray,
+        first_row: int,
+        last_row: int,
+        background=0,
+        ink=255,
+    ) -> None:
+        """Re-composite cell rows first_row:last_row of an already rendered image.
+
+        Neighbouring rows whose glyphs overhang into the range are drawn
+        again as well, so the pixels written back are exactly what a full
+        render of index_grid would produce.
+        """
+        rows = index_grid.shape[0]
+        reach = -(-self.tile_h // self.cell_h)
+        start, end = max(0, first_row - reach), min(rows, last_row + reach)
+        top = start * self.cell_h
+        height = (image.height if end == rows else end * self.cell_h) - top
+        if height <= 0:
+            return
+
+        ink = np.asarray(ink)
+        palette = None
+        if image.mode == "P":
+            palette = np.reshape(image.getpalette(), (-1, 3))
+        strip = self.render(
+            index_grid[start:end],
+            (image.width, height),
+            image.mode,
+            background,
+            ink[start:end] if ink.ndim >= 2 else ink,
+            palette=palette,
+        )
+        keep_top = first_row * self.cell_h - top
+        image.paste(
+            strip.crop((0, keep_top, image.width, height)), (0, top + keep_top)
+        )
+
+
+class AtlasStream:
+    """Composites consecutive bands of cell rows into an output image.
+
+    Only a strip one band plus one glyph tile tall is held as a working
+    buffer; pixel rows no later band can touch are written into the output
+    image as soon as a band is done, so memory grows with the width of the
+    image rather than its area.
+
+    "1" images are composited as 0/255 levels and "P" images as indices
+    into palette, straight into the output image without an "L" or "RGB"
+    copy of it.
+    """
+
+    def __init__(
+        self, atlas: GlyphAtlas, size: tuple, mode: str = "L", background=0, palette=None
+    ):
+        self.size = size
+        self.mode = mode
+        self.palette = palette
+        if mode in ("1", "P"):
+            atlas = atlas.binary()
+        self.atlas = atlas
+        self.channels = 3 if mode == "RGB" else 1
+        self.background = self._ink_colors(background).reshape(-1)[: self.channels]
+        image_mode = "L" if mode == "P" else mode
+        self.image = Image.new(image_mode, size, tuple(int(v) for v in self.background))
+
+        # number of cells a tile can reach into across, cells that are this
+        # far apart never overlap so each of them is one scatter and blend
+        self.span_x = -(-atlas.tile_w // atlas.cell_w)
+        self.next_row = 0
+        # strip of canvas rows, canvas row 0 is atlas.origin_y above the image
+        self.strip_y = 0
+        self.strip = np.empty((0, 0, self.channels), dtype=np.int32)
+
+    def _ink_colors(self, ink) -> np.ndarray:
+        """Palette indices of P images' ink colors, other inks as they are."""
+        if self.mode != "P":
+            return np.asarray(ink)
+        indices = palette_indices(ink_colors(ink, self.palette.shape[1]), self.palette)
+        return indices if np.ndim(ink) >= 2 else indices[0]
+
+    def _ink_grid(self, ink, rows: int, cols: int) -> np.ndarray:
+        ink = np.asarray(self._ink_colors(ink), dtype=np.int32)
+        if ink.ndim < 2:
+            return np.broadcast_to(
+                np.reshape(ink, -1)[: self.channels], (rows, cols, self.channels)
+            )
+        if ink.ndim == 2:
+            return np.repeat(ink[:, :, None], self.channels, axis=2)
+        return ink[:, :, : self.channels]
+
+    def add_rows(self, index_rows: np.ndarray, ink=255) -> None:
+        """Blend the next (n, cols) block of cells below the rows already added."""
+        atlas = self.atlas
+        n_rows, cols = index_rows.shape
+        if n_rows == 0:
+            return
+        cell_h, cell_w, tile_h = atlas.cell_h, atlas.cell_w, atlas.tile_h
+        slot_w = self.span_x * cell_w
+        ink = self._ink_grid(ink, n_rows, cols)
+
+        # grow the strip down to cover every tile of the new rows
+        width = (cols + self.span_x) * cell_w
+        needed = (self.next_row + n_rows) * cell_h + tile_h - self.strip_y
+        strip = np.empty((needed, max(width, self.strip.shape[1]), self.channels), dtype=np.int32)
+        strip[:] = self.background
+        strip[: self.strip.shape[0], : self.strip.shape[1]] = self.strip
+        self.strip = strip
+
+        # Rows are blended top to bottom so glyphs that overhang the cell
+        # below are drawn over in the same order as per cell draw.text calls.
+        for band_row in range(n_rows):
+            y0 = (self.next_row + band_row) * cell_h - self.strip_y
+            for offset_x in range(self.span_x):
+                sub_index = index_rows[band_row, offset_x :: self.span_x]
+                if sub_index.size == 0:
+                    continue
+
+                slots = np.zeros((tile_h, sub_index.size, slot_w), dtype=np.int32)
+                slots[:, :, : atlas.tile_w] = atlas.masks[sub_index].swapaxes(0, 1)
+                alpha = slots.reshape(tile_h, -1, 1)
+
+                sub_ink = np.repeat(ink[band_row, offset_x :: self.span_x], slot_w, axis=0)
+
+                x0 = offset_x * cell_w
+                region = self.strip[y0 : y0 + tile_h, x0 : x0 + alpha.shape[1]]
+                region[:] = _div255(region * (255 - alpha) + sub_ink * alpha)
+
+        self.next_row += n_rows
+        # canvas rows above the next cell row are final
+        self._flush(self.next_row * cell_h - self.strip_y)
+
+    def _flush(self, n_lines: int) -> None:
+        done, self.strip = self.strip[:n_lines], self.strip[n_lines:]
+        top = self.strip_y - self.atlas.origin_y
+        self.strip_y += n_lines
+
+        width, height = self.size
+        start, end = max(0, top), min(height, top + done.shape[0])
+        if start >= end:
+            return
+        block = done[start - top : end - top, self.atlas.origin_x : self.atlas.origin_x + width]
+        block = block.astype(np.uint8)
+        if self.mode == "RGB":
+            block = Image.fromarray(block, "RGB")
+        elif self.mode == "1":
+            block = Image.fromarray(block[:, :, 0] >= 128)
+        else:
+            block = Image.fromarray(block[:, :, 0], "L")
+        self.image.paste(block, (0, start))
+
+    def finish(self) -> Image.Image:
+        self._flush(self.strip.shape[0])
+        if self.mode == "P":
+            self.image.putpalette(image_palette(self.palette))
+        return self.image
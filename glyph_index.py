@@ -0,0 +1,204 @@
+# repo - https://github.com/mickr777/imagetoasciiimage
+# Nearest glyph searches for large charsets, for the SAD and MSE matchers.
+
+from typing import Literal
+
+import numpy as np
+
+from . import instrumentation
+from .matching import CHUNK_ELEMENTS
+
+GLYPH_SEARCH_MODES = Literal["Brute Force", "Exact Index", "Approximate Index"]
+
+# Matchers whose score is a distance, so glyphs near the same centroid
+# score alike against a tile
+INDEX_METRICS = ("SAD", "MSE")
+
+KMEANS_ITERATIONS = 15
+
+
+def kmeans_glyphs(glyphs: np.ndarray, n_clusters: int, iterations: int = KMEANS_ITERATIONS):
+    """Deterministic k-means of the glyph bitmaps, returns (centroids, labels).
+
+    The starting centroids are glyphs spread evenly over the luminance
+    order, so the same charset always gives the same clusters. Clusters
+    that end up empty are dropped.
+    """
+    glyphs = glyphs.astype(np.float64)
+    order = np.argsort(glyphs.sum(axis=1), kind="stable")
+    centroids = glyphs[order[np.linspace(0, len(glyphs) - 1, n_clusters).astype(int)]]
+    glyph_norms = np.einsum("ij,ij->i", glyphs, glyphs)
+
+    def assign(centroids):
+        distances = (
+            glyph_norms[:, None]
+            - 2.0 * glyphs @ centroids.T
+            + np.einsum("ij,ij->i", centroids, centroids)[None, :]
+        )
+        return distances.argmin(axis=1)
+
+    for _ in range(iterations):
+        labels = assign(centroids)
+        counts = np.bincount(labels, minlength=len(centroids))
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, labels, glyphs)
+        filled = counts > 0
+        centroids[filled] = sums[filled] / counts[filled, None]
+
+    labels = assign(centroids)
+    used, labels = np.unique(labels, return_inverse=True)
+    return centroids[used], labels
+
+
+class GlyphIndex:
+    """Glyphs of one charset grouped into about sqrt(n) clusters.
+
+    A search visits the clusters nearest to each tile first and only
+    scores the glyphs inside them, so per tile work grows with the cluster
+    size instead of the charset size. Searches stop after `probes`
+    clusters, so they may miss a closer glyph in a cluster further away.
+    """
+
+    def __init__(self, glyphs: np.ndarray, metric: str, n_clusters: int = 0):
+        if metric not in INDEX_METRICS:
+            raise ValueError(f"No glyph index for {metric}")
+        self.metric = metric
+        self.n_glyphs = len(glyphs)
+        self.score_glyphs = glyphs.astype(np.int16 if metric == "SAD" else np.float64)
+        self.glyph_norms = np.einsum(
+            "ij,ij->i", glyphs.astype(np.float64), glyphs.astype(np.float64)
+        )
+
+        n_clusters = n_clusters or max(1, int(round(np.sqrt(self.n_glyphs))))
+        self.centroids, labels = kmeans_glyphs(glyphs, min(n_clusters, self.n_glyphs))
+        self.members = [np.flatnonzero(labels == c) for c in range(len(self.centroids))]
+
+    def prunes(self, probes: int) -> bool:
+        """Whether a search with this many probes skips any cluster, when it
+        doesn't the plain matcher gives the same glyphs faster."""
+        return probes < len(self.centroids)
+
+    def _distance(self, points: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+        """(n, k) L1 (SAD) or L2 (MSE) distances between points and centroids."""
+        if self.metric == "MSE":
+            squared = (
+                np.einsum("ij,ij->i", points, points)[:, None]
+                - 2.0 * points @ centroids.T
+                + np.einsum("ij,ij->i", centroids, centroids)[None, :]
+            )
+            return np.sqrt(np.maximum(squared, 0))
+        distances = np.empty((len(points), len(centroids)))
+        step = max(1, CHUNK_ELEMENTS // max(1, centroids.size))
+        for start in range(0, len(points), step):
+            block = points[start : start + step, None, :] - centroids[None, :, :]
+            distances[start : start + step] = np.abs(block).sum(axis=2)
+        return distances
+
+    def _score_keys(self, flat: np.ndarray, members: np.ndarray) -> np.ndarray:
+        """Matcher scores of tiles against some glyphs, as score * n + glyph index.
+
+        Taking the smallest key breaks ties towards the lower glyph index,
+        the same as argmin over the whole charset does.
+        """
+        glyphs = self.score_glyphs[members]
+        if self.metric == "SAD":
+            tiles = flat.astype(np.int16)
+            scores = np.empty((len(flat), len(members)), dtype=np.int64)
+            step = max(1, CHUNK_ELEMENTS // max(1, glyphs.size))
+            for start in range(0, len(flat), step):
+                block = tiles[start : start + step, None, :] - glyphs[None, :, :]
+                scores[start : start + step] = np.abs(block).sum(axis=2, dtype=np.int32)
+        else:
+            # |g|^2 - 2 t.g, exact in float64 for 8 bit images
+            scores = (
+                self.glyph_norms[members][None, :] - 2.0 * (flat.astype(np.float64) @ glyphs.T)
+            ).astype(np.int64)
+        return scores * self.n_glyphs + members[None, :]
+
+    def search(self, tiles: np.ndarray, probes: int = 2) -> np.ndarray:
+        """Index of the closest glyph in the `probes` nearest clusters for
+        every tile of a (..., pixels) tensor."""
+        flat = tiles.reshape(-1, tiles.shape[-1])
+        n_tiles, n_clusters = len(flat), len(self.centroids)
+        centroid_distances = self._distance(flat.astype(np.float64), self.centroids)
+        visit_order = np.argsort(centroid_distances, axis=1, kind="stable")
+
+        best_keys = np.full(n_tiles, np.iinfo(np.int64).max)
+        all_tiles = np.arange(n_tiles)
+        compared = 0
+        for visit in range(min(probes, n_clusters)):
+            # score every tile against the glyphs of its next nearest
+            # cluster, one dense block per cluster
+            clusters = visit_order[:, visit]
+            by_cluster = np.argsort(clusters, kind="stable")
+            splits = np.flatnonzero(np.diff(clusters[by_cluster])) + 1
+            for rows in np.split(all_tiles[by_cluster], splits):
+                members = self.members[clusters[rows[0]]]
+                keys = self._score_keys(flat[rows], members).min(axis=1)
+                best_keys[rows] = np.minimum(best_keys[rows], keys)
+                compared += len(rows) * len(members)
+        best_index = best_keys % self.n_glyphs
+        instrumentation.count("glyph_comparisons", compared)
+        return best_index.reshape(tiles.shape[:-1])
+
+
+class SadBoundIndex:
+    """Exact SAD search that only scores a shortlist of glyphs per tile.
+
+    For a glyph pixel g and a tile pixel t in [0, 255],
+    |t - g| >= (t - g) * (255 - 2g) / 255, with equality when g is 0 or
+    255. Summed over the pixels this lower bound of the SAD is linear in
+    the tile, so one matrix product bounds every tile against every glyph,
+    and it is tight on the unlit and fully lit pixels that make up most of
+    a glyph. The glyph with the smallest bound gives each tile a cutoff,
+    its exact SAD, and only the glyphs whose bound is within the cutoff
+    are scored. Those scores only read the glyph's lit pixels, since an
+    unlit pixel adds t whichever glyph it is. The result is always the
+    glyph the SAD matcher picks, ties included.
+    """
+
+    def __init__(self, glyphs: np.ndarray):
+        self.n_glyphs = len(glyphs)
+        self.glyphs = glyphs.astype(np.int16)
+        weights = 255.0 - 2.0 * glyphs.astype(np.float64)
+        self.weights = weights.T
+        self.offsets = np.einsum("ij,ij->i", glyphs.astype(np.float64), weights)
+        self.lit = [np.flatnonzero(glyph) for glyph in glyphs]
+
+    def _search_rows(self, flat: np.ndarray):
+        n = self.n_glyphs
+        tiles = flat.astype(np.int16)
+        # 255 * the lower bound, an exact integer in float64
+        bounds = flat.astype(np.float64) @ self.weights - self.offsets[None, :]
+        first = bounds.argmin(axis=1)
+        cutoff = np.abs(tiles - self.glyphs[first]).sum(axis=1, dtype=np.int64)
+        shortlist = bounds <= 255.0 * cutoff[:, None]
+
+        tile_sums = tiles.sum(axis=1, dtype=np.int64)
+        keys = np.full(bounds.shape, np.iinfo(np.int64).max)
+        compared = 0
+        for index, lit in enumerate(self.lit):
+            rows = np.flatnonzero(shortlist[:, index])
+            if not len(rows):
+                continue
+            pixels = tiles[np.ix_(rows, lit)]
+            lit_sad = (np.abs(pixels - self.glyphs[index, lit]) - pixels).sum(
+                axis=1, dtype=np.int64
+            )
+            keys[rows, index] = (tile_sums[rows] + lit_sad) * n + index
+            compared += len(rows)
+        return keys.min(axis=1) % n, compared
+
+    def search(self, tiles: np.ndarray) -> np.ndarray:
+        """Index of the glyph with the smallest SAD for every tile of a
+        (..., pixels) tensor."""
+        flat = tiles.reshape(-1, tiles.shape[-1])
+        best_index = np.empty(len(flat), dtype=np.intp)
+        compared = 0
+        step = max(1, CHUNK_ELEMENTS // self.n_glyphs)
+        for start in range(0, len(flat), step):
+            rows = slice(start, start + step)
+            best_index[rows], chunk_compared = self._search_rows(flat[rows])
+            compared += chunk_compared
+        instrumentation.count("glyph_comparisons", compared)
+        return best_index.reshape(tiles.shape[:-1])
@@ -1,42 +1,40 @@
 # repo - https://github.com/mickr777/imagetoasciiimage
 # 2023 skunkworxdark (https://github.com/skunkworxdark)
 
-import os
-import string
 from typing import Literal, Optional
 
-import numpy as np
-import requests
-from PIL import Image, ImageDraw, ImageFont
-
 from invokeai.invocation_api import (
     BaseInvocation,
+    BaseInvocationOutput,
     InputField,
     InvocationContext,
+    OutputField,
     invocation,
+    invocation_output,
+    ImageCollectionOutput,
     ImageField,
     ImageOutput,
+    MetadataField,
 )
 
-font_cache_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "font_cache")
-cache_dir = font_cache_dir
-os.makedirs(cache_dir, exist_ok=True)
-
-
-def list_local_fonts() -> list:
-    if not os.path.exists(cache_dir):
-        return []
-    fonts = [f for f in os.listdir(cache_dir) if f.lower().endswith((".ttf", ".otf"))]
-    return sorted(fonts, key=lambda x: x.lower())
-
-
-available_fonts = list_local_fonts()
+from . import instrumentation
+from .cell_colors import CELL_COLOR_MODES, PALETTE_MODES
+from .core import (
+    DEFAULT_FONT_URL,
+    AnyFontConverter,
+    from_options,
+    list_local_fonts,
+    output_dir,
+)
+from .glyph_index import GLYPH_SEARCH_MODES
+from .output_modes import OUTPUT_MODES
+from .parallel import PARALLEL_MODES
+from .temporal import load_frames, save_animation
+from .tile_memo import MEMO_MODES
+from .text_export import claim_output_file
 
-if available_fonts:
-    fonts_str = ", ".join([repr(f) for f in available_fonts])
-    FontLiteral = eval(f'Literal["None", {fonts_str}]')
-else:
-    FontLiteral = Literal["None"]
+# Literal of a tuple is the same as listing its members
+FontLiteral = Literal[("None", *list_local_fonts())]
 
 
 COMPARISON_TYPES = Literal[
@@ -44,6 +42,7 @@ COMPARISON_TYPES = Literal[
     "MSE",
     "SSIM",
     "NAL",
+    "EDGE",
 ]
 
 COMPARISON_TYPE_LABELS = dict(
@@ -51,6 +50,7 @@ COMPARISON_TYPE_LABELS = dict(
     MSE="Mean Squared Error",
     SSIM="Structural Similarity",
     NAL="Normalized Average Luminance",
+    EDGE="Edge Structure Features",
 )
 
 CHAR_RANGES = Literal[
@@ -93,41 +93,11 @@ CHAR_RANGE_LABELS = dict(
     Custom="Custom: Chars entered in the custom field",
 )
 
-CHAR_SETS = {
-    "All": [chr(i) for i in range(0, 255)],
-    "Low": [chr(i) for i in range(32, 127)],
-    "High": [chr(i) for i in range(128, 255)],
-    "Ascii": [chr(i) for i in range(32, 255)],
-    "Numbers": string.digits + ".",
-    "Letters": string.ascii_letters + " ",
-    "Lowercase": string.ascii_lowercase + " ",
-    "Uppercase": string.ascii_uppercase + " ",
-    "Hex": string.hexdigits,
-    "Punctuation": string.punctuation,
-    "Printable": string.digits + string.ascii_letters + string.punctuation + " ",
-    "AH": "@$B%8WM#&*oahkbdpqwmZO0QLCJYXzcvunxrjft/\|()1{}[]?-+~<>i!lI;:,^'. ",
-    "AM": "@%#*+=-:. ",
-    "AL": "@#=-. ",
-    "Blocks": "[]|-",
-    "Binary": "01",
-}
+class ImageToAABase(BaseInvocation):
+    """Font, charset and matching settings shared by the AnyFont nodes"""
 
-
-@invocation(
-    "I2AA_AnyFont",
-    title="Image to ASCII Art AnyFont",
-    tags=["image", "ascii art"],
-    category="image",
-    version="0.4.1",
-    use_cache=False,
-)
-class ImageToAAInvocation(BaseInvocation):
-    """Convert an Image to Ascii Art Image using any font or size
-    https://github.com/dernyn/256/tree/master this is a great font to use"""
-
-    input_image: ImageField = InputField(description="Image to convert to ASCII art")
     font_url: Optional[str] = InputField(
-        default="https://github.com/dernyn/256/raw/master/Dernyn's-256(baseline).ttf",
+        default=DEFAULT_FONT_URL,
         description="URL address of the font file to download",
     )
     local_font_path: Optional[str] = InputField(
@@ -149,9 +119,13 @@ class ImageToAAInvocation(BaseInvocation):
         default="▁▂▃▄▅▆▇█ ",
         description="Custom characters. Used if Custom is selected from character range",
     )
+    drop_missing: bool = InputField(
+        default=False,
+        description="Leave out the chars the font lacks, so no cell is drawn as the font's missing glyph box",
+    )
     comparison_type: COMPARISON_TYPES = InputField(
         default="NAL",
-        description="Choose the comparison type (Sum of Absolute Differences, Mean Squared Error, Structural Similarity Index, Normalized Average Luminance)",
+        description="Choose the comparison type (Sum of Absolute Differences, Mean Squared Error, Structural Similarity Index, Normalized Average Luminance, Edge Structure Features)",
         ui_choice_labels=COMPARISON_TYPE_LABELS,
     )
     mono_comparison: bool = InputField(
@@ -160,194 +134,213 @@ class ImageToAAInvocation(BaseInvocation):
     color_mode: bool = InputField(
         default=False, description="Enable color mode (default: grayscale)"
     )
+    band_rows: int = InputField(
+        default=0,
+        ge=0,
+        description="Process the image this many rows of chars at a time to limit memory use (0 = whole image)",
+    )
+    parallel_mode: PARALLEL_MODES = InputField(
+        default="Off",
+        description="Match rows of chars on a pool of threads or processes",
+    )
+    workers: int = InputField(
+        default=0,
+        ge=0,
+        description="Number of parallel workers (0 = automatic from the image size)",
+    )
+    glyph_search: GLYPH_SEARCH_MODES = InputField(
+        default="Brute Force",
+        description="How SAD and MSE find the closest char. Exact Index gives the same chars as Brute Force, faster for SAD. Approximate Index only checks groups of similar chars near each cell, it is faster for large character ranges but may pick a slightly worse char",
+    )
+    index_probes: int = InputField(
+        default=2,
+        ge=1,
+        description="Groups of chars the index checks per cell. Higher is closer to brute force, lower is faster",
+    )
+    tile_memo: MEMO_MODES = InputField(
+        default="Off",
+        description="Remember the char picked for each tile and reuse it for identical (Exact) or similar (Tolerant) tiles, also across runs with the same font and characters",
+    )
+    memo_bits: int = InputField(
+        default=4,
+        ge=1,
+        le=8,
+        description="Brightness bits kept in Tolerant memo keys. Lower reuses more tiles, higher is closer to matching every tile",
+    )
+    cell_color: CELL_COLOR_MODES = InputField(
+        default="Auto",
+        description="Color of each cell in color mode: Auto keeps the node's usual color, or the mean, median or most common color of the whole cell",
+    )
+    palette: PALETTE_MODES = InputField(
+        default="Off",
+        description="Limit cell colors to palette_colors levels per channel (Uniform) or to palette_colors colors picked from the image (Adaptive)",
+    )
+    palette_colors: int = InputField(
+        default=16,
+        ge=2,
+        le=256,
+        description="Levels per channel for the Uniform palette, colors for the Adaptive palette",
+    )
+    bypass_cache: bool = InputField(
+        default=False,
+        description="Convert from scratch instead of reusing the stored result for the same image, settings and font",
+    )
+    adaptive_levels: int = InputField(
+        default=0,
+        ge=0,
+        le=4,
+        description="Allow cells up to font_size * 2^levels where the image is smooth, 0 keeps every cell font_size",
+    )
+    split_variance: float = InputField(
+        default=100.0,
+        ge=0,
+        description="Pixel variance above which an adaptive cell is split into four smaller cells",
+    )
+    output_mode: OUTPUT_MODES = InputField(
+        default="Full",
+        description="Compact saves black and white images as 1 bit and images of up to 256 colors as indexed color. It is lossy: glyph edges are dithered to ink or background instead of antialiased",
+    )
 
-    def download_font(self, font_url: str) -> str:
-        font_filename = os.path.basename(font_url)
-        font_path = os.path.join(font_cache_dir, font_filename)
-
-        if not os.path.isfile(font_path):
-            print("Font not found in cache, downloading...")
-            try:
-                response = requests.get(font_url)
-                response.raise_for_status()
-                with open(font_path, "wb") as f:
-                    f.write(response.content)
-            except requests.RequestException as e:
-                print(f"Error downloading font from {font_url}: {e}")
-                raise e
-        else:
-            print("Font found in cache, using cached version.")
-
-        return font_path
-
-    def get_font_chars(self, font_path, font_size, chars):
-        font = ImageFont.truetype(font_path, font_size)
-        # chars = CHAR_SETS.get(char_range, [])
-        char_images = {c: Image.new("L", (font_size, font_size)) for c in chars}
-        for c, img in char_images.items():
-            draw = ImageDraw.Draw(img)
-            bbox = draw.textbbox((0, 0), c, font=font)
-            w, h = bbox[2] - bbox[0], bbox[3] - bbox[1]
-            draw.text(
-                ((font_size - w) / 2, (font_size - h) / 2), c, font=font, fill=255
-            )
-        return {c: np.array(img) for c, img in char_images.items()}
-
-    def sad(self, img1, img2):
-        return np.sum(np.abs(img1 - img2))
-
-    def mse(self, img1, img2):
-        err = np.sum((img1.astype("float") - img2.astype("float")) ** 2)
-        err /= float(img1.shape[0] * img1.shape[1])
-        return err
-
-    def ssim(self, img1, img2, mu_img1, mu_img2, sigma_img1, sigma_img2):
-        sigma_img12 = np.cov(img1.flatten(), img2.flatten())[0, 1]
-        k1, k2, L = 0.01, 0.03, 255
-        C1 = (k1 * L) ** 2
-        C2 = (k2 * L) ** 2
-        ssim = ((2 * mu_img1 * mu_img2 + C1) * (2 * sigma_img12 + C2)) / (
-            (mu_img1**2 + mu_img2**2 + C1) * (sigma_img1 + sigma_img2 + C2)
-        )
-        return ssim
-
-    def calculate_luminosities(self, char_images):
-        luminosities = {c: np.mean(np.array(img)) for c, img in char_images.items()}
-
-        # Normalize the luminosities to the range 0-255.
-        min_luminosity = min(luminosities.values())
-        max_luminosity = max(luminosities.values())
-        for c in char_images.keys():
-            luminosities[c] = (
-                255
-                * (luminosities[c] - min_luminosity)
-                / (max_luminosity - min_luminosity)
-            )
+    def converter(self) -> AnyFontConverter:
+        return from_options(AnyFontConverter, self)
 
-        return luminosities
-
-    def convert_image_to_mosaic_weighted(
-        self,
-        input_image: Image.Image,
-        font_path: str,
-        font_size: int,
-        color_mode: bool,
-        comparison_method: str,
-        char_range: str,
-        mono_comparison: bool,
-        custom_chars: str,
-    ):
-        if mono_comparison:
-            l_image = input_image.convert("1").convert("L")  # grayscale for comparison
-        else:
-            l_image = input_image.convert("L")  # grayscale for comparison
-        c_image = input_image.convert("RGB")  # full color for average color calculation
-
-        # Check for custom char range selected
-        chars = (
-            custom_chars if char_range == "Custom" else CHAR_SETS.get(char_range, [])
-        )
 
-        char_images = self.get_font_chars(
-            font_path, font_size, chars
-        )  # get the char images for comparison
-        if comparison_method == "SSIM":
-            char_images_mean = {c: np.mean(img) for c, img in char_images.items()}
-            char_images_variance = {c: np.var(img) for c, img in char_images.items()}
-        else:
-            char_images_mean = char_images_variance = None
-
-        if comparison_method == "NAL":
-            char_lumi = self.calculate_luminosities(char_images)
-        else:
-            char_lumi = None
-
-        mosaic_img = Image.new(
-            "RGB" if color_mode else "L", input_image.size
-        )  # create a color or grayscale output
-
-        draw = ImageDraw.Draw(mosaic_img)
-        for i in range(0, l_image.width, font_size):
-            for j in range(0, l_image.height, font_size):
-                box = (i, j, i + font_size, j + font_size)
-                l_region = l_image.crop(box)
-                l_region_array = np.array(l_region.resize((font_size, font_size)))
-
-                # Calculate which char is the closest matching using selected method
-                if comparison_method == "SAD":  # Sum of Absolute Differences (SAD).
-                    comparisons = {
-                        c: self.sad(l_region_array, char_img)
-                        for c, char_img in char_images.items()
-                    }
-                elif comparison_method == "MSE":  # Mean Squared Error (MSE)
-                    comparisons = {
-                        c: self.mse(l_region_array, char_img)
-                        for c, char_img in char_images.items()
-                    }
-                elif comparison_method == "SSIM":  # Structural Similarity (SSIM)
-                    comparisons = {
-                        c: -self.ssim(
-                            l_region_array,
-                            char_img,
-                            np.mean(l_region_array),
-                            char_images_mean[c],
-                            np.var(l_region_array),
-                            char_images_variance[c],
-                        )
-                        for c, char_img in char_images.items()
-                    }
-                elif comparison_method == "NAL":  # Average Luminance check
-                    avg_luminosity = np.mean(l_region_array)
-                    comparisons = {
-                        c: abs(avg_luminosity - char_lumi[c])
-                        for c, char_img in char_images.items()
-                    }
-
-                # Pick the char with the smallest difference.
-                best_char = min(comparisons, key=comparisons.get)
-                if color_mode:
-                    c_region = c_image.crop(box)
-                    c_region_array = np.array(c_region.resize((font_size, font_size)))
-                    avg_color = tuple(np.mean(c_region_array, axis=(0, 1)).astype(int))
-                else:
-                    avg_color = 255
-
-                # Draw the character image on the mosaic image.
-                draw.text(
-                    (i, j),
-                    best_char,
-                    font=ImageFont.truetype(font_path, font_size),
-                    fill=avg_color,
-                )
-        # Save the mosaic image.
-        return mosaic_img
+@invocation(
+    "I2AA_AnyFont",
+    title="Image to ASCII Art AnyFont",
+    tags=["image", "ascii art"],
+    category="image",
+    version="0.16.1",
+    use_cache=False,
+)
+class ImageToAAInvocation(ImageToAABase):
+    """Convert an Image to Ascii Art Image using any font or size
+    https://github.com/dernyn/256/tree/master this is a great font to use"""
+
+    input_image: ImageField = InputField(
+        description="Image to convert to ASCII art", ui_order=0
+    )
 
     def invoke(self, context: InvocationContext) -> ImageOutput:
-        input_image = context.images.get_pil(self.input_image.image_name)
-
-        if self.local_font and self.local_font != "None":
-            font_path = os.path.join("font_cache", self.local_font)
-        elif self.local_font_path:
-            font_path = self.local_font_path
-        else:
-            font_path = self.download_font(self.font_url)
-
-        if not os.path.isfile(font_path):
-            print(
-                "\033[1;31mFont file not found. Please check the font file path.\033[0m"
-            )
-            return
-
-        image = self.convert_image_to_mosaic_weighted(
-            input_image,
-            font_path,
-            self.font_size,
-            self.color_mode,
-            self.comparison_type,
-            self.character_range,
-            self.mono_comparison,
-            self.custom_characters,
-        )
-        image_dto = context.images.save(image=image)
+        converter = self.converter()
+        with instrumentation.run("I2AA_AnyFont") as run:
+            with run.phase("load"):
+                input_image = context.images.get_pil(self.input_image.image_name)
+
+            font_path = converter.get_font_path()
+            if font_path is None:
+                return
+
+            image = converter.convert_image(input_image, font_path)
+            with run.phase("save"):
+                image_dto = context.images.save(
+                    image=image, metadata=run.image_metadata(MetadataField)
+                )
 
         return ImageOutput.build(image_dto)
+
+
+@invocation(
+    "I2AA_AnyFont_Batch",
+    title="Image Collection to ASCII Art AnyFont",
+    tags=["image", "ascii art", "batch"],
+    category="image",
+    version="0.11.1",
+    use_cache=False,
+)
+class ImageToAABatchInvocation(ImageToAABase):
+    """Convert a collection of images to Ascii Art Images using any font or size,
+    preparing the font and charset only once for the whole collection"""
+
+    images: list[ImageField] = InputField(
+        description="Images to convert to ASCII art", ui_order=0
+    )
+
+    def invoke(self, context: InvocationContext) -> ImageCollectionOutput:
+        converter = self.converter()
+        with instrumentation.run("I2AA_AnyFont_Batch") as run:
+            font_path = converter.get_font_path()
+            if font_path is None:
+                return
+
+            with run.phase("load"):
+                input_images = [
+                    context.images.get_pil(i.image_name) for i in self.images
+                ]
+            images = converter.convert_images_batched(input_images, font_path)
+
+            collection = []
+            with run.phase("save"):
+                for image in images:
+                    image_dto = context.images.save(
+                        image=image, metadata=run.image_metadata(MetadataField)
+                    )
+                    collection.append(ImageField(image_name=image_dto.image_name))
+
+        return ImageCollectionOutput(collection=collection)
+
+
+@invocation_output("i2aa_animation_output")
+class AnimationOutput(BaseInvocationOutput):
+    """The first converted frame and the path of the saved animation"""
+
+    image: ImageField = OutputField(description="First frame of the converted animation")
+    width: int = OutputField(description="The width of the frames in pixels")
+    height: int = OutputField(description="The height of the frames in pixels")
+    animation_path: str = OutputField(description="Path of the saved animated image")
+
+
+@invocation(
+    "I2AA_AnyFont_Animation",
+    title="Animation to ASCII Art AnyFont",
+    tags=["image", "ascii art", "animation", "gif"],
+    category="image",
+    version="0.11.1",
+    use_cache=False,
+)
+class ImageToAAAnimationInvocation(ImageToAABase):
+    """Convert an animated GIF/APNG to an animated Ascii Art image using any font,
+    only re-matching the chars of tiles that changed since the previous frame"""
+
+    animation_path: str = InputField(
+        description="Path of the animated GIF/APNG file to convert", ui_order=0
+    )
+    tolerance: int = InputField(
+        default=0,
+        ge=0,
+        le=255,
+        description="Largest pixel change for a tile to still count as unchanged",
+    )
+
+    def invoke(self, context: InvocationContext) -> AnimationOutput:
+        converter = self.converter()
+        with instrumentation.run("I2AA_AnyFont_Animation") as run:
+            font_path = converter.get_font_path()
+            if font_path is None:
+                return
+
+            frames, durations = [], []
+            for frame, duration in converter.convert_animation(
+                load_frames(self.animation_path), font_path
+            ):
+                frames.append(frame)
+                durations.append(duration)
+
+            is_gif = self.animation_path.lower().endswith(".gif")
+            animation_path, f = claim_output_file(
+                output_dir, "animation", ".gif" if is_gif else ".png", binary=True
+            )
+            with run.phase("save"), f:
+                save_animation(
+                    frames, durations, f, format="GIF" if is_gif else "PNG"
+                )
+                image_dto = context.images.save(
+                    image=frames[0], metadata=run.image_metadata(MetadataField)
+                )
+
+        return AnimationOutput(
+            image=ImageField(image_name=image_dto.image_name),
+            width=image_dto.width,
+            height=image_dto.height,
+            animation_path=animation_path,
+        )
@@ -1,6 +1,4 @@
-import os
 from typing import Literal
-from PIL import Image, ImageDraw
 from invokeai.invocation_api import (
     BaseInvocation,
     InvocationContext,
@@ -8,14 +6,22 @@ from invokeai.invocation_api import (
     InputField,
     ImageField, 
     ImageOutput, 
+    MetadataField,
 )
 
+from . import instrumentation
+from .cell_colors import CELL_COLOR_MODES, PALETTE_MODES
+from .cell_grid import SAMPLING_MODES
+from .core import AsciiArtConverter, from_options
+from .output_modes import OUTPUT_MODES
+from .text_export import TEXT_FORMATS
+
 @invocation(
     "Image_to_ASCII_Art_Image",
     title="Image to ASCII Art Image",
     tags=["image", "ascii art"],
     category="image",
-    version="1.4.1",
+    version="1.10.0",
     use_cache=False,
 )
 class ImageToDetailedASCIIArtInvocation(BaseInvocation):
@@ -44,140 +50,72 @@ class ImageToDetailedASCIIArtInvocation(BaseInvocation):
     gamma: float = InputField(
         default=1.0, description="Gamma correction value for the output image"
     )
+    text_format: TEXT_FORMATS = InputField(
+        default="Plain",
+        description="Format of the text file: plain text, ANSI truecolor or HTML",
+    )
+    sampling_mode: SAMPLING_MODES = InputField(
+        default="Point",
+        description="How each cell is sampled: its top left pixel, or the mean or median of the whole cell",
+    )
+    band_rows: int = InputField(
+        default=0,
+        ge=0,
+        description="Process the image this many rows of chars at a time to limit memory use (0 = whole image)",
+    )
+    cell_color: CELL_COLOR_MODES = InputField(
+        default="Auto",
+        description="Color of each cell in color mode: Auto keeps the node's usual color, or the mean, median or most common color of the whole cell",
+    )
+    palette: PALETTE_MODES = InputField(
+        default="Off",
+        description="Limit cell colors to palette_colors levels per channel (Uniform) or to palette_colors colors picked from the image (Adaptive)",
+    )
+    palette_colors: int = InputField(
+        default=16,
+        ge=2,
+        le=256,
+        description="Levels per channel for the Uniform palette, colors for the Adaptive palette",
+    )
+    bypass_cache: bool = InputField(
+        default=False,
+        description="Convert from scratch instead of reusing the stored result for the same image, settings and font",
+    )
+    cell_aspect: float = InputField(
+        default=1.0,
+        gt=0,
+        le=4,
+        description="Cell height as a multiple of its width, about 2 to match the shape of text characters (1 = square cells)",
+    )
+    output_mode: OUTPUT_MODES = InputField(
+        default="Full",
+        description="Compact saves black and white images as 1 bit and images of up to 256 colors as indexed color. It is lossy: glyph edges are dithered to ink or background instead of antialiased",
+    )
 
-    def get_ascii_chars(self):
-        sets = {
-            "High Detail": r"@$B%8WM#&*oahkbdpqwmZO0QLCJYXzcvunxrjft/\|()1{}[]?-+~<>i!lI;:,^'. ",
-            "Medium Detail": "@%#*+=-:. ",
-            "Low Detail": "@#=-. ",
-            "Numbers": "9876543210",
-            "Blocks": "[]|-",
-            "Binary": "01",
-        }
-        char_set = sets[self.ascii_set]
-        return char_set[::-1] if self.invert_colors else char_set
-
-    def image_to_detailed_ascii_art(
-        self, input_image: Image.Image, font_spacing: int, color_mode: bool
-    ) -> Image.Image:
-        ascii_chars = self.get_ascii_chars()
-
-        def adjust_gamma(image, gamma=1.0):
-            invGamma = 1.0 / gamma
-            table = [((i / 255.0) ** invGamma) * 255 for i in range(256)]
-            if image.mode == "L":
-                return image.point(table)
-            elif image.mode == "RGB":
-                return image.point(table * 3)
-
-        input_image = adjust_gamma(input_image, gamma=self.gamma)
-
-        if color_mode:
-            ascii_art_image = Image.new(
-                "RGB",
-                input_image.size,
-                (0, 0, 0) if self.invert_colors else (255, 255, 255),
-            )
-        else:
-            ascii_art_image = Image.new(
-                "L", input_image.size, 0 if self.invert_colors else 255
-            )
-
-        draw = ImageDraw.Draw(ascii_art_image)
-        num_cols = input_image.width // font_spacing
-        num_rows = input_image.height // font_spacing
-
-        for y in range(num_rows):
-            for x in range(num_cols):
-                pixel_value = input_image.getpixel((x * font_spacing, y * font_spacing))
-                if isinstance(pixel_value, tuple):
-                    pixel_value = pixel_value[0]
-
-                pixel_value = max(0, min(pixel_value, 255))
-
-                if self.ascii_set == "Binary":
-                    ascii_index = 0 if pixel_value < 127.5 else 1
-                else:
-                    ascii_index = int(pixel_value * (len(ascii_chars) - 1) / 255)
-
-                ascii_char = ascii_chars[ascii_index]
-
-                if color_mode:
-                    color = input_image.getpixel((x * font_spacing, y * font_spacing))
-                    draw.text(
-                        (x * font_spacing, y * font_spacing), ascii_char, fill=color
-                    )
-                else:
-                    font_color = 255 if self.invert_colors else 0
-                    draw.text(
-                        (x * font_spacing, y * font_spacing),
-                        ascii_char,
-                        fill=font_color,
-                    )
-
-        return ascii_art_image
-
-    def image_to_ascii_string(self, input_image: Image.Image, font_spacing: int) -> str:
-        ascii_chars = self.get_ascii_chars()
-
-        ascii_str = ""
-        font_aspect_ratio = 2
-
-        num_cols = input_image.width // font_spacing
-        num_rows = input_image.height // (font_spacing * font_aspect_ratio)
-
-        for y in range(num_rows):
-            for x in range(num_cols):
-                pixel_value = input_image.getpixel(
-                    (x * font_spacing, y * font_spacing * font_aspect_ratio)
-                )
-                if isinstance(pixel_value, tuple):
-                    pixel_value = pixel_value[0]
-                pixel_value = max(0, min(pixel_value, 255))
-                ascii_index = int(pixel_value * (len(ascii_chars) - 1) / 255)
-                ascii_char = ascii_chars[ascii_index]
-                ascii_str += ascii_char
-            ascii_str += "\n"
-
-        return ascii_str
-
-    def get_next_filename(self, base_filename="output.txt"):
-        script_directory = os.path.dirname(os.path.abspath(__file__))
-        output_directory = os.path.join(script_directory, "asciiart_output")
-        new_filename = os.path.join(output_directory, base_filename)
-
-        counter = 0
-        while os.path.exists(new_filename):
-            counter += 1
-            new_filename = os.path.join(
-                output_directory, f"output_{counter}.txt"
-            )
-
-        return new_filename
-
-    def ensure_directory_exists(self, directory_name="asciiart_output"):
-        script_directory = os.path.dirname(os.path.abspath(__file__))
-        directory_path = os.path.join(script_directory, directory_name)
-
-        if not os.path.exists(directory_path):
-            os.makedirs(directory_path)
-        return directory_path
+    def converter(self) -> AsciiArtConverter:
+        return from_options(AsciiArtConverter, self)
 
     def invoke(self, context: InvocationContext) -> ImageOutput:
-        input_image = context.images.get_pil(self.input_image.image_name)
-
-        if self.output_to_file:
-            ascii_str = self.image_to_ascii_string(input_image, self.font_spacing)
-
-            self.ensure_directory_exists()
-            filename = os.path.join("asciiart_output", self.get_next_filename())
-
-            with open(filename, "w") as f:
-                f.write(ascii_str)
-
-        detailed_ascii_art_image = self.image_to_detailed_ascii_art(
-            input_image, self.font_spacing, self.color_mode
-        )
-        image_dto = context.images.save(image=detailed_ascii_art_image)
+        converter = self.converter()
+        with instrumentation.run("Image_to_ASCII_Art_Image") as run:
+            with run.phase("load"):
+                input_image = context.images.get_pil(self.input_image.image_name)
+            with run.phase("sample"):
+                char_grid = converter.get_char_grid(input_image)
+            run.count("cells", char_grid[0].size)
+
+            if self.output_to_file:
+                with run.phase("text_export"):
+                    converter.write_ascii_file(input_image, char_grid=char_grid)
+
+            with run.phase("composite"):
+                detailed_ascii_art_image = converter.convert_image(
+                    input_image, char_grid
+                )
+            with run.phase("save"):
+                image_dto = context.images.save(
+                    image=detailed_ascii_art_image,
+                    metadata=run.image_metadata(MetadataField),
+                )
 
         return ImageOutput.build(image_dto)
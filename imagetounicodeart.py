@@ -1,7 +1,4 @@
-import os
-import requests
-from typing import Literal
-from PIL import Image, ImageDraw, ImageFont
+from typing import Literal, Optional
 from invokeai.invocation_api import (
     BaseInvocation,
     InvocationContext,
@@ -9,22 +6,15 @@ from invokeai.invocation_api import (
     InputField,
     ImageField, 
     ImageOutput,
+    MetadataField,
 )
 
-font_cache_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "font_cache")
-os.makedirs(font_cache_dir, exist_ok=True)
-FONT_PATH = os.path.join(font_cache_dir, "DejaVuSansMono.ttf")
-
-def download_font(url: str, save_path: str) -> None:
-    font_directory = os.path.dirname(FONT_PATH)
-    if not os.path.exists(font_directory):
-        os.makedirs(font_directory)
-
-    response = requests.get(url, stream=True)
-    response.raise_for_status()
-    with open(save_path, "wb") as font_file:
-        for chunk in response.iter_content(chunk_size=8192):
-            font_file.write(chunk)
+from . import instrumentation
+from .cell_colors import CELL_COLOR_MODES, PALETTE_MODES
+from .cell_grid import SAMPLING_MODES
+from .core import UnicodeArtConverter, from_options
+from .output_modes import OUTPUT_MODES
+from .sub_cells import SUB_CELL_MODES
 
 
 @invocation(
@@ -32,7 +22,7 @@ def download_font(url: str, save_path: str) -> None:
     title="Image to Unicode Art",
     tags=["image", "unicode art", "shading"],
     category="image",
-    version="1.4.0",
+    version="1.12.0",
     use_cache=False,
 )
 class ImageToUnicodeArtInvocation(BaseInvocation):
@@ -70,108 +60,65 @@ class ImageToUnicodeArtInvocation(BaseInvocation):
     invert_colors: bool = InputField(
         default=True, description="Invert background color and ASCII character order"
     )
+    sampling_mode: SAMPLING_MODES = InputField(
+        default="Point",
+        description="How each cell is sampled: its top left pixel, or the mean or median of the whole cell",
+    )
+    band_rows: int = InputField(
+        default=0,
+        ge=0,
+        description="Process the image this many rows of chars at a time to limit memory use (0 = whole image)",
+    )
+    sub_cell_mode: SUB_CELL_MODES = InputField(
+        default="Off",
+        description="Draw half block or quadrant chars with their own foreground and background color, for 2-4x the detail at the same font size (replaces unicode_set)",
+    )
+    cell_color: CELL_COLOR_MODES = InputField(
+        default="Auto",
+        description="Color of each cell in color mode: Auto keeps the node's usual color, or the mean, median or most common color of the whole cell",
+    )
+    palette: PALETTE_MODES = InputField(
+        default="Off",
+        description="Limit cell colors to palette_colors levels per channel (Uniform) or to palette_colors colors picked from the image (Adaptive)",
+    )
+    palette_colors: int = InputField(
+        default=16,
+        ge=2,
+        le=256,
+        description="Levels per channel for the Uniform palette, colors for the Adaptive palette",
+    )
+    bypass_cache: bool = InputField(
+        default=False,
+        description="Convert from scratch instead of reusing the stored result for the same image, settings and font",
+    )
+    cell_aspect: float = InputField(
+        default=1.0,
+        gt=0,
+        le=4,
+        description="Cell height as a multiple of its width, about 2 to match the shape of text characters (1 = square cells)",
+    )
+    output_mode: OUTPUT_MODES = InputField(
+        default="Full",
+        description="Compact saves black and white images as 1 bit and images of up to 256 colors as indexed color. It is lossy: glyph edges are dithered to ink or background instead of antialiased",
+    )
+    local_font_path: Optional[str] = InputField(
+        default=None,
+        description="Local font file path to draw with instead of DejaVu Sans Mono, which is downloaded on first use",
+    )
 
-    def get_unicode_chars(self):
-        char_set = {
-            "Shaded": "█▓▒░ ",
-            "Extended Shading": "█▇▆▅▄▃▂▁▀",
-            "Intermediate Detail": "◼◐○□ ",
-            "Checkerboard Patterns": "▝▜▛▚▙▘▗▖ ",
-            "Vertical Lines": "┋┊┇┆┃│ ",
-            "Horizontal Lines": "┉┈┅┄━─ ",
-            "Diagonal Lines": "╱╳╲ ",
-            "Arrows": "↙↘↗↖↕↔↓→↑← ",
-            "Circles": "◑◐◕◔○● ",
-            "Blocks": "▁▂▃▄▅▆▇█ ",
-            "Triangles": "▷◁◶▷▽▼△▲ ",
-            "Math Symbols": "∓±÷×−+ ",
-            "Stars": "✬✫✪✩✧✦☆★ ",
-        }
-        return (
-            char_set[self.unicode_set]
-            if not self.invert_colors
-            else char_set[self.unicode_set][::-1]
-        )
-
-    def image_to_unicode_art(
-        self, input_image: Image.Image, font_size: int, color_mode: bool
-    ) -> Image.Image:
-        def adjust_gamma(image, gamma=1.0):
-            invGamma = 1.0 / gamma
-            table = [((i / 255.0) ** invGamma) * 255 for i in range(256)]
-            if image.mode == "L":
-                return image.point(table)
-            elif image.mode == "RGB":
-                return image.point(table * 3)
-
-        input_image = adjust_gamma(input_image, gamma=self.gamma)
-
-        if not os.path.exists(FONT_PATH):
-            font_url = (
-                "https://candyfonts.com/wp-data/2021/05/09/122551/DejaVuSansMono.ttf"
-            )
-            download_font(font_url, FONT_PATH)
-
-        try:
-            font = ImageFont.truetype(FONT_PATH, font_size)
-        except Exception as e:
-            print("Error loading font:", e)
-            raise e
-
-        ascii_chars = self.get_unicode_chars()
-
-        if color_mode:
-            ascii_art_image = Image.new(
-                "RGB",
-                input_image.size,
-                (0, 0, 0) if self.invert_colors else (255, 255, 255),
-            )
-        else:
-            ascii_art_image = Image.new(
-                "L", input_image.size, 0 if self.invert_colors else 255
-            )
-
-        draw = ImageDraw.Draw(ascii_art_image)
-
-        num_cols = input_image.width // font_size
-        num_rows = input_image.height // font_size
-
-        for y in range(num_rows):
-            for x in range(num_cols):
-                pixel_value = input_image.getpixel((x * font_size, y * font_size))
-                if isinstance(pixel_value, tuple):
-                    pixel_value = pixel_value[0]
-
-                pixel_value = max(0, min(pixel_value, 255))
-
-                ascii_index = int(pixel_value * (len(ascii_chars) - 1) / 255)
-                ascii_char = ascii_chars[ascii_index]
-
-                if color_mode:
-                    color = input_image.getpixel((x * font_size, y * font_size))
-                    draw.text(
-                        (x * font_size, y * font_size),
-                        ascii_char,
-                        fill=color,
-                        font=font,
-                    )
-                else:
-                    font_color = 255 if self.invert_colors else 0
-                    draw.text(
-                        (x * font_size, y * font_size),
-                        ascii_char,
-                        fill=font_color,
-                        font=font,
-                    )
-
-        return ascii_art_image
+    def converter(self) -> UnicodeArtConverter:
+        return from_options(UnicodeArtConverter, self)
 
     def invoke(self, context: InvocationContext) -> ImageOutput:
-        input_image = context.images.get_pil(self.input_image.image_name)
-        shaded_ascii_art_image = self.image_to_unicode_art(
-            input_image, self.font_size, self.color_mode
-        )
-
-        image_dto = context.images.save(image=shaded_ascii_art_image)
+        with instrumentation.run("Image_to_Unicode_Art") as run:
+            with run.phase("load"):
+                input_image = context.images.get_pil(self.input_image.image_name)
+            shaded_ascii_art_image = self.converter().convert_image(input_image)
+
+            with run.phase("save"):
+                image_dto = context.images.save(
+                    image=shaded_ascii_art_image,
+                    metadata=run.image_metadata(MetadataField),
+                )
 
         return ImageOutput.build(image_dto)
@@ -0,0 +1,153 @@
+# repo - https://github.com/mickr777/imagetoasciiimage
+# Per phase timers and counters for the nodes, switched on by an environment variable.
+
+import io
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+
+logger = logging.getLogger(__name__)
+
+# I2AA_INSTRUMENT=1 records timers and counters, I2AA_INSTRUMENT=profile
+# also runs a profiler over every node invocation
+INSTRUMENT_ENV = "I2AA_INSTRUMENT"
+
+_NULL_PHASE = nullcontext()
+
+
+class CProfileHook:
+    """Profiler hook around cProfile, logs the slowest calls when stopped."""
+
+    def __init__(self, name: str, limit: int = 20):
+        import cProfile
+
+        self.name = name
+        self.limit = limit
+        self.profile = cProfile.Profile()
+
+    def start(self):
+        self.profile.enable()
+
+    def stop(self):
+        import pstats
+
+        self.profile.disable()
+        out = io.StringIO()
+        pstats.Stats(self.profile, stream=out).sort_stats("cumulative").print_stats(
+            self.limit
+        )
+        logger.info("%s profile:\n%s", self.name, out.getvalue())
+
+
+# Called with the node name, returns an object with start() and stop().
+# Replace it to use a sampling profiler, e.g. pyinstrument.Profiler's
+# start()/stop() wrapped the same way as CProfileHook.
+profiler_factory = CProfileHook
+
+
+class Run:
+    """Timers and counters of one node invocation.
+
+    Timers accumulate, so a phase entered once per band reports its total
+    time and the number of times it ran. A disabled Run records nothing and
+    phase() hands back a shared no-op context manager.
+    """
+
+    def __init__(self, name: str, enabled: bool = False):
+        self.name = name
+        self.enabled = enabled
+        self.timers = {}
+        self.calls = {}
+        self.counters = {}
+        # counts can come from the worker threads of a parallel match
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def _timed(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timers[name] = self.timers.get(name, 0.0) + time.perf_counter() - start
+            self.calls[name] = self.calls.get(name, 0) + 1
+
+    def phase(self, name: str):
+        return self._timed(name) if self.enabled else _NULL_PHASE
+
+    def count(self, name: str, n: int = 1):
+        if self.enabled:
+            with self._lock:
+                self.counters[name] = self.counters.get(name, 0) + int(n)
+
+    def report(self) -> dict:
+        return dict(
+            node=self.name,
+            timings={k: round(v, 6) for k, v in self.timers.items()},
+            calls=dict(self.calls),
+            counters=dict(self.counters),
+        )
+
+    def image_metadata(self, field_type=dict):
+        """The report wrapped for context.images.save(metadata=...), None when disabled.
+
+        field_type is InvokeAI's MetadataField in the nodes.
+        """
+        if not self.enabled:
+            return None
+        report = {"i2aa_instrumentation": self.report()}
+        return field_type.model_validate(report) if field_type is not dict else report
+
+
+_NULL_RUN = Run("", enabled=False)
+_current = ContextVar("i2aa_instrumentation", default=_NULL_RUN)
+
+
+def instrument_mode() -> str:
+    """The I2AA_INSTRUMENT environment variable as off, on or profile."""
+    value = os.environ.get(INSTRUMENT_ENV, "").strip().lower()
+    if value in ("", "0", "off", "false", "no"):
+        return "off"
+    return "profile" if value == "profile" else "on"
+
+
+@contextmanager
+def run(name: str):
+    """Instrument one node invocation; phase() and count() calls made inside go to it."""
+    mode = instrument_mode()
+    if mode == "off":
+        yield _NULL_RUN
+        return
+
+    current = Run(name, enabled=True)
+    token = _current.set(current)
+    profiler = profiler_factory(name) if mode == "profile" else None
+    if profiler is not None:
+        profiler.start()
+    start = time.perf_counter()
+    try:
+        yield current
+    finally:
+        total = time.perf_counter() - start
+        if profiler is not None:
+            profiler.stop()
+        _current.reset(token)
+        phases = ", ".join(
+            f"{k} {v * 1000:.1f}ms" for k, v in sorted(current.timers.items())
+        )
+        counters = ", ".join(f"{k}={v}" for k, v in sorted(current.counters.items()))
+        logger.info(
+            "%s took %.1fms [%s] [%s]", name, total * 1000, phases, counters
+        )
+
+
+def phase(name: str):
+    """Time a phase of the running node invocation, a no-op outside of run()."""
+    return _current.get().phase(name)
+
+
+def count(name: str, n: int = 1):
+    """Add n to a counter of the running node invocation."""
+    _current.get().count(name, n)
@@ -0,0 +1,323 @@
+# repo - https://github.com/mickr777/imagetoasciiimage
+# Batched tile/glyph matching used by the I2AA AnyFont node.
+
+from functools import lru_cache
+
+import numpy as np
+
+# Upper bound on the number of elements held by one intermediate
+# (tiles x glyphs x pixels) block while matching.
+CHUNK_ELEMENTS = 1 << 22
+
+
+def image_to_tiles(image_array: np.ndarray, cell_h: int, cell_w: int) -> np.ndarray:
+    """Split an image into a (rows, cols, cell_h * cell_w[, channels]) tensor.
+
+    The image is zero padded up to a whole number of cells, the same as
+    PIL's crop() does for boxes that run past the edge of the image.
+    """
+    height, width = image_array.shape[:2]
+    rows = -(-height // cell_h)
+    cols = -(-width // cell_w)
+    pad_h = rows * cell_h - height
+    pad_w = cols * cell_w - width
+    if pad_h or pad_w:
+        padding = ((0, pad_h), (0, pad_w)) + ((0, 0),) * (image_array.ndim - 2)
+        image_array = np.pad(image_array, padding)
+    channels = image_array.shape[2:]
+    tiles = image_array.reshape(rows, cell_h, cols, cell_w, *channels).swapaxes(1, 2)
+    return tiles.reshape(rows, cols, cell_h * cell_w, *channels)
+
+
+def stack_glyphs(char_images: dict):
+    """Return the chars and a (n_glyphs, pixels) matrix of their bitmaps."""
+    chars = list(char_images.keys())
+    matrix = np.stack([char_images[c].reshape(-1) for c in chars])
+    return chars, matrix
+
+
+def _chunk_rows(n_glyphs: int, n_pixels: int) -> int:
+    return max(1, CHUNK_ELEMENTS // max(1, n_glyphs * n_pixels))
+
+
+def sad_glyph_stats(glyphs: np.ndarray):
+    return glyphs.astype(np.int16)
+
+
+def match_sad(tiles: np.ndarray, glyphs: np.ndarray, glyph_stats=None) -> np.ndarray:
+    """Index of the glyph with the smallest sum of absolute differences."""
+    flat = tiles.reshape(-1, tiles.shape[-1]).astype(np.int16)
+    glyphs = sad_glyph_stats(glyphs) if glyph_stats is None else glyph_stats
+    best = np.empty(flat.shape[0], dtype=np.intp)
+    step = _chunk_rows(*glyphs.shape)
+    for start in range(0, flat.shape[0], step):
+        block = flat[start : start + step, None, :] - glyphs[None, :, :]
+        scores = np.abs(block).sum(axis=2, dtype=np.int32)
+        best[start : start + step] = scores.argmin(axis=1)
+    return best.reshape(tiles.shape[:-1])
+
+
+def mse_glyph_stats(glyphs: np.ndarray):
+    glyphs = glyphs.astype(np.float64)
+    return glyphs, np.einsum("ij,ij->i", glyphs, glyphs)
+
+
+def match_mse(tiles: np.ndarray, glyphs: np.ndarray, glyph_stats=None) -> np.ndarray:
+    """Index of the glyph with the smallest mean squared error.
+
+    Uses |t - g|^2 = |t|^2 - 2 t.g + |g|^2; the |t|^2 term is the same for
+    every glyph so it is dropped. All values are integers well inside the
+    float64 mantissa so the scores (and ties) are exact.
+    """
+    flat = tiles.reshape(-1, tiles.shape[-1]).astype(np.float64)
+    if glyph_stats is None:
+        glyph_stats = mse_glyph_stats(glyphs)
+    glyphs, glyph_norms = glyph_stats
+    best = np.empty(flat.shape[0], dtype=np.intp)
+    step = _chunk_rows(glyphs.shape[0], 1)
+    for start in range(0, flat.shape[0], step):
+        scores = glyph_norms[None, :] - 2.0 * (flat[start : start + step] @ glyphs.T)
+        best[start : start + step] = scores.argmin(axis=1)
+    return best.reshape(tiles.shape[:-1])
+
+
+# SSIM constants, k1 and k2 scale the dynamic range L of 8 bit images
+SSIM_K1, SSIM_K2, SSIM_L = 0.01, 0.03, 255
+
+
+def ssim_glyph_stats(glyphs: np.ndarray):
+    """Per glyph mean, variance and centered bitmap, computed once per charset."""
+    glyphs = glyphs.astype(np.float64)
+    means = glyphs.mean(axis=1)
+    centered = glyphs - means[:, None]
+    variances = (centered**2).mean(axis=1)
+    return means, variances, centered
+
+
+def match_ssim(tiles: np.ndarray, glyphs: np.ndarray, glyph_stats=None) -> np.ndarray:
+    """Index of the glyph with the highest structural similarity.
+
+    Uses the closed form SSIM over the whole tile: the variances are
+    population variances and the covariance is the unbiased sample
+    covariance (np.cov), so the scores match the previous per pair method.
+    As the centered glyphs sum to zero, cov(t, g) = t . (g - mean(g)) / (n - 1)
+    and every tile/glyph covariance comes from one matrix product.
+    """
+    if glyph_stats is None:
+        glyph_stats = ssim_glyph_stats(glyphs)
+    g_mean, g_var, g_centered = glyph_stats
+    C1 = (SSIM_K1 * SSIM_L) ** 2
+    C2 = (SSIM_K2 * SSIM_L) ** 2
+
+    flat = tiles.reshape(-1, tiles.shape[-1]).astype(np.float64)
+    dof = max(flat.shape[1] - 1, 1)
+    best = np.empty(flat.shape[0], dtype=np.intp)
+    step = _chunk_rows(glyphs.shape[0], 1)
+    for start in range(0, flat.shape[0], step):
+        block = flat[start : start + step]
+        t_mean = block.mean(axis=1)[:, None]
+        t_var = block.var(axis=1)[:, None]
+        covariance = (block @ g_centered.T) / dof
+        ssim = ((2 * t_mean * g_mean + C1) * (2 * covariance + C2)) / (
+            (t_mean**2 + g_mean**2 + C1) * (t_var + g_var + C2)
+        )
+        best[start : start + step] = ssim.argmax(axis=1)
+    return best.reshape(tiles.shape[:-1])
+
+
+def normalized_luminosities(glyphs: np.ndarray) -> np.ndarray:
+    """Mean luminance of each glyph stretched to the full 0-255 range."""
+    luminosities = glyphs.mean(axis=1)
+    low, high = luminosities.min(), luminosities.max()
+    if high == low:
+        return np.zeros_like(luminosities)
+    return 255 * (luminosities - low) / (high - low)
+
+
+def luminosity_ramp(luminosities: np.ndarray):
+    """Sorted distinct luminosities and the first glyph index for each.
+
+    Glyphs sharing a luminosity collapse onto the one that comes first in
+    the charset, which is the one a first-wins min() would have picked.
+    """
+    order = np.argsort(luminosities, kind="stable")
+    values, first = np.unique(luminosities[order], return_index=True)
+    return values, order[first]
+
+
+def nal_lookup_table(luminosities: np.ndarray, n_pixels: int) -> np.ndarray:
+    """Best glyph index for every possible integer tile sum (0 .. 255 * n).
+
+    Tile means are always tile_sum / n_pixels, so indexing this table with
+    the tile sums gives exactly the same choice as comparing the mean
+    against every glyph, without rounding the mean to 0-255.
+    """
+    values, glyph_index = luminosity_ramp(luminosities)
+    means = np.arange(255 * n_pixels + 1) / n_pixels
+    right = np.clip(np.searchsorted(values, means), 0, len(values) - 1)
+    left = np.clip(right - 1, 0, len(values) - 1)
+    left_dist = np.abs(means - values[left])
+    right_dist = np.abs(means - values[right])
+    use_right = (right_dist < left_dist) | (
+        (right_dist == left_dist) & (glyph_index[right] < glyph_index[left])
+    )
+    return np.where(use_right, glyph_index[right], glyph_index[left])
+
+
+def nal_glyph_stats(glyphs: np.ndarray):
+    return nal_lookup_table(normalized_luminosities(glyphs), glyphs.shape[1])
+
+
+def match_nal(tiles: np.ndarray, glyphs: np.ndarray, glyph_stats=None) -> np.ndarray:
+    """Index of the glyph whose normalized luminance is closest to the tile mean."""
+    lookup_table = nal_glyph_stats(glyphs) if glyph_stats is None else glyph_stats
+    return match_nal_sums(tiles.sum(axis=-1, dtype=np.int64), lookup_table)
+
+
+def match_nal_sums(tile_sums: np.ndarray, glyph_stats: np.ndarray) -> np.ndarray:
+    """match_nal() of tiles known only by their integer pixel sums, such as
+    the grid sums of a summed area table."""
+    return glyph_stats[tile_sums]
+
+
+# EDGE describes every cell by a short feature vector: its mean, the means
+# of a FEATURE_GRID square layout of blocks around that mean, and its
+# dominant gradient orientation, so strokes and edges pick glyphs running
+# the same way. The weights scale each part against the 0-255 mean. The
+# layout depends on where a stroke sits in the cell, the orientation
+# doesn't, so the orientation outweighs it.
+FEATURE_GRID = 3
+LAYOUT_WEIGHT = 0.15
+ORIENTATION_WEIGHT = 200.0
+# Extra weight of the diagonal axis of the orientation. Monospace glyphs
+# are narrower than their square cell, so / and \ run steeper than a 45
+# degree edge, and without it short marks like ` that lie closer to 45
+# degrees win diagonal edges.
+DIAGONAL_WEIGHT = 3.0
+# Mean squared gradient at which an edge counts at half strength, weaker
+# (noise, soft shading) gradients mostly leave the choice to the means
+EDGE_ENERGY = 1000.0
+# Share of the mean a cell with a full strength edge gives up. An edge is
+# drawn with one stroke however wide it is, so a wide line still picks -
+# rather than a denser glyph like = or ~. It goes with the cube of the
+# strength, so the softer edges of photos keep their tone.
+STROKE_TONE = 0.7
+
+
+def _cell_side(n_pixels: int) -> int:
+    side = int(round(np.sqrt(n_pixels)))
+    if side * side != n_pixels:
+        raise ValueError(f"EDGE matching needs square cells, got {n_pixels} pixels")
+    return side
+
+
+@lru_cache(maxsize=16)
+def _feature_weights(side: int) -> np.ndarray:
+    """(side * side, k) float32 matrix turning cell pixels into their mean, the
+    FEATURE_GRID block means and the x and y gradients at the pixel corners,
+    all linear in the pixels, so one matrix product gives every one of them."""
+    pixels = np.eye(side * side, dtype=np.float32).reshape(side * side, side, side)
+    bounds = np.linspace(0, side, min(FEATURE_GRID, side) + 1).astype(np.intp)
+    blocks = [
+        pixels[:, top:bottom, left:right].mean(axis=(1, 2))
+        for top, bottom in zip(bounds[:-1], bounds[1:])
+        for left, right in zip(bounds[:-1], bounds[1:])
+    ]
+    # gradients from each 2x2 block of pixels
+    right = pixels[:, :, 1:] - pixels[:, :, :-1]
+    down = pixels[:, 1:, :] - pixels[:, :-1, :]
+    gx = (right[:, 1:, :] + right[:, :-1, :]).reshape(side * side, -1)
+    gy = (down[:, :, 1:] + down[:, :, :-1]).reshape(side * side, -1)
+    mean = pixels.mean(axis=(1, 2))[:, None]
+    return np.concatenate([mean, np.stack(blocks, axis=1), gx, gy], axis=1)
+
+
+def structure_features(flat: np.ndarray, side: int):
+    """(means, layout, orientation, strength) of (n, side * side) cells.
+
+    layout is the FEATURE_GRID block means minus the cell mean. The
+    orientation is the summed (gx^2 - gy^2, 2 gx gy) of the gradients over
+    their total energy, the doubled angle form of an orientation histogram:
+    both sides of a stroke add up instead of cancelling, a single straight
+    edge has length 1 and texture without one direction is near 0. It is
+    scaled down by the strength, from 0 for cells whose edges are faint to
+    1 for sharp ones.
+    """
+    weights = _feature_weights(side)
+    linear = flat.astype(np.float32) @ weights
+    n_blocks = min(FEATURE_GRID, side) ** 2
+    n_corners = (side - 1) ** 2
+    means = linear[:, 0]
+    layout = linear[:, 1 : 1 + n_blocks] - means[:, None]
+    gx = linear[:, 1 + n_blocks : 1 + n_blocks + n_corners]
+    gy = linear[:, 1 + n_blocks + n_corners :]
+
+    gx2, gy2 = gx * gx, gy * gy
+    energy = (gx2 + gy2).sum(axis=1)
+    orientation = np.stack([(gx2 - gy2).sum(axis=1), 2 * (gx * gy).sum(axis=1)], axis=1)
+    mean_energy = energy / max(1, n_corners)
+    strength = mean_energy / (mean_energy + EDGE_ENERGY)
+    orientation *= (strength / np.maximum(energy, 1e-6))[:, None]
+    return means, layout, orientation, strength
+
+
+def feature_vectors(means, layout, orientation) -> np.ndarray:
+    orientation = ORIENTATION_WEIGHT * orientation
+    orientation[:, 1] *= DIAGONAL_WEIGHT
+    return np.concatenate(
+        [means[:, None], LAYOUT_WEIGHT * layout, orientation], axis=1
+    ).astype(np.float32)
+
+
+def tile_feature_vectors(flat: np.ndarray, side: int) -> np.ndarray:
+    means, layout, orientation, strength = structure_features(flat, side)
+    return feature_vectors(means * (1 - STROKE_TONE * strength**3), layout, orientation)
+
+
+def edge_glyph_stats(glyphs: np.ndarray):
+    """-2 x the glyph feature vectors (transposed) and their squared norms,
+    computed once per charset.
+
+    The means are the normalized luminosities NAL uses, so the tones pick
+    the same range of glyphs and the structure decides between them.
+    """
+    _, layout, orientation, _ = structure_features(glyphs, _cell_side(glyphs.shape[1]))
+    features = feature_vectors(normalized_luminosities(glyphs), layout, orientation)
+    return -2.0 * features.T, np.einsum("ij,ij->i", features, features)
+
+
+def match_edge(tiles: np.ndarray, glyphs: np.ndarray, glyph_stats=None) -> np.ndarray:
+    """Index of the glyph with the nearest structure feature vector."""
+    if glyph_stats is None:
+        glyph_stats = edge_glyph_stats(glyphs)
+    scaled_features, feature_norms = glyph_stats
+    flat = tiles.reshape(-1, tiles.shape[-1])
+    side = _cell_side(flat.shape[1])
+    best = np.empty(flat.shape[0], dtype=np.intp)
+    # the gradient planes are the largest intermediates, about 4 per pixel
+    step = min(_chunk_rows(len(feature_norms), 1), _chunk_rows(1, 4 * flat.shape[1]))
+    for start in range(0, flat.shape[0], step):
+        block = tile_feature_vectors(flat[start : start + step], side)
+        # |t - g|^2 without the |t|^2 term, the same for every glyph
+        scores = block @ scaled_features
+        scores += feature_norms
+        best[start : start + step] = scores.argmin(axis=1)
+    return best.reshape(tiles.shape[:-1])
+
+
+MATCHERS = {
+    "SAD": match_sad,
+    "MSE": match_mse,
+    "SSIM": match_ssim,
+    "NAL": match_nal,
+    "EDGE": match_edge,
+}
+
+# Per charset precomputation for each matcher, passed back in as glyph_stats
+GLYPH_STATS = {
+    "SAD": sad_glyph_stats,
+    "MSE": mse_glyph_stats,
+    "SSIM": ssim_glyph_stats,
+    "NAL": nal_glyph_stats,
+    "EDGE": edge_glyph_stats,
+}
@@ -0,0 +1,98 @@
+# repo - https://github.com/mickr777/imagetoasciiimage
+# Compact 1 bit and indexed color output images for the ASCII, Unicode and AnyFont nodes.
+
+from typing import Literal, Optional
+
+import numpy as np
+
+from .cell_colors import nearest_palette_indices
+
+# Full keeps the antialiased "L"/"RGB" image. Compact draws glyphs without
+# antialiasing, so black and white renders are stored as 1 bit "1" images
+# and renders of at most 256 colors as indexed "P" images. That is lossy,
+# the glyph edges are dithered (GlyphAtlas.binary()) rather than blended.
+OUTPUT_MODES = Literal["Full", "Compact"]
+
+MAX_PALETTE_COLORS = 256
+
+# PNG stores palettes of up to 16 colors in 4 bits or fewer a pixel, larger
+# gray palettes take as many bits as "L" and compress worse
+MAX_GRAY_PALETTE_COLORS = 16
+
+
+def color_keys(colors) -> np.ndarray:
+    """One int per color of a (..., C) grid of 0-255 colors, equal only for equal colors."""
+    colors = np.asarray(colors).astype(np.int64)
+    keys = np.zeros(colors.shape[:-1], dtype=np.int64)
+    for channel in range(colors.shape[-1]):
+        keys = (keys << 8) | colors[..., channel]
+    return keys
+
+
+def color_table(colors, background) -> Optional[np.ndarray]:
+    """(k, C) uint8 table of the background and every distinct color of a
+    (..., C) grid, or None when that is more than 256 colors."""
+    colors = np.asarray(colors)
+    channels = colors.shape[-1]
+    background = np.reshape(background, -1)[:channels]
+    keys = np.unique(np.append(color_keys(colors.reshape(-1, channels)), color_keys(background)))
+    if len(keys) > MAX_PALETTE_COLORS:
+        return None
+    shifts = 8 * np.arange(channels - 1, -1, -1)
+    return ((keys[:, None] >> shifts) & 255).astype(np.uint8)
+
+
+def palette_indices(colors, palette: np.ndarray) -> np.ndarray:
+    """uint8 index into the (k, C) palette of every color of a (..., C) grid.
+
+    Colors are looked up exactly, any the palette doesn't hold get the
+    nearest palette color.
+    """
+    colors = np.asarray(colors)
+    palette_keys = color_keys(palette)
+    order = np.argsort(palette_keys, kind="stable")
+    keys = color_keys(colors)
+    found = np.minimum(np.searchsorted(palette_keys[order], keys), len(order) - 1)
+    indices = order[found]
+    missing = palette_keys[indices] != keys
+    if missing.any():
+        indices[missing] = nearest_palette_indices(colors[missing], palette)
+    return indices.astype(np.uint8)
+
+
+def image_palette(palette: np.ndarray) -> bytes:
+    """A (k, 1) gray or (k, 3) color table as the RGB bytes of Image.putpalette()."""
+    return np.repeat(palette, 3 // palette.shape[1], axis=1).astype(np.uint8).tobytes()
+
+
+def ink_colors(ink, channels: int) -> np.ndarray:
+    """Ink as a (..., channels) grid: one value, one color or a gray or color grid."""
+    ink = np.asarray(ink)
+    if ink.ndim < 2:
+        ink = np.reshape(ink, (1, -1))
+    elif ink.ndim == 2:
+        ink = ink[:, :, None]
+    return np.broadcast_to(ink[..., :channels], ink.shape[:-1] + (channels,))
+
+
+def compact_mode(mode: str, background=0, ink=255, colors=None):
+    """(mode, palette) that draws cells as a compact image.
+
+    "L" renders with one ink become "1" images when both it and the
+    background are black or white. Other renders become "P" images with
+    the palette of their background and colors, a (..., C) grid of every
+    color ink may hold. That is ink itself unless the colors are known up
+    front, as for images drawn a band at a time. Anything else, including
+    gray renders of more than MAX_GRAY_PALETTE_COLORS shades, keeps mode
+    with no palette.
+    """
+    channels = 1 if mode == "L" else 3
+    if mode == "L" and np.ndim(ink) == 0:
+        if {int(ink), int(np.reshape(background, -1)[0])} <= {0, 255}:
+            return "1", None
+    if colors is None:
+        colors = ink_colors(ink, channels)
+    palette = color_table(colors, background)
+    if palette is None or (mode == "L" and len(palette) > MAX_GRAY_PALETTE_COLORS):
+        return mode, None
+    return "P", palette
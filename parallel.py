@@ -0,0 +1,208 @@
+# repo - https://github.com/mickr777/imagetoasciiimage
+# Parallel glyph matching over bands of tile rows.
+
+import hashlib
+import os
+import threading
+from typing import Literal
+
+import numpy as np
+
+from .matching import GLYPH_STATS, MATCHERS
+
+PARALLEL_MODES = Literal["Off", "Threads", "Processes"]
+
+# Below this many cells per worker the pool overhead outweighs the gain
+MIN_CELLS_PER_WORKER = 8192
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+# Run first in every worker process. Workers are spawned, so they start
+# without this package, which the node loader imports from a file under a
+# name that needn't match its folder. An empty package module of the same
+# name pointed at the folder lets them import the worker function (and the
+# modules it needs) without running the package __init__ and its nodes.
+_WORKER_SETUP = """
+import importlib.util, sys
+if {name!r} not in sys.modules:
+    package = importlib.util.module_from_spec(
+        importlib.util.spec_from_loader({name!r}, None, is_package=True)
+    )
+    package.__path__ = [{path!r}]
+    sys.modules[{name!r}] = package
+"""
+
+
+def auto_workers(n_cells: int) -> int:
+    """Worker count for a grid of n_cells, 1 for small images."""
+    return max(1, min(os.cpu_count() or 1, n_cells // MIN_CELLS_PER_WORKER))
+
+
+def _get_pool(mode: str, workers: int):
+    # Pools are kept for the life of the process so repeated invocations
+    # don't pay the worker start up cost again.
+    from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+    with _pools_lock:
+        key = (mode, workers)
+        if key not in _pools:
+            if mode == "Processes":
+                import multiprocessing
+
+                setup = _WORKER_SETUP.format(
+                    name=__package__, path=os.path.dirname(os.path.abspath(__file__))
+                )
+                _pools[key] = ProcessPoolExecutor(
+                    max_workers=workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=exec,
+                    initargs=(setup,),
+                )
+            else:
+                _pools[key] = ThreadPoolExecutor(
+                    max_workers=workers, thread_name_prefix="i2aa"
+                )
+        return _pools[key]
+
+
+def _to_shared(array: np.ndarray):
+    from multiprocessing import shared_memory
+
+    shm = shared_memory.SharedMemory(create=True, size=max(1, array.nbytes))
+    np.ndarray(array.shape, array.dtype, buffer=shm.buf)[...] = array
+    return shm, (shm.name, array.shape, array.dtype.str)
+
+
+def _attach(spec):
+    from multiprocessing import shared_memory
+
+    name, shape, dtype = spec
+    shm = shared_memory.SharedMemory(name=name)
+    return shm, np.ndarray(shape, np.dtype(dtype), buffer=shm.buf)
+
+
+def glyphs_digest(glyphs: np.ndarray) -> str:
+    """Content hash of a glyph matrix, the same for the same glyph set in
+    every call and every process."""
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(repr((glyphs.shape, glyphs.dtype.str)).encode())
+    digest.update(np.ascontiguousarray(glyphs).data)
+    return digest.hexdigest()
+
+
+# glyph stats built inside each worker process, for the last glyph set seen
+_worker_glyph_stats = {}
+
+
+def _match_shared_rows(method, tiles_spec, glyphs_spec, glyphs_key, result_spec, start, end):
+    """Process pool task: match tile rows start:end into the shared result."""
+    tiles_shm, tiles = _attach(tiles_spec)
+    glyphs_shm, glyphs = _attach(glyphs_spec)
+    result_shm, result = _attach(result_spec)
+    try:
+        key = (method, glyphs_key)
+        if key not in _worker_glyph_stats:
+            _worker_glyph_stats.clear()
+            _worker_glyph_stats[key] = GLYPH_STATS[method](glyphs)
+        result[start:end] = MATCHERS[method](
+            tiles[start:end], glyphs, _worker_glyph_stats[key]
+        )
+    finally:
+        del tiles, glyphs, result
+        tiles_shm.close()
+        glyphs_shm.close()
+        result_shm.close()
+
+
+def _band_bounds(rows: int, cols: int, workers: int):
+    if workers <= 0:
+        workers = auto_workers(rows * cols)
+    workers = min(workers, rows)
+    bounds = np.linspace(0, rows, workers + 1).astype(int)
+    return workers, list(zip(bounds[:-1], bounds[1:]))
+
+
+def map_row_bands(func, tiles: np.ndarray, mode: str = "Threads", workers: int = 0):
+    """func(tiles[start:end]) over bands of tile rows on a thread pool, stitched back.
+
+    For matchers that live in this process, like a glyph index, so
+    Processes falls back to threads too. Each band runs in a copy of the
+    caller's context, so instrumentation counts reach the running node.
+    """
+    import contextvars
+
+    workers, bands = _band_bounds(tiles.shape[0], tiles.shape[1], workers)
+    if mode == "Off" or workers <= 1:
+        return func(tiles)
+    pool = _get_pool("Threads", workers)
+    futures = [
+        pool.submit(contextvars.copy_context().run, func, tiles[start:end])
+        for start, end in bands
+    ]
+    return np.concatenate([future.result() for future in futures])
+
+
+def match_parallel(
+    method: str,
+    tiles: np.ndarray,
+    glyphs: np.ndarray,
+    glyph_stats=None,
+    mode: str = "Threads",
+    workers: int = 0,
+) -> np.ndarray:
+    """MATCHERS[method] split over bands of tile rows run on a worker pool.
+
+    Threads share the arrays directly and rely on NumPy releasing the GIL
+    in its kernels. Processes are spawned, get the tile and glyph matrices
+    through shared memory and write their rows straight into a shared
+    result. They keep the glyph stats of the last glyph set, keyed by its
+    content hash, so repeated calls with one charset build them once. Bands are
+    stitched back by row index, so the output is identical to a serial run.
+    """
+    workers, bands = _band_bounds(tiles.shape[0], tiles.shape[1], workers)
+    if mode == "Off" or workers <= 1:
+        return MATCHERS[method](tiles, glyphs, glyph_stats)
+
+    if mode == "Threads":
+        if glyph_stats is None:
+            glyph_stats = GLYPH_STATS[method](glyphs)
+        return map_row_bands(
+            lambda band: MATCHERS[method](band, glyphs, glyph_stats),
+            tiles,
+            mode,
+            workers,
+        )
+
+    pool = _get_pool(mode, workers)
+    glyphs_key = glyphs_digest(glyphs)
+
+    shared = []
+    try:
+        tiles_shm, tiles_spec = _to_shared(np.ascontiguousarray(tiles))
+        shared.append(tiles_shm)
+        glyphs_shm, glyphs_spec = _to_shared(np.ascontiguousarray(glyphs))
+        shared.append(glyphs_shm)
+        result_shm, result_spec = _to_shared(np.zeros(tiles.shape[:2], dtype=np.intp))
+        shared.append(result_shm)
+
+        futures = [
+            pool.submit(
+                _match_shared_rows,
+                method,
+                tiles_spec,
+                glyphs_spec,
+                glyphs_key,
+                result_spec,
+                start,
+                end,
+            )
+            for start, end in bands
+        ]
+        for future in futures:
+            future.result()
+        return np.ndarray(tiles.shape[:2], np.intp, buffer=result_shm.buf).copy()
+    finally:
+        for shm in shared:
+            shm.close()
+            shm.unlink()
@@ -0,0 +1,75 @@
+# repo - https://github.com/mickr777/imagetoasciiimage
+# Variable size cells for the AnyFont node, split by local variance.
+
+import numpy as np
+
+from .block_stats import BlockStats
+
+
+def sum_pyramid(grid: np.ndarray, levels: int) -> list:
+    """grid and levels more grids each summing 2x2 blocks of the one before.
+
+    The (rows, cols[, C]) grid is zero padded to an even size where needed.
+    """
+    pyramid = [grid]
+    for _ in range(levels):
+        rows, cols = -(-grid.shape[0] // 2), -(-grid.shape[1] // 2)
+        padding = ((0, rows * 2 - grid.shape[0]), (0, cols * 2 - grid.shape[1]))
+        padding += ((0, 0),) * (grid.ndim - 2)
+        grid = np.pad(grid, padding).reshape(rows, 2, cols, 2, *grid.shape[2:]).sum(axis=(1, 3))
+        pyramid.append(grid)
+    return pyramid
+
+
+def cell_pyramid(stats: BlockStats, cell: int, levels: int):
+    """Pixel sums and sums of squares of every cell, at every level.
+
+    Level k cells are cell * 2^k pixels a side and start at the top left of
+    the image, so each one is made of four level k - 1 cells. Every level
+    is read from the same summed area tables of the image, cells running
+    past its edges count the missing pixels as zeros. Returns a list of
+    (sums, squares) grids from level 0 up.
+    """
+    pyramid = []
+    for level in range(levels + 1):
+        edges = stats.padded_edges(cell << level, cell << level)
+        pyramid.append((stats.grid_sums(*edges), stats.grid_sums(*edges, power=2)))
+    return pyramid
+
+
+def level_variances(pyramid, cell: int, height: int, width: int):
+    """Pixel variance of every cell of every level, inf for cells that run
+    past the edge of the image so they are always split."""
+    variances = []
+    for level, (sums, squares) in enumerate(pyramid):
+        size = cell << level
+        area = size * size
+        means = sums / area
+        variance = np.maximum(squares / area - means**2, 0.0)
+        variance[height // size :, :] = np.inf
+        variance[:, width // size :] = np.inf
+        variances.append(variance)
+    return variances
+
+
+def quadtree_leaves(variances, threshold: float):
+    """Boolean grid per level of the cells that are drawn as one char.
+
+    Starting from the largest cells, a cell whose variance is at most
+    threshold becomes a leaf, the others are split into their four cells
+    of the level below. Every cell of level 0 that is left is a leaf, so
+    the leaves tile the image exactly once.
+    """
+    leaves = [None] * len(variances)
+    open_cells = np.ones(variances[-1].shape, dtype=bool)
+    for level in range(len(variances) - 1, -1, -1):
+        rows, cols = variances[level].shape
+        if level < len(variances) - 1:
+            # the four cells below every cell that was split
+            open_cells = np.repeat(np.repeat(split, 2, axis=0), 2, axis=1)[:rows, :cols]
+        if level == 0:
+            leaves[level] = open_cells
+        else:
+            leaves[level] = open_cells & (variances[level] <= threshold)
+        split = open_cells & ~leaves[level]
+    return leaves
@@ -0,0 +1,204 @@
+# repo - https://github.com/mickr777/imagetoasciiimage
+# Content addressed cache of converted char grids, since the nodes run with use_cache=False.
+
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from dataclasses import fields
+
+import numpy as np
+
+from . import instrumentation
+from .font_cache import font_cache_dir, font_file_hash
+
+result_cache_dir = os.path.join(font_cache_dir, "result_cache")
+
+# Bump when a change to the converters changes the grids they produce
+CACHE_VERSION = 2
+
+# Options that don't change the result, or that the font hash already covers
+IGNORED_FIELDS = (
+    "band_rows",
+    "parallel_mode",
+    "workers",
+    "bypass_cache",
+    "output_mode",
+    "font_url",
+    "local_font_path",
+    "local_font",
+)
+
+
+def image_hash(image) -> str:
+    """SHA-1 of a PIL image's mode, size and pixels."""
+    digest = hashlib.sha1(f"{image.mode} {image.size}".encode("utf-8"))
+    digest.update(image.tobytes())
+    return digest.hexdigest()
+
+
+def compact_grid(arrays: dict) -> dict:
+    """Char index grid as uint8/uint16 and colors as uint8, the form that is cached.
+
+    Colors are truncated like the glyph atlas does with float ink, so
+    callers that round should round before handing colors over.
+    """
+    compact = {}
+    for name, array in arrays.items():
+        array = np.asarray(array)
+        if name == "chars":
+            dtype = np.uint8 if array.size == 0 or array.max() < 256 else np.uint16
+            compact[name] = array.astype(dtype)
+        else:
+            compact[name] = np.clip(array, 0, 255).astype(np.uint8)
+    return compact
+
+
+class ResultCache:
+    """Bounded LRU of char grids in memory, backed by .npz files on disk.
+
+    Keys hash the input image, every option of the converter that affects
+    its output and the font file contents, so a hit is exactly what a
+    fresh conversion would give. The disk cache drops its least recently
+    used files once it grows past max_disk_bytes.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int = 64 << 20,
+        cache_dir: str = result_cache_dir,
+        max_disk_bytes: int = 256 << 20,
+    ):
+        self.max_bytes = max_bytes
+        self.cache_dir = cache_dir
+        self.max_disk_bytes = max_disk_bytes
+        self.hits = 0
+        self.misses = 0
+        self.disk_hits = 0
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def key(self, kind: str, image, options, font_path: str = None) -> str:
+        values = [
+            (f.name, getattr(options, f.name))
+            for f in fields(options)
+            if f.name not in IGNORED_FIELDS
+        ]
+        font = font_file_hash(font_path) if font_path else None
+        parts = repr((CACHE_VERSION, kind, image_hash(image), font, values))
+        return hashlib.sha1(parts.encode("utf-8")).hexdigest()
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.npz")
+
+    def _remember(self, key: str, arrays: dict):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return
+            self._entries[key] = arrays
+            self._bytes += sum(a.nbytes for a in arrays.values())
+            while self._bytes > self.max_bytes and len(self._entries) > 1:
+                _, old = self._entries.popitem(last=False)
+                self._bytes -= sum(a.nbytes for a in old.values())
+
+    def get(self, key: str):
+        """The cached arrays for key, or None."""
+        with self._lock:
+            arrays = self._entries.get(key)
+            if arrays is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+        if arrays is not None:
+            instrumentation.count("result_cache_hits")
+            return arrays
+
+        path = self._disk_path(key)
+        if self.cache_dir and os.path.isfile(path):
+            try:
+                with np.load(path) as data:
+                    arrays = {name: data[name] for name in data.files}
+                os.utime(path)  # mark as recently used for eviction
+            except (OSError, ValueError):
+                arrays = None  # unreadable file, convert again below
+        if arrays is None:
+            with self._lock:
+                self.misses += 1
+            instrumentation.count("result_cache_misses")
+            return None
+
+        with self._lock:
+            self.hits += 1
+            self.disk_hits += 1
+        instrumentation.count("result_cache_hits")
+        self._remember(key, arrays)
+        return arrays
+
+    def put(self, key: str, arrays: dict):
+        self._remember(key, arrays)
+        if not self.cache_dir:
+            return
+        path = self._disk_path(key)
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "wb") as f:
+                np.savez_compressed(f, **arrays)
+            os.replace(tmp_path, path)
+            self._evict_disk()
+        except OSError as e:
+            print(f"Unable to write result cache {path}: {e}")
+
+    def _evict_disk(self):
+        files = []
+        with os.scandir(self.cache_dir) as entries:
+            for entry in entries:
+                if entry.name.endswith(".npz"):
+                    stat = entry.stat()
+                    files.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.max_disk_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue  # already removed by another process
+            total -= size
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(
+                entries=len(self._entries),
+                bytes=self._bytes,
+                max_bytes=self.max_bytes,
+                hits=self.hits,
+                misses=self.misses,
+                disk_hits=self.disk_hits,
+            )
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+
+RESULT_CACHE = ResultCache()
+
+
+def cached_result(kind: str, image, options, build, font_path: str = None) -> dict:
+    """build() compacted, or the cached result for the same image, options and font.
+
+    build returns a dict of grids with a "chars" index grid. The result is
+    compacted either way, so a hit and a fresh conversion render the same.
+    options.bypass_cache skips the lookup and leaves the cache untouched.
+    """
+    if getattr(options, "bypass_cache", False):
+        return compact_grid(build())
+    key = RESULT_CACHE.key(kind, image, options, font_path)
+    arrays = RESULT_CACHE.get(key)
+    if arrays is None:
+        arrays = compact_grid(build())
+        RESULT_CACHE.put(key, arrays)
+    return arrays
@@ -0,0 +1,131 @@
+# repo - https://github.com/mickr777/imagetoasciiimage
+# Half block and quadrant chars with a foreground and background color per cell.
+
+from typing import Literal
+
+import numpy as np
+from PIL import Image
+
+from .cell_grid import has_cells, sub_cell_bounds
+from .output_modes import image_palette, ink_colors, palette_indices
+
+SUB_CELL_MODES = Literal["Off", "Half Blocks", "Quadrants"]
+
+# (sub_rows, sub_cols) each cell is split into
+SUB_CELL_LAYOUTS = {
+    "Half Blocks": (2, 1),
+    "Quadrants": (2, 2),
+}
+
+# Char for each foreground mask, bit i set when sub cell i (row major) is
+# foreground. A mask and its complement are the same split with the colors
+# swapped, so only masks with the last sub cell in the background are used.
+SUB_CELL_CHARS = {
+    "Half Blocks": " ▀",
+    "Quadrants": " ▘▝▀▖▌▞▛",
+}
+
+RENDER_BAND_ROWS = 32
+
+
+def _mask_bits(n_masks: int, n_parts: int) -> np.ndarray:
+    """(n_masks, n_parts) 0/1 matrix, row m holds the bits of mask m."""
+    return (np.arange(n_masks)[:, None] >> np.arange(n_parts)[None, :]) & 1
+
+
+def fit_sub_cells(samples: np.ndarray, layout: str):
+    """Best char and two colors for every cell of a sample_sub_cells() grid.
+
+    Every way of splitting a cell's sub samples into a foreground and a
+    background group is scored at once: with each group drawn in its mean
+    color, the squared error is the total sum of squares minus
+    |group sum|^2 / group size for both groups, so the split with the
+    largest sum of those terms fits best. Returns the (rows, cols) char
+    index grid and the (rows, cols[, C]) foreground and background colors.
+    """
+    rows, cols, sub_rows, sub_cols = samples.shape[:4]
+    channels = samples.shape[4:]
+    shape = (rows, cols) + channels
+    if not has_cells(shape):
+        empty = np.zeros(shape, dtype=np.uint8)
+        return np.zeros((rows, cols), dtype=np.intp), empty, empty.copy()
+    n_parts = sub_rows * sub_cols
+    parts = samples.reshape(rows * cols, n_parts, -1)
+
+    bits = _mask_bits(len(SUB_CELL_CHARS[layout]), n_parts).astype(np.float64)
+    fg_count = bits.sum(axis=1)
+    bg_count = n_parts - fg_count
+    fg_sum = np.einsum("mk,nkc->nmc", bits, parts)
+    bg_sum = parts.sum(axis=1)[:, None, :] - fg_sum
+
+    # empty groups have a zero sum, dividing by 1 keeps their term at 0
+    fit = (fg_sum**2).sum(axis=2) / np.maximum(fg_count, 1) + (bg_sum**2).sum(
+        axis=2
+    ) / np.maximum(bg_count, 1)
+    char_indices = fit.argmax(axis=1)
+
+    cells = np.arange(len(parts))
+    fg = fg_sum[cells, char_indices] / np.maximum(fg_count[char_indices], 1)[:, None]
+    bg = bg_sum[cells, char_indices] / bg_count[char_indices][:, None]
+    # a single color cell is drawn as a space, give it that color both ways
+    fg = np.where(fg_count[char_indices][:, None] > 0, fg, bg)
+
+    return (
+        char_indices.reshape(rows, cols),
+        np.rint(fg).astype(np.uint8).reshape(shape),
+        np.rint(bg).astype(np.uint8).reshape(shape),
+    )
+
+
+def render_sub_cells(
+    char_indices: np.ndarray,
+    fg: np.ndarray,
+    bg: np.ndarray,
+    layout: str,
+    cell_h: int,
+    cell_w: int,
+    size: tuple,
+    mode: str = "RGB",
+    background=0,
+    palette=None,
+) -> Image.Image:
+    """Draw every cell as its fg/bg split, pixel exact at any cell size.
+
+    The block chars of most fonts don't fill a square cell, so the sub
+    cells are painted directly rather than composited from glyphs. "P"
+    images take the (k, C) palette the colors are drawn from, and are
+    painted as palette indices.
+    """
+    if mode == "P":
+        channels = palette.shape[1]
+        fg, bg = (palette_indices(ink_colors(c, channels), palette) for c in (fg, bg))
+        background = int(palette_indices(ink_colors(background, channels), palette)[0])
+        image = render_sub_cells(
+            char_indices, fg, bg, layout, cell_h, cell_w, size, "L", background
+        )
+        image.putpalette(image_palette(palette))
+        return image
+
+    sub_rows, sub_cols = SUB_CELL_LAYOUTS[layout]
+    y_repeat = np.diff(sub_cell_bounds(cell_h, sub_rows))
+    x_repeat = np.diff(sub_cell_bounds(cell_w, sub_cols))
+    bits = _mask_bits(len(SUB_CELL_CHARS[layout]), sub_rows * sub_cols).astype(bool)
+
+    image = Image.new(mode, size, background)
+    if not has_cells(char_indices.shape):
+        return image
+    rows, cols = char_indices.shape
+    for start in range(0, rows, RENDER_BAND_ROWS):
+        band = slice(start, start + RENDER_BAND_ROWS)
+        is_fg = bits[char_indices[band]].reshape(-1, cols, sub_rows, sub_cols)
+        band_fg = fg[band][:, :, None, None]
+        band_bg = bg[band][:, :, None, None]
+        if fg.ndim == 3:
+            is_fg = is_fg[..., None]
+        colors = np.where(is_fg, band_fg, band_bg).swapaxes(1, 2)
+        n_rows = colors.shape[0]
+        colors = colors.reshape(n_rows * sub_rows, cols * sub_cols, *fg.shape[2:])
+        pixels = np.repeat(colors, np.tile(y_repeat, n_rows), axis=0)
+        pixels = np.repeat(pixels, np.tile(x_repeat, cols), axis=1)
+        image.paste(Image.fromarray(pixels, mode), (0, start * cell_h))
+    return image
@@ -0,0 +1,74 @@
+# repo - https://github.com/mickr777/imagetoasciiimage
+# Frame to frame dirty tile tracking for animated input.
+
+import numpy as np
+from PIL import Image, ImageSequence
+
+
+def load_frames(path: str):
+    """Yield (RGB frame, duration ms) for every frame of a GIF/APNG/... file."""
+    with Image.open(path) as animation:
+        for frame in ImageSequence.Iterator(animation):
+            yield frame.convert("RGB"), frame.info.get("duration", 100)
+
+
+def save_animation(frames: list, durations: list, fp, format=None, loop: int = 0) -> None:
+    frames[0].save(
+        fp,
+        format=format,
+        save_all=True,
+        append_images=frames[1:],
+        duration=durations,
+        loop=loop,
+    )
+
+
+def row_ranges(rows: np.ndarray):
+    """(start, end) of every run of True in a 1D bool array."""
+    edges = np.diff(np.concatenate(([0], rows.astype(np.int8), [0])))
+    return list(zip(np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)))
+
+
+class DirtyTileTracker:
+    """Remembers each tile as it was last matched and the glyph it got.
+
+    A tile is dirty when any of its pixels differs from the remembered tile
+    by more than tolerance, or its cell color changed. Only dirty tiles are
+    passed to the matcher; everything else keeps the previous frame's glyph.
+    """
+
+    def __init__(self, tolerance: int = 0):
+        self.tolerance = tolerance
+        self.tiles = None
+        self.index = None
+        self.colors = None
+        self.matched = 0
+        self.total = 0
+
+    def update(self, tiles: np.ndarray, match, colors=None):
+        """Returns the (rows, cols) glyph index grid and the dirty cell mask.
+
+        match is called with a (n, 1, pixels) tensor of the dirty tiles.
+        """
+        if self.tiles is None or self.tiles.shape != tiles.shape:
+            dirty = np.ones(tiles.shape[:2], dtype=bool)
+            self.tiles = tiles.copy()
+            self.index = np.zeros(tiles.shape[:2], dtype=np.intp)
+        else:
+            difference = np.abs(tiles.astype(np.int16) - self.tiles)
+            dirty = difference.max(axis=2) > self.tolerance
+            self.tiles[dirty] = tiles[dirty]
+
+        if colors is not None:
+            colors = np.asarray(colors)
+            if self.colors is not None and self.colors.shape == colors.shape:
+                changed = self.colors != colors
+                dirty |= changed.any(axis=-1) if changed.ndim == 3 else changed
+            self.colors = colors.copy()
+
+        dirty_tiles = tiles[dirty]
+        if len(dirty_tiles):
+            self.index[dirty] = match(dirty_tiles[:, None, :])[:, 0]
+        self.matched += int(dirty.sum())
+        self.total += dirty.size
+        return self.index.copy(), dirty
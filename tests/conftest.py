@@ -0,0 +1,61 @@
+# repo - https://github.com/mickr777/imagetoasciiimage
+# Imports the repo as a package for the tests, whatever its folder is called,
+# and keeps the tests off the network and out of the package dir.
+
+import importlib.util
+import os
+import sys
+
+import numpy as np
+import pytest
+from PIL import Image, ImageFont
+
+PACKAGE_NAME = "imagetoasciiimage"
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+if PACKAGE_NAME not in sys.modules:
+    spec = importlib.util.spec_from_file_location(
+        PACKAGE_NAME,
+        os.path.join(REPO_DIR, "__init__.py"),
+        submodule_search_locations=[REPO_DIR],
+    )
+    package = importlib.util.module_from_spec(spec)
+    sys.modules[PACKAGE_NAME] = package
+    spec.loader.exec_module(package)
+
+
+@pytest.fixture(scope="session", autouse=True)
+def cache_dirs(tmp_path_factory):
+    """Keep the glyph and result caches the tests write out of the package dir."""
+    from imagetoasciiimage.font_cache import GLYPH_CACHE
+    from imagetoasciiimage.result_cache import RESULT_CACHE
+
+    caches = (GLYPH_CACHE, RESULT_CACHE)
+    saved = [cache.cache_dir for cache in caches]
+    for cache in caches:
+        cache.cache_dir = str(tmp_path_factory.mktemp("cache"))
+    yield
+    for cache, cache_dir in zip(caches, saved):
+        cache.cache_dir = cache_dir
+
+
+@pytest.fixture(scope="session")
+def font_path(tmp_path_factory):
+    """A copy of the font bundled with Pillow, so no test downloads one."""
+    path = tmp_path_factory.mktemp("fonts") / "pillow_default.ttf"
+    path.write_bytes(ImageFont.load_default(12).font_bytes)
+    return str(path)
+
+
+@pytest.fixture(scope="session")
+def sample_image():
+    """Smooth shading, hard edges, color and noise, the cases the matchers
+    and color stages differ on, as a 96x64 RGB image."""
+    rng = np.random.default_rng(0)
+    y, x = np.mgrid[:64, :96]
+    shade = 255 * (x + y) / (64 + 96)
+    image = np.stack([shade, 255 - shade, np.full_like(shade, 128)], axis=-1)
+    image[(x - 48) ** 2 + (y - 32) ** 2 < 400] = (255, 200, 40)
+    image[:, ::17] = 0
+    image += rng.normal(0, 20, image.shape)
+    return Image.fromarray(np.clip(image, 0, 255).astype(np.uint8))
@@ -0,0 +1,64 @@
+import numpy as np
+import pytest
+
+from imagetoasciiimage.block_stats import BlockStats, cell_edges, padded_edges
+from imagetoasciiimage.quadtree import cell_pyramid
+
+
+def reference_stats(array, y_edges, x_edges):
+    values = array.astype(np.float64)
+    cells = [
+        [values[top:bottom, left:right] for left, right in zip(x_edges[:-1], x_edges[1:])]
+        for top, bottom in zip(y_edges[:-1], y_edges[1:])
+    ]
+    means = np.array([[cell.mean(axis=(0, 1)) for cell in row] for row in cells])
+    variances = np.array([[cell.var(axis=(0, 1)) for cell in row] for row in cells])
+    return means, variances
+
+
+@pytest.mark.parametrize("channels", [(), (3,)])
+@pytest.mark.parametrize("cell", [(8, 8), (12, 6), (3.5, 2.5), (7.3, 4.1)])
+def test_cell_stats_match_numpy(channels, cell):
+    array = np.random.default_rng(0).integers(0, 256, (41, 57) + channels).astype(np.uint8)
+    y_edges, x_edges = cell_edges(41, cell[0]), cell_edges(57, cell[1])
+    means, variances = BlockStats(array).cell_stats(*cell)
+    expected_means, expected_variances = reference_stats(array, y_edges, x_edges)
+    np.testing.assert_allclose(means, expected_means)
+    np.testing.assert_allclose(variances, expected_variances, atol=1e-6)
+
+
+def test_rect_stats_of_any_rectangles():
+    array = np.random.default_rng(1).integers(0, 256, (30, 40, 3)).astype(np.uint8)
+    top, bottom = np.array([0, 5, 29]), np.array([30, 6, 30])
+    left, right = np.array([0, 10, 3]), np.array([40, 33, 4])
+    means, variances = BlockStats(array).rect_stats(top, left, bottom, right)
+    for i in range(3):
+        block = array[top[i] : bottom[i], left[i] : right[i]].astype(np.float64)
+        np.testing.assert_allclose(means[i], block.mean(axis=(0, 1)))
+        np.testing.assert_allclose(variances[i], block.var(axis=(0, 1)), atol=1e-6)
+
+
+def test_one_table_serves_every_cell_size():
+    array = np.random.default_rng(2).integers(0, 256, (64, 48)).astype(np.uint8)
+    stats = BlockStats(array)
+    stats.cell_means(8, 8)
+    table = stats.table()
+    for cell in (4, 6, 16):
+        sums = stats.grid_sums(padded_edges(64, cell), padded_edges(48, cell))
+        assert stats.table() is table
+        assert sums.sum() == int(array.astype(np.int64).sum())
+
+
+def test_cell_pyramid_levels_add_up():
+    array = np.random.default_rng(3).integers(0, 256, (50, 70)).astype(np.uint8)
+    pyramid = cell_pyramid(BlockStats(array), 5, 2)
+    for (sums, squares), (upper, upper_squares) in zip(pyramid, pyramid[1:]):
+        rows, cols = upper.shape
+        padded = np.zeros((rows * 2, cols * 2), dtype=np.int64)
+        padded[: sums.shape[0], : sums.shape[1]] = sums
+        assert np.array_equal(padded.reshape(rows, 2, cols, 2).sum(axis=(1, 3)), upper)
+
+
+def test_no_whole_cell():
+    stats = BlockStats(np.zeros((3, 3, 3), dtype=np.uint8))
+    assert stats.cell_means(8, 8).shape == (0, 0, 3)
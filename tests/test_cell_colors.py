@@ -0,0 +1,35 @@
+from functools import partial
+
+import numpy as np
+from PIL import Image
+
+from imagetoasciiimage.block_stats import BlockStats
+from imagetoasciiimage.cell_colors import ColorStage, dominant_colors
+from imagetoasciiimage.core import AsciiArtConverter, UnicodeArtConverter
+
+
+def test_dominant_colors_of_no_cells():
+    tiles = np.zeros((0, 4, 64, 3), dtype=np.uint8)
+    assert dominant_colors(tiles).shape == (0, 4, 3)
+
+
+def test_dominant_colors_picks_most_common_bin():
+    tiles = np.zeros((1, 1, 4, 3), dtype=np.uint8)
+    tiles[0, 0, :3] = (200, 10, 10)
+    assert np.array_equal(dominant_colors(tiles), [[[200, 10, 10]]])
+
+
+def test_sample_image_smaller_than_a_cell():
+    stage = ColorStage()
+    stage.cell_color = "Dominant"
+    colors = stage.sample(BlockStats(np.zeros((3, 3, 3), dtype=np.uint8)), 8, 8)
+    assert colors.shape == (0, 0, 3)
+
+
+def test_tiny_image_in_every_cell_color(font_path):
+    image = Image.new("RGB", (3, 3), (200, 10, 10))
+    converters = (AsciiArtConverter, partial(UnicodeArtConverter, local_font_path=font_path))
+    for converter in converters:
+        for cell_color in ("Mean", "Median", "Dominant"):
+            output = converter(color_mode=True, cell_color=cell_color).convert_image(image)
+            assert output.size == image.size
@@ -0,0 +1,24 @@
+from typing import get_args
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from imagetoasciiimage.cell_grid import SAMPLING_MODES, sample_cells
+from imagetoasciiimage.core import AsciiArtConverter
+
+
+@pytest.mark.parametrize("mode", get_args(SAMPLING_MODES))
+@pytest.mark.parametrize("shape", [(3, 3), (3, 3, 3), (4, 200), (200, 4, 3)])
+def test_sample_cells_of_an_image_smaller_than_a_cell(mode, shape):
+    samples = sample_cells(np.zeros(shape, dtype=np.uint8), 6, 6, mode)
+    rows, cols = shape[0] // 6, shape[1] // 6
+    assert samples.shape == (rows, cols) + shape[2:]
+
+
+@pytest.mark.parametrize("mode", get_args(SAMPLING_MODES))
+@pytest.mark.parametrize("size", [(3, 3), (200, 4)])
+def test_ascii_art_of_an_image_smaller_than_a_cell(mode, size):
+    converter = AsciiArtConverter(font_spacing=6, sampling_mode=mode)
+    image = Image.new("RGB", size, (120, 60, 30))
+    assert converter.convert_image(image).size == size
@@ -0,0 +1,104 @@
+from dataclasses import replace
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from imagetoasciiimage.core import AnyFontConverter, AsciiArtConverter, UnicodeArtConverter
+from imagetoasciiimage.matching import MATCHERS
+
+
+def assert_same_image(a: Image.Image, b: Image.Image):
+    assert (a.mode, a.size) == (b.mode, b.size)
+    np.testing.assert_array_equal(np.array(a), np.array(b))
+
+
+@pytest.fixture
+def converters(font_path):
+    """(converter, convert) pairs of every node's converter, uncached."""
+    anyfont = AnyFontConverter(
+        local_font_path=font_path,
+        font_size=8,
+        character_range="Printable",
+        color_mode=True,
+        bypass_cache=True,
+    )
+    return {
+        "ascii": AsciiArtConverter(color_mode=True, bypass_cache=True),
+        "ascii block median": AsciiArtConverter(
+            sampling_mode="Block Median", palette="Adaptive", bypass_cache=True
+        ),
+        "unicode": UnicodeArtConverter(local_font_path=font_path, bypass_cache=True),
+        "unicode sub cells": UnicodeArtConverter(
+            local_font_path=font_path, sub_cell_mode="Quadrants", bypass_cache=True
+        ),
+        "anyfont": anyfont,
+        "anyfont palette": replace(anyfont, palette="Adaptive", comparison_type="SSIM"),
+        "anyfont adaptive": replace(anyfont, adaptive_levels=1, split_variance=200.0),
+    }
+
+
+def convert(converter, image, font_path):
+    if isinstance(converter, AnyFontConverter):
+        return converter.convert_image(image, font_path)
+    return converter.convert_image(image)
+
+
+@pytest.mark.parametrize(
+    "name",
+    [
+        "ascii",
+        "ascii block median",
+        "unicode",
+        "unicode sub cells",
+        "anyfont",
+        "anyfont palette",
+        "anyfont adaptive",
+    ],
+)
+@pytest.mark.parametrize("band_rows", [1, 3])
+def test_bands_render_like_the_whole_image(converters, name, band_rows, sample_image, font_path):
+    converter = converters[name]
+    whole = convert(converter, sample_image, font_path)
+    banded = convert(replace(converter, band_rows=band_rows), sample_image, font_path)
+    assert_same_image(banded, whole)
+
+
+@pytest.mark.parametrize("method", list(MATCHERS))
+def test_threads_match_like_serial(converters, method, sample_image, font_path):
+    serial = replace(converters["anyfont"], comparison_type=method)
+    threads = replace(serial, parallel_mode="Threads", workers=3)
+    assert_same_image(
+        convert(threads, sample_image, font_path), convert(serial, sample_image, font_path)
+    )
+
+
+@pytest.mark.parametrize("method", ["SAD", "EDGE"])
+def test_processes_match_like_serial(converters, method, sample_image, font_path):
+    serial = replace(converters["anyfont"], comparison_type=method)
+    processes = replace(serial, parallel_mode="Processes", workers=2)
+    assert_same_image(
+        convert(processes, sample_image, font_path), convert(serial, sample_image, font_path)
+    )
+
+
+@pytest.mark.parametrize("glyph_search", ["Exact Index", "Approximate Index"])
+def test_index_search_in_threads_matches_serial(converters, glyph_search, sample_image, font_path):
+    serial = replace(converters["anyfont"], comparison_type="SAD", glyph_search=glyph_search)
+    threads = replace(serial, parallel_mode="Threads", workers=3)
+    assert_same_image(
+        convert(threads, sample_image, font_path), convert(serial, sample_image, font_path)
+    )
+
+
+@pytest.mark.parametrize("method", list(MATCHERS))
+def test_exact_tile_memo_matches_without_memo(converters, method, sample_image, font_path):
+    # the image twice side by side, so half its tiles repeat
+    pixels = np.array(sample_image)
+    image = Image.fromarray(np.concatenate([pixels, pixels], axis=1))
+    plain = replace(converters["anyfont"], comparison_type=method)
+    memo = replace(plain, tile_memo="Exact")
+    expected = convert(plain, image, font_path)
+    # once to fill the memo, once served from it
+    assert_same_image(convert(memo, image, font_path), expected)
+    assert_same_image(convert(memo, image, font_path), expected)
@@ -0,0 +1,53 @@
+import os
+from collections import Counter
+
+import numpy as np
+import pytest
+from PIL import Image, ImageDraw
+
+from imagetoasciiimage.core import CHAR_SETS
+from imagetoasciiimage.font_cache import GLYPH_CACHE
+from imagetoasciiimage.matching import image_to_tiles, match_edge
+
+# Lines pick their glyph in a monospace font, whose / \ | - fill the cell
+# the way a line does. Pillow's bundled font is proportional, so the tests
+# need a system copy of DejaVu Sans Mono.
+MONO_FONTS = (
+    "/usr/share/fonts/truetype/dejavu/DejaVuSansMono.ttf",
+    "/usr/share/fonts/dejavu/DejaVuSansMono.ttf",
+    "/usr/share/fonts/TTF/DejaVuSansMono.ttf",
+    "/Library/Fonts/DejaVuSansMono.ttf",
+)
+FONT_SIZE = 12
+SIZE = 12 * FONT_SIZE
+
+LINES = {
+    "/": lambda offset: [(offset, SIZE), (SIZE + offset, 0)],
+    "\\": lambda offset: [(offset, 0), (SIZE + offset, SIZE)],
+    "|": lambda offset: [(SIZE // 2 + offset, 0), (SIZE // 2 + offset, SIZE)],
+    "-": lambda offset: [(0, SIZE // 2 + offset), (SIZE, SIZE // 2 + offset)],
+}
+
+
+@pytest.fixture(scope="module")
+def mono_glyphs():
+    path = next((p for p in MONO_FONTS if os.path.isfile(p)), None)
+    if path is None:
+        pytest.skip("DejaVu Sans Mono is not installed")
+    return GLYPH_CACHE.matching_set(path, FONT_SIZE, CHAR_SETS["Printable"])
+
+
+@pytest.mark.parametrize("width", [1, 2, 3])
+@pytest.mark.parametrize("char", list(LINES))
+def test_edge_picks_the_glyph_running_along_a_line(mono_glyphs, char, width):
+    picks = Counter()
+    for offset in range(0, FONT_SIZE, 3):
+        image = Image.new("L", (SIZE, SIZE))
+        ImageDraw.Draw(image).line(LINES[char](offset), fill=255, width=width)
+        tiles = image_to_tiles(np.array(image), FONT_SIZE, FONT_SIZE)
+        tiles = tiles.reshape(-1, FONT_SIZE * FONT_SIZE)
+        # the cells the line crosses for at least half their side
+        tiles = tiles[tiles.sum(axis=1, dtype=np.int64) >= 255 * FONT_SIZE // 2]
+        picks.update(mono_glyphs.chars[i] for i in match_edge(tiles, mono_glyphs.matrix))
+    assert picks.most_common(1)[0][0] == char
+    assert picks[char] >= 0.9 * sum(picks.values())
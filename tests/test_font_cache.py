@@ -0,0 +1,96 @@
+import os
+import shutil
+
+import numpy as np
+
+from imagetoasciiimage import font_cache
+from imagetoasciiimage.font_cache import FontCache, rasterize_glyphs
+
+CHARS = "@#%*+=-:. "
+
+
+def npz_files(cache_dir) -> list:
+    return [name for name in os.listdir(cache_dir) if name.endswith(".npz")]
+
+
+def test_glyphs_round_trip_through_disk(font_path, tmp_path):
+    cache = FontCache(cache_dir=str(tmp_path))
+    glyphs = cache.glyph_set(font_path, 12, CHARS)
+    assert len(npz_files(tmp_path)) == 1
+    assert cache.glyph_set(font_path, 12, CHARS) is glyphs
+    assert (cache.hits, cache.disk_hits) == (1, 0)
+
+    # a restarted process reads the bitmaps back instead of rasterizing
+    restarted = FontCache(cache_dir=str(tmp_path))
+    loaded = restarted.glyph_set(font_path, 12, CHARS)
+    assert restarted.disk_hits == 1
+    assert loaded.chars == glyphs.chars
+    assert loaded.bitmaps.dtype == np.uint8
+    np.testing.assert_array_equal(loaded.bitmaps, glyphs.bitmaps)
+    font = restarted.font(font_path, 12)
+    np.testing.assert_array_equal(loaded.bitmaps, rasterize_glyphs(font, 12, CHARS))
+
+
+def test_each_size_and_charset_has_its_own_file(font_path, tmp_path):
+    cache = FontCache(cache_dir=str(tmp_path))
+    cache.glyph_set(font_path, 12, CHARS)
+    cache.glyph_set(font_path, 10, CHARS)
+    cache.glyph_set(font_path, 12, CHARS[::-1])
+    assert len(npz_files(tmp_path)) == 3
+    # duplicate chars keep their first place and share the file
+    cache.glyph_set(font_path, 12, CHARS + CHARS[0])
+    assert len(npz_files(tmp_path)) == 3
+
+
+def test_copied_font_shares_the_cached_glyphs(font_path, tmp_path):
+    copy = tmp_path / "fonts" / "copy.ttf"
+    copy.parent.mkdir()
+    shutil.copy(font_path, copy)
+    cache = FontCache(cache_dir=str(tmp_path / "glyphs"))
+    glyphs = cache.glyph_set(font_path, 12, CHARS)
+    assert cache.glyph_set(str(copy), 12, CHARS) is glyphs
+
+
+def test_unreadable_file_is_rebuilt(font_path, tmp_path):
+    cache = FontCache(cache_dir=str(tmp_path))
+    expected = cache.glyph_set(font_path, 12, CHARS).bitmaps
+    (name,) = npz_files(tmp_path)
+    (tmp_path / name).write_bytes(b"not an npz file")
+
+    restarted = FontCache(cache_dir=str(tmp_path))
+    glyphs = restarted.glyph_set(font_path, 12, CHARS)
+    assert restarted.disk_hits == 0
+    np.testing.assert_array_equal(glyphs.bitmaps, expected)
+    # and written back in good order
+    assert FontCache(cache_dir=str(tmp_path)).glyph_set(font_path, 12, CHARS) is not None
+    assert np.load(tmp_path / name)["bitmaps"].shape == expected.shape
+
+
+def test_raster_version_invalidates_files(font_path, tmp_path, monkeypatch):
+    FontCache(cache_dir=str(tmp_path)).glyph_set(font_path, 12, CHARS)
+    monkeypatch.setattr(font_cache, "RASTER_VERSION", font_cache.RASTER_VERSION + 1)
+    restarted = FontCache(cache_dir=str(tmp_path))
+    restarted.glyph_set(font_path, 12, CHARS)
+    assert restarted.disk_hits == 0
+    assert len(npz_files(tmp_path)) == 2
+
+
+def test_memory_stays_bounded(font_path, tmp_path):
+    cache = FontCache(max_entries=2, cache_dir=str(tmp_path))
+    for size in (8, 9, 10):
+        cache.glyph_set(font_path, size, CHARS)
+    assert cache.stats()["entries"] == 2
+    # the oldest was dropped from memory but is still on disk
+    cache.glyph_set(font_path, 8, CHARS)
+    assert cache.disk_hits == 1
+
+
+def test_no_cache_dir_keeps_glyphs_in_memory_only(font_path, tmp_path):
+    cache = FontCache(cache_dir="")
+    cwd = os.getcwd()
+    try:
+        os.chdir(tmp_path)
+        cache.glyph_set(font_path, 12, CHARS)
+    finally:
+        os.chdir(cwd)
+    assert os.listdir(tmp_path) == []
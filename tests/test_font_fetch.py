@@ -0,0 +1,119 @@
+import http.server
+import json
+import os
+import threading
+import time
+
+import pytest
+
+from imagetoasciiimage.font_fetch import INDEX_NAME, FontFetchError, fetch_font
+
+
+class FontServer(http.server.ThreadingHTTPServer):
+    """Serves queued (status, body, declared length) replies per path, and
+    the last one of a path again once its queue runs down."""
+
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), FontHandler)
+        self.replies = {}
+        self.requests = []
+        self.delay = 0.0
+        self.lock = threading.Lock()
+
+    def url(self, path: str) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}{path}"
+
+    def next_reply(self, path: str):
+        with self.lock:
+            self.requests.append(path)
+            queue = self.replies.get(path, [(404, b"", None)])
+            return queue.pop(0) if len(queue) > 1 else queue[0]
+
+
+class FontHandler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        status, body, length = self.server.next_reply(self.path)
+        time.sleep(self.server.delay)
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(body) if length is None else length))
+        self.end_headers()
+        self.wfile.write(body)
+        self.close_connection = True
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    server = FontServer()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def font_bytes(font_path):
+    with open(font_path, "rb") as f:
+        return f.read()
+
+
+def font_files(cache_dir) -> list:
+    return sorted(name for name in os.listdir(cache_dir) if not name.startswith((".", INDEX_NAME)))
+
+
+def read_index(cache_dir) -> dict:
+    with open(os.path.join(cache_dir, INDEX_NAME), encoding="utf-8") as f:
+        return json.load(f)
+
+
+def test_retries_after_a_server_error(server, font_bytes, tmp_path):
+    server.replies["/font.ttf"] = [(503, b"busy", None), (200, font_bytes, None)]
+    path = fetch_font(server.url("/font.ttf"), str(tmp_path), backoff=0)
+    assert server.requests == ["/font.ttf", "/font.ttf"]
+    with open(path, "rb") as f:
+        assert f.read() == font_bytes
+    assert font_files(tmp_path) == ["font.ttf"]
+
+
+def test_rejects_a_truncated_body(server, font_bytes, tmp_path):
+    body = font_bytes[: len(font_bytes) // 2]
+    server.replies["/font.ttf"] = [(200, body, len(font_bytes))]
+    with pytest.raises(FontFetchError):
+        fetch_font(server.url("/font.ttf"), str(tmp_path), retries=1, backoff=0)
+    assert len(server.requests) == 2
+    assert font_files(tmp_path) == []
+
+
+def test_rejects_a_payload_that_is_not_a_font(server, tmp_path):
+    server.replies["/font.ttf"] = [(200, b"<html>Not a font</html>", None)]
+    with pytest.raises(FontFetchError):
+        fetch_font(server.url("/font.ttf"), str(tmp_path), backoff=0)
+    assert font_files(tmp_path) == []
+
+
+def test_concurrent_fetches_download_once(server, font_bytes, tmp_path):
+    server.replies["/font.ttf"] = [(200, font_bytes, None)]
+    server.delay = 0.2  # keep the first download going while the second starts
+    url = server.url("/font.ttf")
+    paths = [None, None]
+
+    def fetch(i):
+        paths[i] = fetch_font(url, str(tmp_path), backoff=0)
+
+    threads = [threading.Thread(target=fetch, args=(i,)) for i in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert paths[0] == paths[1] == os.path.join(str(tmp_path), "font.ttf")
+    assert server.requests == ["/font.ttf"]
+    assert font_files(tmp_path) == ["font.ttf"]
+    index = read_index(tmp_path)
+    assert list(index["urls"]) == [url]
+    assert list(index["hashes"].values()) == ["font.ttf"]
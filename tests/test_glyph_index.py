@@ -0,0 +1,50 @@
+import numpy as np
+import pytest
+
+from imagetoasciiimage.glyph_index import GlyphIndex, SadBoundIndex
+from imagetoasciiimage.matching import match_mse, match_sad
+
+
+def glyph_like(rng, n_glyphs, pixels):
+    # mostly unlit, some fully lit and some antialiased pixels, like a charset
+    glyphs = np.zeros((n_glyphs, pixels), dtype=np.uint8)
+    lit = rng.random((n_glyphs, pixels))
+    glyphs[lit < 0.15] = 255
+    edge = (lit >= 0.15) & (lit < 0.3)
+    glyphs[edge] = rng.integers(1, 255, edge.sum())
+    return glyphs
+
+
+def tile_sets(rng, pixels):
+    noise = rng.integers(0, 256, (6, 50, pixels)).astype(np.uint8)
+    ramp = np.linspace(0, 255, 6 * 50 * pixels).reshape(6, 50, pixels).astype(np.uint8)
+    return {"noise": noise, "ramp": ramp, "flat": np.full((3, 7, pixels), 128, np.uint8)}
+
+
+@pytest.mark.parametrize("pixels", [36, 64, 144])
+def test_exact_sad_index_matches_brute_force(pixels):
+    rng = np.random.default_rng(pixels)
+    glyphs = glyph_like(rng, 120, pixels)
+    glyphs[7] = glyphs[3]  # a tie, brute force picks the lower index
+    index = SadBoundIndex(glyphs)
+    for tiles in tile_sets(rng, pixels).values():
+        np.testing.assert_array_equal(index.search(tiles), match_sad(tiles, glyphs))
+
+
+def test_exact_sad_index_with_blank_and_solid_glyphs():
+    rng = np.random.default_rng(5)
+    glyphs = glyph_like(rng, 30, 64)
+    glyphs[0], glyphs[1] = 0, 255
+    tiles = rng.integers(0, 256, (4, 9, 64)).astype(np.uint8)
+    np.testing.assert_array_equal(SadBoundIndex(glyphs).search(tiles), match_sad(tiles, glyphs))
+
+
+@pytest.mark.parametrize("metric, matcher", [("SAD", match_sad), ("MSE", match_mse)])
+def test_approximate_index_with_every_cluster_is_exact(metric, matcher):
+    rng = np.random.default_rng(2)
+    glyphs = glyph_like(rng, 49, 64)
+    tiles = rng.integers(0, 256, (5, 11, 64)).astype(np.uint8)
+    index = GlyphIndex(glyphs, metric)
+    probes = len(index.centroids)
+    assert not index.prunes(probes)
+    np.testing.assert_array_equal(index.search(tiles, probes), matcher(tiles, glyphs))
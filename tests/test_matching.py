@@ -0,0 +1,101 @@
+import numpy as np
+import pytest
+
+from imagetoasciiimage import matching
+from imagetoasciiimage.block_stats import BlockStats
+from imagetoasciiimage.core import CHAR_SETS
+from imagetoasciiimage.font_cache import GLYPH_CACHE
+from imagetoasciiimage.matching import (
+    GLYPH_STATS,
+    MATCHERS,
+    SSIM_K1,
+    SSIM_K2,
+    SSIM_L,
+    image_to_tiles,
+    match_nal_sums,
+    normalized_luminosities,
+)
+
+FONT_SIZE = 8
+
+
+@pytest.fixture(scope="module")
+def image(sample_image):
+    return np.array(sample_image.convert("L"))
+
+
+@pytest.fixture(scope="module")
+def glyphs(font_path):
+    return GLYPH_CACHE.matching_set(font_path, FONT_SIZE, CHAR_SETS["Printable"]).matrix
+
+
+def sad_score(tile, glyph):
+    return np.abs(tile - glyph).sum()
+
+
+def mse_score(tile, glyph):
+    return ((tile - glyph) ** 2).sum()
+
+
+def ssim_score(tile, glyph):
+    c1, c2 = (SSIM_K1 * SSIM_L) ** 2, (SSIM_K2 * SSIM_L) ** 2
+    covariance = np.cov(tile, glyph)[0, 1]
+    return -((2 * tile.mean() * glyph.mean() + c1) * (2 * covariance + c2)) / (
+        (tile.mean() ** 2 + glyph.mean() ** 2 + c1) * (tile.var() + glyph.var() + c2)
+    )
+
+
+def nal_score(tile, glyph, luminosity):
+    return abs(tile.mean() - luminosity)
+
+
+def edge_score(tile, glyph, glyph_features):
+    side = int(np.sqrt(tile.size))
+    tile_features = matching.tile_feature_vectors(tile[None], side)[0].astype(np.float64)
+    return ((tile_features - glyph_features) ** 2).sum()
+
+
+def reference_scores(method, tiles, glyphs):
+    """(n_tiles, n_glyphs) scores of one tile against one glyph at a time,
+    lower is better."""
+    tiles = tiles.reshape(-1, tiles.shape[-1]).astype(np.float64)
+    extra = [()] * len(glyphs)
+    score = dict(SAD=sad_score, MSE=mse_score, SSIM=ssim_score).get(method)
+    if method == "NAL":
+        score, extra = nal_score, [(v,) for v in normalized_luminosities(glyphs)]
+    elif method == "EDGE":
+        _, layout, orientation, _ = matching.structure_features(glyphs, FONT_SIZE)
+        features = matching.feature_vectors(normalized_luminosities(glyphs), layout, orientation)
+        score, extra = edge_score, [(f.astype(np.float64),) for f in features]
+    glyphs = glyphs.astype(np.float64)
+    return np.array(
+        [[score(tile, glyph, *e) for glyph, e in zip(glyphs, extra)] for tile in tiles]
+    )
+
+
+@pytest.mark.parametrize("method", list(MATCHERS))
+def test_batched_matcher_agrees_with_per_tile_scores(method, image, glyphs, monkeypatch):
+    # small chunks, so the tiles are matched over several of them
+    monkeypatch.setattr(matching, "CHUNK_ELEMENTS", 1 << 14)
+    tiles = image_to_tiles(image, FONT_SIZE, FONT_SIZE)
+    best = MATCHERS[method](tiles, glyphs, GLYPH_STATS[method](glyphs))
+    assert best.shape == tiles.shape[:2]
+
+    scores = reference_scores(method, tiles, glyphs)
+    picked = scores[np.arange(len(scores)), best.ravel()]
+    if method in ("SAD", "MSE"):
+        # integer scores, ties go to the first glyph
+        np.testing.assert_array_equal(best.ravel(), scores.argmin(axis=1))
+    else:
+        # float scores summed in another order can swap near ties
+        np.testing.assert_allclose(picked, scores.min(axis=1), rtol=1e-4, atol=1e-6)
+
+
+def test_nal_sums_agree_with_tiles(image, glyphs):
+    stats = BlockStats(image)
+    sums = stats.grid_sums(*stats.padded_edges(FONT_SIZE, FONT_SIZE))
+    tiles = image_to_tiles(image, FONT_SIZE, FONT_SIZE)
+    table = GLYPH_STATS["NAL"](glyphs)
+    np.testing.assert_array_equal(
+        match_nal_sums(sums, table), MATCHERS["NAL"](tiles, glyphs, table)
+    )
@@ -0,0 +1,124 @@
+import os
+import shutil
+from dataclasses import replace
+from pathlib import Path
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from imagetoasciiimage import result_cache
+from imagetoasciiimage.core import AnyFontConverter, AsciiArtConverter
+from imagetoasciiimage.result_cache import RESULT_CACHE, ResultCache
+
+
+def grid(value=1):
+    return dict(
+        chars=np.full((3, 4), value, dtype=np.uint8),
+        colors=np.full((3, 4, 3), value, dtype=np.uint8),
+    )
+
+
+def assert_same_grid(a: dict, b: dict):
+    assert sorted(a) == sorted(b)
+    for name in a:
+        np.testing.assert_array_equal(a[name], b[name])
+
+
+def test_hits_from_memory_and_from_disk(tmp_path):
+    cache = ResultCache(cache_dir=str(tmp_path))
+    assert cache.get("key") is None
+    cache.put("key", grid())
+    assert_same_grid(cache.get("key"), grid())
+    assert (cache.hits, cache.misses, cache.disk_hits) == (1, 1, 0)
+
+    # a new process finds the grid on disk
+    restarted = ResultCache(cache_dir=str(tmp_path))
+    assert_same_grid(restarted.get("key"), grid())
+    assert restarted.disk_hits == 1
+    assert_same_grid(restarted.get("key"), grid())
+    assert restarted.stats()["hits"] == 2
+    assert restarted.stats()["disk_hits"] == 1
+
+
+def test_unreadable_file_is_a_miss(tmp_path):
+    cache = ResultCache(cache_dir=str(tmp_path))
+    cache.put("key", grid())
+    with open(cache._disk_path("key"), "wb") as f:
+        f.write(b"not an npz file")
+    assert ResultCache(cache_dir=str(tmp_path)).get("key") is None
+
+
+def test_memory_and_disk_stay_bounded(tmp_path):
+    size = sum(a.nbytes for a in grid().values())
+    cache = ResultCache(max_bytes=2 * size, cache_dir=str(tmp_path))
+    cache.put("0", grid(0))
+    # room for two files on disk, the least recently used goes first
+    cache.max_disk_bytes = 2.5 * os.path.getsize(cache._disk_path("0"))
+    for value in range(1, 3):
+        cache.put(str(value), grid(value))
+    assert cache.stats()["entries"] == 2
+    assert cache.stats()["bytes"] <= 2 * size
+    assert sorted(name for name in os.listdir(tmp_path) if name.endswith(".npz")) == [
+        "1.npz",
+        "2.npz",
+    ]
+
+
+def test_key_changes_with_the_image_options_and_font(sample_image, font_path, tmp_path):
+    cache = ResultCache(cache_dir=str(tmp_path))
+    options = AnyFontConverter(local_font_path=font_path)
+    key = cache.key("anyfont", sample_image, options, font_path)
+    assert cache.key("anyfont", sample_image, replace(options), font_path) == key
+
+    # options that leave the result alone share the key
+    for change in (dict(band_rows=2), dict(workers=4), dict(bypass_cache=True)):
+        assert cache.key("anyfont", sample_image, replace(options, **change), font_path) == key
+
+    other_image = sample_image.transpose(Image.Transpose.FLIP_LEFT_RIGHT)
+    other_font = tmp_path / "other.ttf"
+    other_font.write_bytes(Path(font_path).read_bytes() + b"\0")
+    same_font = tmp_path / "copy.ttf"
+    shutil.copy(font_path, same_font)
+    assert cache.key("anyfont", other_image, options, font_path) != key
+    assert cache.key("anyfont", sample_image, replace(options, font_size=7), font_path) != key
+    assert cache.key("ascii", sample_image, options, font_path) != key
+    assert cache.key("anyfont", sample_image, options, str(other_font)) != key
+    # fonts are keyed by their contents, not their path
+    assert cache.key("anyfont", sample_image, options, str(same_font)) == key
+
+
+def test_cache_version_invalidates_keys(sample_image, monkeypatch):
+    options = AsciiArtConverter()
+    key = RESULT_CACHE.key("ascii", sample_image, options)
+    monkeypatch.setattr(result_cache, "CACHE_VERSION", result_cache.CACHE_VERSION + 1)
+    assert RESULT_CACHE.key("ascii", sample_image, options) != key
+
+
+@pytest.mark.parametrize(
+    "converter",
+    [
+        AsciiArtConverter(color_mode=True),
+        AnyFontConverter(font_size=8, comparison_type="SSIM", color_mode=True),
+    ],
+    ids=["ascii", "anyfont"],
+)
+def test_hit_renders_like_a_fresh_conversion(
+    converter, sample_image, font_path, tmp_path, monkeypatch
+):
+    def convert(converter):
+        if isinstance(converter, AnyFontConverter):
+            converter = replace(converter, local_font_path=font_path)
+            return converter.convert_image(sample_image, font_path)
+        return converter.convert_image(sample_image)
+
+    monkeypatch.setattr(RESULT_CACHE, "cache_dir", str(tmp_path))
+    RESULT_CACHE.clear()
+    fresh = convert(replace(converter, bypass_cache=True))
+    hits = RESULT_CACHE.hits
+    first = convert(converter)
+    assert RESULT_CACHE.hits == hits
+    second = convert(converter)
+    assert RESULT_CACHE.hits == hits + 1
+    for image in (first, second):
+        np.testing.assert_array_equal(np.array(image), np.array(fresh))
@@ -0,0 +1,26 @@
+from typing import get_args
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from imagetoasciiimage.core import UnicodeArtConverter
+from imagetoasciiimage.sub_cells import SUB_CELL_MODES, fit_sub_cells
+
+
+def test_fit_sub_cells_of_no_cells():
+    samples = np.zeros((0, 3, 2, 2, 3))
+    char_indices, fg, bg = fit_sub_cells(samples, "Quadrants")
+    assert char_indices.shape == (0, 3)
+    assert fg.shape == bg.shape == (0, 3, 3)
+
+
+@pytest.mark.parametrize("size", [(3, 3), (3, 40), (40, 3)])
+@pytest.mark.parametrize("mode", get_args(SUB_CELL_MODES)[1:])
+def test_image_smaller_than_a_cell(size, mode, font_path):
+    image = Image.new("RGB", size, (200, 10, 10))
+    for color_mode in (False, True):
+        converter = UnicodeArtConverter(
+            sub_cell_mode=mode, color_mode=color_mode, local_font_path=font_path
+        )
+        assert converter.convert_image(image).size == size
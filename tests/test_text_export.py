@@ -0,0 +1,19 @@
+import numpy as np
+import pytest
+
+from imagetoasciiimage.text_export import FORMAT_WRITERS
+
+
+@pytest.mark.parametrize("text_format", list(FORMAT_WRITERS))
+def test_zero_width_rows(text_format):
+    char_indices = np.zeros((2, 0), dtype=np.intp)
+    colors = np.zeros((2, 0, 3), dtype=np.uint8)
+    rows = list(FORMAT_WRITERS[text_format](char_indices, "@ ", colors))
+    assert "".join(rows).count("\n") >= 2
+
+
+def test_ansi_rows_emit_color_changes_only():
+    char_indices = np.zeros((1, 3), dtype=np.intp)
+    colors = np.array([[[255, 0, 0], [255, 0, 0], [0, 0, 255]]], dtype=np.uint8)
+    (row,) = FORMAT_WRITERS["ANSI"](char_indices, "@", colors)
+    assert row == "\033[38;2;255;0;0m@@\033[38;2;0;0;255m@\033[0m\n"
@@ -0,0 +1,111 @@
+# repo - https://github.com/mickr777/imagetoasciiimage
+# Text export of a char index grid as plain text, ANSI truecolor or HTML.
+
+import html
+import os
+from typing import Literal
+
+import numpy as np
+
+TEXT_FORMATS = Literal["Plain", "ANSI", "HTML"]
+
+FORMAT_EXTENSIONS = {"Plain": ".txt", "ANSI": ".ans", "HTML": ".html"}
+
+
+def _rgb_grid(colors):
+    if colors is None:
+        return None
+    colors = np.rint(np.asarray(colors)).astype(np.int32)
+    if colors.ndim == 2:
+        colors = colors[:, :, None]
+    return np.broadcast_to(colors[:, :, :3], colors.shape[:2] + (3,))
+
+
+def _char_rows(char_indices: np.ndarray, chars):
+    lookup = np.array(list(chars))
+    for row in lookup[char_indices]:
+        yield row
+
+
+def _color_runs(row_chars, row_colors):
+    """Split a row into (color, text) runs of consecutive equal colors."""
+    if len(row_chars) == 0:
+        return
+    change = np.any(row_colors[1:] != row_colors[:-1], axis=-1)
+    starts = np.concatenate(([0], np.flatnonzero(change) + 1, [len(row_chars)]))
+    for start, end in zip(starts[:-1], starts[1:]):
+        yield tuple(int(v) for v in row_colors[start]), "".join(row_chars[start:end])
+
+
+def plain_rows(char_indices: np.ndarray, chars, colors=None, background=None):
+    for row in _char_rows(char_indices, chars):
+        yield "".join(row) + "\n"
+
+
+def ansi_rows(char_indices: np.ndarray, chars, colors=None, background=None):
+    """Rows with 24 bit foreground escapes, emitted only when the color changes."""
+    colors = _rgb_grid(colors)
+    if colors is None:
+        yield from plain_rows(char_indices, chars)
+        return
+    for row_chars, row_colors in zip(_char_rows(char_indices, chars), colors):
+        parts = [
+            f"\033[38;2;{r};{g};{b}m{text}"
+            for (r, g, b), text in _color_runs(row_chars, row_colors)
+        ]
+        yield "".join(parts) + "\033[0m\n"
+
+
+def html_rows(char_indices: np.ndarray, chars, colors=None, background=(0, 0, 0)):
+    """A standalone HTML page with one span per run of same colored chars."""
+    colors = _rgb_grid(colors)
+    bg = "#%02x%02x%02x" % tuple(background)
+    fg = "#000000" if sum(background) > 382 else "#ffffff"
+    yield (
+        '<!DOCTYPE html>\n<html><head><meta charset="utf-8"></head>\n'
+        f'<body style="background:{bg}">'
+        f'<pre style="font-family:monospace;line-height:1;color:{fg}">\n'
+    )
+    for index, row_chars in enumerate(_char_rows(char_indices, chars)):
+        if colors is None:
+            yield html.escape("".join(row_chars)) + "\n"
+            continue
+        parts = [
+            f'<span style="color:#{r:02x}{g:02x}{b:02x}">{html.escape(text)}</span>'
+            for (r, g, b), text in _color_runs(row_chars, colors[index])
+        ]
+        yield "".join(parts) + "\n"
+    yield "</pre></body></html>\n"
+
+
+FORMAT_WRITERS = {"Plain": plain_rows, "ANSI": ansi_rows, "HTML": html_rows}
+
+
+def claim_output_file(
+    directory: str,
+    base_name: str = "output",
+    extension: str = ".txt",
+    binary: bool = False,
+):
+    """Create and open the next free output, output_1, output_2 ... file.
+
+    Files are opened in exclusive create mode so parallel writers can never
+    pick the same name or overwrite each other's output.
+    """
+    os.makedirs(directory, exist_ok=True)
+    counter = 0
+    while True:
+        name = base_name if counter == 0 else f"{base_name}_{counter}"
+        path = os.path.join(directory, name + extension)
+        try:
+            if binary:
+                return path, open(path, "xb")
+            return path, open(path, "x", encoding="utf-8")
+        except FileExistsError:
+            counter += 1
+
+
+def write_text(f, rows) -> None:
+    """Stream rows to an open file, one row at a time."""
+    for row in rows:
+        f.write(row)
@@ -0,0 +1,111 @@
+# repo - https://github.com/mickr777/imagetoasciiimage
+# Memo of tile signature -> best glyph, so repeated tiles are only matched once.
+
+import threading
+from collections import OrderedDict
+from typing import Literal
+
+import numpy as np
+
+from . import instrumentation
+
+MEMO_MODES = Literal["Off", "Exact", "Tolerant"]
+
+# Tolerant signatures average each tile down to at most this many cells a side
+SIGNATURE_GRID = 4
+
+MEMO_ENTRIES = 1 << 16
+
+
+def tile_signatures(flat: np.ndarray, cell_shape, bits: int = 8) -> np.ndarray:
+    """(n, k) uint8 fingerprints of (n, pixels) tiles.
+
+    With bits=8 the fingerprint is the tile itself. Fewer bits average the
+    tile down to a SIGNATURE_GRID square and keep only the top bits of
+    each average, so tiles that differ by a little noise share one.
+    """
+    if bits >= 8:
+        return np.ascontiguousarray(flat, dtype=np.uint8)
+    cell_h, cell_w = cell_shape
+    tiles = flat.reshape(-1, cell_h, cell_w).astype(np.uint32)
+    rows = np.linspace(0, cell_h, min(SIGNATURE_GRID, cell_h) + 1).astype(int)
+    cols = np.linspace(0, cell_w, min(SIGNATURE_GRID, cell_w) + 1).astype(int)
+    sums = np.add.reduceat(np.add.reduceat(tiles, rows[:-1], axis=1), cols[:-1], axis=2)
+    areas = np.diff(rows)[:, None] * np.diff(cols)[None, :]
+    means = (sums // areas).astype(np.uint8)
+    return np.ascontiguousarray((means >> (8 - bits)).reshape(len(flat), -1))
+
+
+class TileMemo:
+    """Bounded LRU of tile signature -> glyph index for one glyph set.
+
+    It is kept with the cached glyph set, so it carries over between
+    invocations that use the same font, size and charset. Exact memos
+    (bits=8) give the same glyphs as matching every tile. Tolerant memos
+    return the glyph of the first tile seen with the same signature.
+    """
+
+    def __init__(self, cell_shape, bits: int = 8, max_entries: int = MEMO_ENTRIES):
+        self.cell_shape = tuple(cell_shape)
+        self.bits = bits
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def match(self, tiles: np.ndarray, match) -> np.ndarray:
+        """Glyph index grid for tiles, calling match only for unseen signatures.
+
+        match is called with a (n, 1, pixels) tensor of one tile per new
+        signature, the same as DirtyTileTracker does.
+        """
+        flat = tiles.reshape(-1, tiles.shape[-1])
+        signatures = tile_signatures(flat, self.cell_shape, self.bits)
+        keys = signatures.view(np.dtype((np.void, signatures.shape[1]))).ravel()
+        unique, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+        unique = unique.tolist()
+
+        found = np.empty(len(unique), dtype=np.intp)
+        missing = []
+        with self._lock:
+            for i, key in enumerate(unique):
+                index = self._entries.get(key)
+                if index is None:
+                    missing.append(i)
+                else:
+                    self._entries.move_to_end(key)
+                    found[i] = index
+
+        if missing:
+            missing = np.array(missing)
+            found[missing] = match(flat[first[missing]][:, None, :])[:, 0]
+            with self._lock:
+                for i in missing.tolist():
+                    self._entries[unique[i]] = int(found[i])
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+
+        # every tile whose signature was known, or repeated one matched now
+        hits = len(flat) - len(missing)
+        with self._lock:
+            self.hits += hits
+            self.misses += len(missing)
+        instrumentation.count("memo_hits", hits)
+        instrumentation.count("memo_misses", len(missing))
+        return found[inverse.reshape(-1)].reshape(tiles.shape[:-1])
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return dict(
+                entries=len(self._entries),
+                max_entries=self.max_entries,
+                hits=self.hits,
+                misses=self.misses,
+                hit_rate=self.hits / total if total else 0.0,
+            )
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()